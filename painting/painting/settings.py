@@ -42,10 +42,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'paintingapp.middleware.CompressionMiddleware',
+    'paintingapp.middleware.PerformanceMiddleware',
+    'paintingapp.middleware.SharedCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'paintingapp.middleware.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -120,11 +124,87 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+# collectstatic writes .br and .gz siblings that /static/ serves by Accept-Encoding
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'paintingapp.storage.CompressedStaticFilesStorage'},
+}
+
+# Response compression: bodies smaller than this are sent as-is, and pages carrying a
+# CSRF token get gzip with up to COMPRESSION_BREACH_PADDING random header bytes
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_BREACH_PADDING = 100
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Memory-mapped image similarity index, rebuilt with `manage.py build_similarity_index`
+SIMILARITY_INDEX_PATH = BASE_DIR / 'indexes' / 'similarity.bin'
+
+# Submissions whose dHash differs from an earlier one by this many bits or fewer are saved
+# unapproved (hidden from the gallery) for a moderator to review
+SUBMISSION_DUPLICATE_DISTANCE = 6
+
+# Requests slower than this are logged to 'paintingapp.perf', for a sampled fraction of them
+PERF_SLOW_REQUEST_MS = 500
+PERF_SLOW_REQUEST_SAMPLE_RATE = 0.25
+
+# Seconds a cart holds stock before `manage.py release_reservations` hands it back
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Token buckets per URL name, keyed by user (or client IP when anonymous). Views decorated
+# with @throttle read the same table. Use a shared cache such as Redis or memcached in
+# production so every worker sees the same buckets.
+THROTTLE_RATES = {
+    'chatbot': {'burst': 20, 'per_minute': 30},
+    'submit_drawing': {'burst': 5, 'per_minute': 10 / 60},
+    'customize_preview': {'burst': 10, 'per_minute': 20},
+}
+THROTTLE_CACHE = 'default'
+# Reverse proxies in front of the app whose X-Forwarded-For entries can be trusted
+THROTTLE_PROXY_COUNT = 0
+
+# Addresses allowed to scrape /metrics. Export PROMETHEUS_MULTIPROC_DIR (an empty,
+# writable directory) before starting gunicorn so the counters add up across workers.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Seconds between each worker's catch-up of catalog edits made by other workers into its
+# chatbot search index (its own edits are applied as they commit)
+CHATBOT_INDEX_REFRESH_SECONDS = 60
+
+# Seconds the search page keeps the facet counts of a query. Catalog saves retire them at once
+# in the worker that made them (in all workers only if CACHES is shared, e.g. Redis; the default
+# LocMemCache is per process); stock changes (queryset updates) show up within this time.
+FACET_CACHE_TIMEOUT = 5 * 60
+
+# Delivered and cancelled orders untouched for this many days are moved to the archive
+# tables by `manage.py archive_orders` (run it nightly)
+ORDER_ARCHIVE_AFTER_DAYS = 180
+
+# How far (in RGB units, 0-442) one of a painting's dominant colours may be from the ?colour=
+# asked for in search and the API and still match; ?colour_distance= overrides it
+COLOUR_MATCH_DISTANCE = 64
+
+# `manage.py prerender_pages` writes the home, category and product pages here as
+# <path>/index.html (with .br/.gz siblings) and catalog edits keep them current. They hold
+# nothing per-visitor, so the front proxy serves them for any GET without a query string (?page=,
+# ?sort= and friends are rendered by Django), e.g. nginx:
+#     location / {
+#         error_page 418 = @django;
+#         if ($args) { return 418; }
+#         if ($request_method != GET) { return 418; }
+#         try_files /prerendered$uri/index.html @django;
+#     }
+PRERENDER_ROOT = BASE_DIR / 'prerendered'
+
+# Pages by URL name that hold nothing per-visitor (base.html fetches login state, cart size,
+# flash messages and the CSRF token from /session/) and are sent as Cache-Control: public
+# for this many seconds, so a CDN or shared proxy cache can serve them
+SHARED_CACHE_VIEWS = ['home', 'category_list', 'category_detail', 'product_detail']
+SHARED_CACHE_SECONDS = 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -15,11 +15,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static  
+from paintingapp.compression import serve_precompressed
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('paintingapp.urls')),
+    re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), serve_precompressed),
 ]+static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'painting.settings')
 
 application = get_wsgi_application()
+
+# Load the search box suggestions now rather than on the first keystroke
+from paintingapp.suggest import suggest_index  # noqa: E402
+
+suggest_index.warm()
@@ -1,5 +1,8 @@
-from django.contrib import admin
-from .models import Category, Product, Artist, Order, OrderItem
+from django.contrib import admin, messages
+from .fulfilment import STATUS_LABELS, sources, transition
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, Category, Product, Artist, Order, OrderItem, OrderNotification, StockReservation,
+)
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -8,11 +11,16 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'artist', 'price', 'stock', 'created_at')
+    list_display = ('name', 'category', 'artist', 'price', 'stock', 'reserved', 'created_at')
     list_filter = ('category', 'artist', 'stock')
     search_fields = ('name', 'description', 'artist__name')
     raw_id_fields = ('artist',)
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'quantity', 'expires_at')
+    raw_id_fields = ('product', 'user')
+
 @admin.register(Artist)
 class ArtistAdmin(admin.ModelAdmin):
     list_display = ('name', 'profession', 'user')
@@ -23,6 +31,19 @@ class OrderItemInline(admin.TabularInline):
     model = OrderItem
     raw_id_fields = ('product',)
 
+def transition_action(target):
+    """An admin action moving the selected orders to target with one UPDATE"""
+    def action(modeladmin, request, queryset):
+        selected = queryset.count()
+        changed = len(transition(queryset, target))
+        modeladmin.message_user(request, f'{changed} of {selected} orders marked {STATUS_LABELS[target].lower()}; customers will be emailed.')
+        if changed < selected:
+            allowed = ', '.join(STATUS_LABELS[status].lower() for status in sources(target))
+            modeladmin.message_user(request, f'{selected - changed} orders were skipped: only {allowed} orders can be marked {STATUS_LABELS[target].lower()}.', messages.WARNING)
+    action.__name__ = f'mark_{target}'
+    action.short_description = f'Mark selected orders as {STATUS_LABELS[target].lower()}'
+    return action
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'total_amount', 'status', 'created_at')
@@ -30,3 +51,36 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email')
     inlines = [OrderItemInline]
     raw_id_fields = ('user',)
+    # Status only changes through the actions, which restock, update artist totals and email the customer
+    readonly_fields = ('status',)
+    actions = [transition_action(status) for status in ('processing', 'shipped', 'delivered', 'cancelled')]
+
+@admin.register(OrderNotification)
+class OrderNotificationAdmin(admin.ModelAdmin):
+    list_display = ('order', 'status', 'created_at', 'sent_at')
+    list_filter = ('status', 'sent_at')
+    raw_id_fields = ('order',)
+
+class ReadOnlyAdminMixin:
+    """Nothing can be added, changed or deleted; archived rows only leave through the archive_orders command"""
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class ArchivedOrderItemInline(ReadOnlyAdminMixin, admin.TabularInline):
+    model = ArchivedOrderItem
+    raw_id_fields = ('product',)
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    """Read-only view of orders moved out of the hot table"""
+    list_display = ('id', 'user', 'total_amount', 'status', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('user__username', 'user__email')
+    inlines = [ArchivedOrderItemInline]
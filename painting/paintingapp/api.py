@@ -0,0 +1,147 @@
+import base64
+import datetime
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+
+from . import palette
+from .models import Artist, Category, Product
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class Resource:
+    """A read-only list endpoint described by its public field names and the lookups they read"""
+    def __init__(self, queryset, fields, filters=None, media_fields=(), colour_filter=False):
+        self.queryset = queryset
+        self.fields = fields
+        self.filters = filters or {}
+        self.media_fields = media_fields
+        self.colour_filter = colour_filter  # accepts ?colour=, see paintingapp.palette
+
+
+PRODUCTS = Resource(
+    Product.objects.all(),
+    fields={
+        'id': 'id',
+        'name': 'name',
+        'description': 'description',
+        'price': 'price',
+        'stock': 'stock',
+        'image': 'image',
+        'is_featured': 'is_featured',
+        'created_at': 'created_at',
+        'category': 'category_id',
+        'category_name': 'category__name',
+        'artist': 'artist_id',
+        'artist_name': 'artist__name',
+        'palette': 'palette',
+    },
+    filters={'category': 'category_id', 'artist': 'artist_id'},
+    media_fields=('image',),
+    colour_filter=True,
+)
+
+ARTISTS = Resource(
+    Artist.objects.all(),
+    fields={
+        'id': 'id',
+        'name': 'name',
+        'profession': 'profession',
+        'bio': 'bio',
+        'profile_picture': 'profile_picture',
+        'is_featured': 'is_featured',
+        'created_at': 'created_at',
+    },
+    media_fields=('profile_picture',),
+)
+
+CATEGORIES = Resource(
+    Category.objects.all(),
+    fields={
+        'id': 'id',
+        'name': 'name',
+        'description': 'description',
+        'image': 'image',
+    },
+    media_fields=('image',),
+)
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def encode_cursor(*values):
+    """Opaque, URL-safe cursor for a keyset position made of one or more values"""
+    raw = '|'.join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+
+
+def list_response(request, resource):
+    requested = request.GET.get('fields')
+    names = [name.strip() for name in requested.split(',') if name.strip()] if requested else list(resource.fields)
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        return JsonResponse({'error': f'Unknown fields: {", ".join(unknown)}'}, status=400)
+    if 'id' not in names:
+        names.insert(0, 'id')
+
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        after = int(decode_cursor(request.GET['cursor'])[0]) if request.GET.get('cursor') else None
+        filters = {
+            lookup: int(request.GET[param])
+            for param, lookup in resource.filters.items() if request.GET.get(param)
+        }
+        colour = palette.colour_filter(request.GET) if resource.colour_filter else None
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Invalid limit, cursor or filter'}, status=400)
+
+    queryset = resource.queryset.filter(**filters).order_by('id')
+    if colour is not None:
+        queryset = palette.apply_colour(queryset, colour)
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+
+    # Fetch one extra row to learn whether another page exists without a COUNT query
+    lookups = [resource.fields[name] for name in names]
+    rows = list(queryset.values_list(*lookups)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    results = []
+    for row in rows:
+        item = dict(zip(names, row))
+        for name in resource.media_fields:
+            if name in item:
+                item[name] = settings.MEDIA_URL + item[name] if item[name] else None
+        results.append(item)
+
+    next_url = None
+    if has_more:
+        params = request.GET.copy()
+        params['cursor'] = encode_cursor(rows[-1][0])
+        next_url = f'{request.path}?{params.urlencode()}'
+
+    body = json.dumps({'results': results, 'next': next_url}, default=json_default, separators=(',', ':'))
+    etag = '"%s"' % hashlib.md5(body.encode()).hexdigest()
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,95 @@
+"""Cold storage for closed orders.
+
+Delivered and cancelled orders that have not changed for ORDER_ARCHIVE_AFTER_DAYS
+move, with their items, to ArchivedOrder and ArchivedOrderItem, so the Order and
+OrderItem tables (and their indexes) only hold recent and open orders. The
+archive tables have the same columns in the same order, so a customer's whole
+history is still one UNION query for orders and one for items. Anything counting
+sales (recommendations, autocomplete popularity, artist totals) reads both.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, OrderNotification
+
+ARCHIVED_STATUSES = ('delivered', 'cancelled')
+
+
+def cutoff(days=None):
+    days = settings.ORDER_ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def copy_rows(rows, model):
+    """Unsaved model instances with the same column values (ids included) as rows"""
+    return [model(**{field.attname: getattr(row, field.attname) for field in row._meta.concrete_fields}) for row in rows]
+
+
+def archive_orders(before, batch_size=1000):
+    """Move closed orders last updated before `before` to the archive tables; returns the number moved.
+
+    Each batch is one transaction: bulk inserts into the archive, then deletes
+    of the hot rows by id, so a batch is either fully moved or untouched.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status__in=ARCHIVED_STATUSES, updated_at__lt=before).order_by('pk')[:batch_size]
+            )
+            if not orders:
+                return moved
+            ids = [order.pk for order in orders]
+            items = list(OrderItem.objects.filter(order_id__in=ids))
+            ArchivedOrder.objects.bulk_create(copy_rows(orders, ArchivedOrder))
+            ArchivedOrderItem.objects.bulk_create(copy_rows(items, ArchivedOrderItem), batch_size=1000)
+            OrderItem.objects.filter(order_id__in=ids).delete()
+            OrderNotification.objects.filter(order_id__in=ids).delete()
+            Order.objects.filter(pk__in=ids).delete()
+        moved += len(orders)
+        if len(orders) < batch_size:
+            return moved
+
+
+def order_history(user):
+    """The user's orders from the hot and archive tables, newest first, each with its items as .items"""
+    orders = list(
+        Order.objects.filter(user=user)
+        .union(ArchivedOrder.objects.filter(user=user), all=True)
+        .order_by('-created_at', '-id')
+    )
+    items = (
+        OrderItem.objects.filter(order__user=user).select_related('product')
+        .union(ArchivedOrderItem.objects.filter(order__user=user).select_related('product'), all=True)
+        .order_by('id')
+    )
+    by_order = defaultdict(list)
+    for item in items:
+        by_order[item.order_id].append(item)
+    for order in orders:
+        order.items = by_order[order.pk]
+    return orders
+
+
+def order_lines():
+    """(order_id, product_id) of every hot and archived order item, as one UNION ALL"""
+    return OrderItem.objects.values_list('order_id', 'product_id').union(
+        ArchivedOrderItem.objects.values_list('order_id', 'product_id'), all=True
+    )
+
+
+def units_sold(**filters):
+    """{product_id: units} over the hot and archived order items matching filters"""
+    units = Counter()
+    for model in (OrderItem, ArchivedOrderItem):
+        units.update(dict(
+            model.objects.filter(**filters).order_by().values('product_id')
+            .annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        ))
+    return units
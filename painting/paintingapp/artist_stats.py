@@ -0,0 +1,82 @@
+"""Per-artist portfolio totals kept in ArtistStats.
+
+Product and order events adjust the totals with single UPDATEs (new works,
+placed and cancelled orders), so list and detail pages read them with a join
+instead of aggregating per artist. refresh() recomputes rows from scratch; it
+heals artists whose row is missing and catches up after bulk imports, which
+bypass the signals (see `manage.py refresh_artist_stats`).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Max, Q, Sum, Value, When
+
+from .models import ArchivedOrderItem, Artist, ArtistStats, OrderItem, Product
+
+LINE_TOTAL = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def sales_by_artist(items):
+    """{artist_id: (units, revenue)} for an OrderItem or ArchivedOrderItem queryset"""
+    rows = (
+        items.order_by().values('product__artist_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+        .values_list('product__artist_id', 'units', 'revenue')
+    )
+    return {artist_id: (units, revenue) for artist_id, units, revenue in rows}
+
+
+def refresh(artist_ids=None, batch_size=1000):
+    """Recompute the stats of artist_ids (every artist by default); returns the number of rows written"""
+    artists = Artist.objects.all() if artist_ids is None else Artist.objects.filter(pk__in=artist_ids)
+    ids = list(artists.values_list('pk', flat=True))
+    works = {
+        artist_id: (count, last)
+        for artist_id, count, last in Product.objects.filter(artist__in=ids).order_by().values('artist_id')
+        .annotate(count=Count('id'), last=Max('created_at')).values_list('artist_id', 'count', 'last')
+    }
+    sales = defaultdict(lambda: [0, Decimal(0)])
+    for model in (OrderItem, ArchivedOrderItem):
+        items = model.objects.filter(product__artist__in=ids).exclude(order__status='cancelled')
+        for artist_id, (units, revenue) in sales_by_artist(items).items():
+            sales[artist_id][0] += units
+            sales[artist_id][1] += revenue
+    rows = [
+        ArtistStats(
+            artist_id=artist_id,
+            work_count=works.get(artist_id, (0, None))[0],
+            last_upload_at=works.get(artist_id, (0, None))[1],
+            units_sold=sales[artist_id][0] if artist_id in sales else 0,
+            revenue=sales[artist_id][1] if artist_id in sales else 0,
+        )
+        for artist_id in ids
+    ]
+    ArtistStats.objects.bulk_create(
+        rows, batch_size=batch_size, update_conflicts=True, unique_fields=['artist'],
+        update_fields=['work_count', 'units_sold', 'revenue', 'last_upload_at'],
+    )
+    return len(rows)
+
+
+def work_added(product):
+    newer = Q(last_upload_at__isnull=True) | Q(last_upload_at__lt=product.created_at)
+    updated = ArtistStats.objects.filter(pk=product.artist_id).update(
+        work_count=F('work_count') + 1,
+        last_upload_at=Case(When(newer, then=Value(product.created_at)), default=F('last_upload_at')),
+    )
+    if not updated:
+        refresh([product.artist_id])
+
+
+def sales_changed(order_ids, sign=1):
+    """Add (or with sign=-1, take back) the items of order_ids to their artists' totals"""
+    sales = sales_by_artist(OrderItem.objects.filter(order_id__in=order_ids))
+    missing = []
+    for artist_id, (units, revenue) in sales.items():
+        updated = ArtistStats.objects.filter(pk=artist_id).update(
+            units_sold=F('units_sold') + sign * units, revenue=F('revenue') + sign * revenue
+        )
+        if not updated:
+            missing.append(artist_id)
+    if missing:
+        refresh(missing)
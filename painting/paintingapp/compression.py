@@ -0,0 +1,119 @@
+"""Content-encoding negotiation plus gzip/brotli helpers shared by the static storage,
+the precompressed static file view and CompressionMiddleware.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+from pathlib import Path
+
+import brotli
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Suffix of the precompressed sibling for each encoding, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json', 'application/xml', 'application/rss+xml',
+    'application/manifest+json', 'image/svg+xml', 'font/ttf', 'font/otf', 'application/vnd.ms-fontobject',
+)
+STATIC_MAX_AGE = 60 * 60 * 24 * 7
+
+
+def is_compressible(content_type):
+    return content_type.split(';')[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def accepted_encodings(header):
+    """Encodings the client accepts, honouring q=0 exclusions"""
+    accepted = set()
+    for part in header.split(','):
+        name, *params = [piece.strip() for piece in part.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+def negotiate(request, offered=('br', 'gzip')):
+    """The preferred encoding in offered that the request accepts, or None"""
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for encoding in offered:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def compress_file(path, min_size, brotli_quality=11):
+    """Write .br and .gz siblings of path; skip encodings that do not make it smaller.
+
+    Returns the sibling paths written.
+    """
+    data = Path(path).read_bytes()
+    if len(data) < min_size:
+        return []
+    written = []
+    for suffix, encoded in (
+        ('.br', brotli.compress(data, quality=brotli_quality)),
+        ('.gz', gzip.compress(data, compresslevel=9, mtime=0)),
+    ):
+        if len(encoded) < len(data):
+            Path(path + suffix).write_bytes(encoded)
+            written.append(path + suffix)
+    return written
+
+
+def brotli_sequence(sequence, quality):
+    """Brotli-encode an iterable of byte strings, flushing after each one so output keeps streaming"""
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def serve_precompressed(request, path, document_root=None):
+    """Serve a collected static file, using its .br or .gz sibling when the client accepts it"""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(document_root or settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    if not fullpath.is_file():
+        raise Http404
+
+    encoding = None
+    servepath = fullpath
+    for name, suffix in ENCODINGS:
+        candidate = fullpath.with_name(fullpath.name + suffix)
+        if negotiate(request, (name,)) and candidate.is_file():
+            encoding, servepath = name, candidate
+            break
+
+    stat = servepath.stat()
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(str(fullpath))
+        response = FileResponse(servepath.open('rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}'
+    if any(os.path.exists(f'{fullpath}{suffix}') for _, suffix in ENCODINGS):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,98 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import UserSubmission
+from .similarity import dhash, open_downsampled
+
+
+def to_signed(value):
+    """Fit an unsigned 64-bit hash into a BigIntegerField"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def image_dhash(source):
+    with open_downsampled(source) as img:
+        return dhash(img)
+
+
+class MultiIndexHashTable:
+    """Exact radius search over 64-bit hashes under Hamming distance.
+
+    The hash is cut into radius + 1 bit ranges. Two hashes within radius bits
+    must agree exactly on at least one range (pigeonhole), so a lookup only
+    verifies the entries sharing a bucket with the query in some range.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        chunks = radius + 1
+        bounds = [64 * i // chunks for i in range(chunks + 1)]
+        self.ranges = [(low, (1 << (high - low)) - 1) for low, high in zip(bounds, bounds[1:])]
+        self.tables = [defaultdict(list) for _ in self.ranges]
+
+    def add(self, value, item):
+        for table, (shift, mask) in zip(self.tables, self.ranges):
+            table[(value >> shift) & mask].append((value, item))
+
+    def search(self, value):
+        """Return [(distance, item)] for every stored hash within radius bits of value"""
+        matches = {}
+        for table, (shift, mask) in zip(self.tables, self.ranges):
+            for stored, item in table.get((value >> shift) & mask, ()):
+                distance = (stored ^ value).bit_count()
+                if distance <= self.radius:
+                    matches[item] = distance
+        return [(distance, item) for item, distance in matches.items()]
+
+
+class SubmissionHashIndex:
+    """Per-process multi-index hash table of submission hashes.
+
+    The table is built on first use and every lookup first pulls in rows with a
+    higher id, so submissions saved by this or any other worker are picked up
+    with one indexed range query instead of a reload. Rows at or below the last
+    id seen only change when `manage.py hash_submissions` backfills old
+    submissions (or one is deleted); a count of them notices that and rebuilds
+    the table.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.table = None
+        self.last_id = 0
+        self.size = 0
+
+    def _reset(self):
+        self.table = MultiIndexHashTable(settings.SUBMISSION_DUPLICATE_DISTANCE)
+        self.last_id = self.size = 0
+
+    def _catch_up(self):
+        rows = (
+            UserSubmission.objects.filter(id__gt=self.last_id, image_hash__isnull=False)
+            .order_by('id').values_list('id', 'image_hash')
+        )
+        for submission_id, image_hash in rows.iterator(chunk_size=2000):
+            self.table.add(to_unsigned(image_hash), submission_id)
+            self.last_id = submission_id
+            self.size += 1
+
+    def _hashed_up_to_last_id(self):
+        return UserSubmission.objects.filter(id__lte=self.last_id, image_hash__isnull=False).count()
+
+    def find_duplicate(self, image_hash):
+        """Id of the closest earlier submission within SUBMISSION_DUPLICATE_DISTANCE bits, or None"""
+        with self.lock:
+            if self.table is None or self._hashed_up_to_last_id() != self.size:
+                self._reset()
+            self._catch_up()
+            matches = self.table.search(image_hash)
+        return min(matches)[1] if matches else None
+
+
+submission_hashes = SubmissionHashIndex()
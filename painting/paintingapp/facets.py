@@ -0,0 +1,150 @@
+"""Faceted filtering for the search page.
+
+Every facet count comes from one GROUP BY over the text matches, bucketed by
+(category, artist, price band, in stock). Counts for each facet are then summed
+in Python from the groups that pass every *other* selected filter, so picking a
+category still shows how many results each other category would give. The
+groups only depend on the search text, so they are cached per query and shared
+by every combination of filters and sort order; saving a product, artist or
+category bumps a generation number that retires them all (in every worker only
+when CACHES is shared; with the default LocMemCache other workers keep theirs
+for up to FACET_CACHE_TIMEOUT). The result count always comes from the database.
+
+Filter state lives in the query string: ?q=...&category=3&category=5&artist=7
+&price=under-500&in_stock=1.
+"""
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, Q, Value, When
+
+PRICE_BANDS = (
+    ('under-500', 'Under ₹500', None, 500),
+    ('500-1000', '₹500 – ₹1,000', 500, 1000),
+    ('1000-5000', '₹1,000 – ₹5,000', 1000, 5000),
+    ('5000-up', '₹5,000 and up', 5000, None),
+)
+FACETS = ('category', 'artist', 'price', 'in_stock')
+# Facet values listed per facet, besides any that are selected
+FACET_LIMIT = 10
+GENERATION_KEY = 'facets:generation'
+
+
+def band_q(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def parse_filters(params):
+    """The selected values of each facet, as sets, ignoring anything malformed"""
+    bands = {key for key, *_ in PRICE_BANDS}
+    return {
+        'category': {int(v) for v in params.getlist('category') if v.isdigit()},
+        'artist': {int(v) for v in params.getlist('artist') if v.isdigit()},
+        'price': {v for v in params.getlist('price') if v in bands},
+        'in_stock': {True} if params.get('in_stock') == '1' else set(),
+    }
+
+
+def apply_filters(queryset, filters):
+    if filters['category']:
+        queryset = queryset.filter(category_id__in=filters['category'])
+    if filters['artist']:
+        queryset = queryset.filter(artist_id__in=filters['artist'])
+    if filters['price']:
+        q = Q()
+        for key, _, low, high in PRICE_BANDS:
+            if key in filters['price']:
+                q |= band_q(low, high)
+        queryset = queryset.filter(q)
+    if filters['in_stock']:
+        queryset = queryset.filter(stock__gt=0)
+    return queryset
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def facet_groups(queryset, query, scope=''):
+    """(category_id, category, artist_id, artist, band, in_stock, count) rows for the text matches, cached per query.
+
+    scope names anything else queryset is narrowed by (such as a colour filter),
+    so it gets its own cache entry.
+    """
+    generation = cache.get(GENERATION_KEY, 0)
+    digest = hashlib.md5(f'{query}|{scope}'.encode()).hexdigest()  # the exact text the matches were filtered by
+    key = f'facets:{generation}:{digest}'
+    groups = cache.get(key)
+    if groups is None:
+        band = Case(
+            *[When(band_q(low, high), then=Value(name)) for name, _, low, high in PRICE_BANDS],
+            default=Value(''),
+        )
+        in_stock = Case(When(stock__gt=0, then=Value(True)), default=Value(False))
+        groups = list(
+            queryset.order_by()
+            .annotate(band=band, in_stock=in_stock)
+            .values_list('category_id', 'category__name', 'artist_id', 'artist__name', 'band', 'in_stock')
+            .annotate(count=Count('id'))
+        )
+        cache.set(key, groups, settings.FACET_CACHE_TIMEOUT)
+    return groups
+
+
+def toggle_url(params, facet, value):
+    """The query string with value added to or removed from facet, back on page 1"""
+    params = params.copy()
+    params.pop('page', None)
+    values = params.getlist(facet)
+    value = str(value)
+    params.setlist(facet, [v for v in values if v != value] if value in values else values + [value])
+    return '?' + params.urlencode()
+
+
+def build_facets(groups, filters, params):
+    """Return {facet: [option, ...]} with each option's count ignoring the filters on its own facet"""
+    counts = {facet: Counter() for facet in FACETS}
+    labels = {'category': {}, 'artist': {}}
+    for category_id, category, artist_id, artist, band, in_stock, count in groups:
+        values = {'category': category_id, 'artist': artist_id, 'price': band, 'in_stock': bool(in_stock)}
+        labels['category'][category_id] = category
+        labels['artist'][artist_id] = artist
+        passes = {facet: not filters[facet] or values[facet] in filters[facet] for facet in FACETS}
+        failing = [facet for facet, ok in passes.items() if not ok]
+        if not failing:
+            for facet in FACETS:
+                counts[facet][values[facet]] += count
+        elif len(failing) == 1:  # only its own facet excludes it: still counts toward that facet's options
+            counts[failing[0]][values[failing[0]]] += count
+
+    def options(facet, ordered):
+        return [{
+            'value': value,
+            'label': label,
+            'count': counts[facet][value],
+            'selected': value in filters[facet],
+            'url': toggle_url(params, facet, '1' if facet == 'in_stock' else value),
+        } for value, label in ordered]
+
+    def top(facet):
+        ranked = sorted(counts[facet], key=lambda value: (-counts[facet][value], labels[facet][value]))
+        shown = ranked[:FACET_LIMIT] + [value for value in ranked[FACET_LIMIT:] if value in filters[facet]]
+        return options(facet, [(value, labels[facet][value]) for value in shown])
+
+    facets = {
+        'category': top('category'),
+        'artist': top('artist'),
+        'price': options('price', [(key, label) for key, label, *_ in PRICE_BANDS if counts['price'][key]]),
+        'in_stock': options('in_stock', [(True, 'In stock only')]),
+    }
+    return facets
@@ -0,0 +1,121 @@
+"""Synthetic catalog data for tests and benchmarks.
+
+Everything is written with bulk_create in fixed-size batches, so seeding a
+million products keeps memory flat and takes one INSERT per batch.
+"""
+import random
+import secrets
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from . import artist_stats
+from .models import Artist, Category, Order, OrderItem, Product, UserSubmission
+
+WORDS = (
+    'blue', 'calm', 'river', 'sunset', 'mountain', 'portrait', 'abstract', 'garden', 'city', 'night',
+    'ocean', 'forest', 'golden', 'quiet', 'storm', 'spring', 'winter', 'lotus', 'village', 'dream',
+)
+STATUSES = [status for status, _ in Order.STATUS_CHOICES]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def phrase(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def create_users(count, prefix, batch_size):
+    users = (User(username=f'{prefix}{i}', password='!') for i in range(count))  # '!' = unusable password
+    created = []
+    for batch in batched(users, batch_size):
+        created += User.objects.bulk_create(batch)
+    return created
+
+
+def seed(categories=10, artists=50, products=1000, customers=100, orders=500,
+         items_per_order=3, submissions=200, batch_size=5000, seed=0):
+    """Create a synthetic catalog and order history and return a summary dict of what was created"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    prefix = f'seed_{secrets.token_hex(3)}_'
+
+    category_objs = Category.objects.bulk_create([
+        Category(name=f'{phrase(rng, 2)} {i}', description=phrase(rng, 12), image='category_images/seed.jpg')
+        for i in range(categories)
+    ])
+
+    artist_users = create_users(artists, prefix + 'artist', batch_size)
+    artist_objs = Artist.objects.bulk_create([
+        Artist(user=user, name=f'Artist {i}', profession='Painter', bio=phrase(rng, 20),
+               created_at=now, is_featured=i < 3)
+        for i, user in enumerate(artist_users)
+    ])
+
+    product_rows = (
+        Product(
+            name=f'{phrase(rng)} {i}',
+            description=phrase(rng, 25),
+            price=Decimal(rng.randrange(500, 50000)) / 100,
+            stock=rng.randrange(0, 5),
+            image='products/seed.jpg',
+            category=rng.choice(category_objs),
+            artist=rng.choice(artist_objs),
+            created_at=now - timedelta(minutes=i),
+            is_featured=i < 4,
+        )
+        for i in range(products)
+    )
+    product_ids = []
+    for batch in batched(product_rows, batch_size):
+        product_ids += [p.id for p in Product.objects.bulk_create(batch)]
+
+    customer_objs = create_users(customers, prefix + 'customer', batch_size)
+
+    order_rows = (
+        Order(user=rng.choice(customer_objs), first_name='Test', last_name='Buyer', email='buyer@example.com',
+              city='Gallery City', pincode='000000', subtotal=0, shipping_cost=100, total_amount=100,
+              status=rng.choice(STATUSES))
+        for _ in range(orders)
+    )
+    item_count = 0
+    if product_ids and customer_objs:
+        for batch in batched(order_rows, max(batch_size // items_per_order, 1)):
+            created = Order.objects.bulk_create(batch)
+            items = [
+                OrderItem(order=order, product_id=rng.choice(product_ids), quantity=rng.randrange(1, 3),
+                          price=Decimal(rng.randrange(500, 50000)) / 100)
+                for order in created for _ in range(items_per_order)
+            ]
+            OrderItem.objects.bulk_create(items, batch_size=batch_size)
+            item_count += len(items)
+
+    submission_rows = (
+        UserSubmission(name=phrase(rng), description=phrase(rng, 15), image='user_submissions/seed.jpg',
+                       artist=rng.choice(customer_objs) if customer_objs and i % 3 else None, is_approved=True)
+        for i in range(submissions)
+    )
+    for batch in batched(submission_rows, batch_size):
+        UserSubmission.objects.bulk_create(batch)
+
+    artist_stats.refresh(batch_size=batch_size)
+
+    return {
+        'categories': category_objs,
+        'artists': artist_objs,
+        'customers': customer_objs,
+        'product_ids': product_ids,
+        'orders': orders if product_ids and customer_objs else 0,
+        'order_items': item_count,
+        'submissions': submissions,
+    }
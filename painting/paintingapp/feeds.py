@@ -0,0 +1,89 @@
+import csv
+import json
+import zlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.urls import reverse
+
+from .models import Product
+
+CHUNK_SIZE = 2000
+SITEMAP_SECTION_SIZE = 50000  # URLs per sitemap file allowed by the protocol
+
+FEED_FIELDS = ['id', 'name', 'description', 'price', 'stock', 'category', 'artist', 'image', 'created_at']
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the csv writer's caller"""
+    def write(self, value):
+        return value
+
+
+def catalog_rows(queryset=None):
+    """Stream the catalog as plain dicts, CHUNK_SIZE rows per database round trip"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('id').values(
+        'id', 'name', 'description', 'price', 'stock', 'image', 'created_at', 'category__name', 'artist__name',
+    )
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        row['category'] = row.pop('category__name')
+        row['artist'] = row.pop('artist__name')
+        row['image'] = settings.MEDIA_URL + row['image'] if row['image'] else ''
+        yield row
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FEED_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[field] for field in FEED_FIELDS])
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def sitemap_section_count():
+    last = Product.objects.order_by('-id').values_list('id', flat=True).first()
+    return (last // SITEMAP_SECTION_SIZE) + 1 if last else 1
+
+
+def sitemap_index_lines(base_url):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for section in range(1, sitemap_section_count() + 1):
+        loc = base_url + reverse('sitemap_section', args=[section])
+        yield f'<sitemap><loc>{escape(loc)}</loc></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def sitemap_section_lines(base_url, section):
+    """One sitemap file per block of SITEMAP_SECTION_SIZE primary keys, so each stays under the URL limit"""
+    start = (section - 1) * SITEMAP_SECTION_SIZE
+    rows = Product.objects.filter(id__gt=start, id__lte=start + SITEMAP_SECTION_SIZE).order_by('id')
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for product_id, created_at in rows.values_list('id', 'created_at').iterator(chunk_size=CHUNK_SIZE):
+        loc = base_url + reverse('product_detail', args=[product_id])
+        lastmod = f'<lastmod>{created_at.date().isoformat()}</lastmod>' if created_at else ''
+        yield f'<url><loc>{escape(loc)}</loc>{lastmod}</url>\n'
+    yield '</urlset>\n'
+
+
+def gzip_stream(lines, flush_every=64 * 1024):
+    """Gzip an iterable of text chunks incrementally, emitting compressed blocks as they fill up"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending += len(data)
+        block = compressor.compress(data)
+        if pending >= flush_every:
+            block += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if block:
+            yield block
+    yield compressor.flush()
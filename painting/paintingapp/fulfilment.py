@@ -0,0 +1,129 @@
+"""Bulk order status changes and the customer emails they queue.
+
+A transition is one UPDATE whose WHERE clause only admits orders currently in
+a status allowed to move to the target, so a batch can mix eligible and
+ineligible orders (or race another member of staff) without ever making an
+illegal move. The same transaction puts the items of cancelled orders back in
+stock and queues one OrderNotification per changed order; send_notifications drains that queue in batches over a single SMTP
+connection, marking only the notifications whose message the server accepted as sent.
+"""
+from django.core import mail
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import artist_stats, prerender
+from .models import Order, OrderItem, OrderNotification, Product
+
+# The statuses each status may move to
+TRANSITIONS = {
+    'pending': {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': set(),
+    'cancelled': set(),
+}
+STATUS_LABELS = dict(Order.STATUS_CHOICES)
+
+SUBJECTS = {
+    'processing': 'We are preparing your order #{id}',
+    'shipped': 'Your order #{id} is on its way',
+    'delivered': 'Your order #{id} has been delivered',
+    'cancelled': 'Your order #{id} has been cancelled',
+}
+
+
+def sources(target):
+    """The statuses an order may be in to move to target"""
+    if target not in TRANSITIONS:
+        raise ValueError(f'Unknown order status {target!r}')
+    return [status for status, targets in TRANSITIONS.items() if target in targets]
+
+
+def transition(queryset, target, notify=True):
+    """Move the orders in queryset that may go to target; returns the ids that changed.
+
+    Orders in any other status are left alone.
+    """
+    allowed = sources(target)
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=queryset.order_by().values('pk'), status__in=allowed)
+            .values_list('pk', flat=True)
+        )
+        if not ids:
+            return []
+        Order.objects.filter(pk__in=ids, status__in=allowed).update(status=target, updated_at=timezone.now())
+        if target == 'cancelled':
+            prerender.stock_changed(restock(ids))
+            artist_stats.sales_changed(ids, sign=-1)
+        if notify:
+            OrderNotification.objects.bulk_create(
+                [OrderNotification(order_id=order_id, status=target) for order_id in ids], batch_size=1000
+            )
+    return ids
+
+
+def restock(order_ids):
+    """Return the units of order_ids to stock with one UPDATE per product; returns the product ids"""
+    totals = (
+        OrderItem.objects.filter(order_id__in=order_ids).order_by()
+        .values('product_id').annotate(units=Sum('quantity')).values_list('product_id', 'units')
+    )
+    product_ids = []
+    for product_id, units in totals:
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + units)
+        product_ids.append(product_id)
+    return product_ids
+
+
+def message_for(notification):
+    """The email for a queued notification, or None if the customer left no address"""
+    order = notification.order
+    recipient = order.email or order.user.email
+    if not recipient:
+        return None
+    name = order.first_name or order.user.get_username()
+    body = (
+        f'Hello {name},\n\n'
+        f'Your order #{order.id} (₹{order.total_amount}) is now {STATUS_LABELS[notification.status].lower()}.\n\n'
+        'Thank you for shopping with us.\n'
+    )
+    return mail.EmailMessage(SUBJECTS[notification.status].format(id=order.id), body, to=[recipient])
+
+
+def send_notifications(batch_size=100):
+    """Email every queued notification, batch_size per transaction, over one connection; returns the number handled.
+
+    Messages go out one at a time and only those the mail server accepted are
+    marked sent, so if it fails partway the error is raised after the earlier
+    ones are recorded and only the rest are retried by the next run.
+    """
+    handled = 0
+    with mail.get_connection() as connection:
+        while True:
+            error = None
+            with transaction.atomic():
+                batch = list(
+                    OrderNotification.objects.select_for_update(skip_locked=True, of=('self',))
+                    .filter(sent_at__isnull=True).select_related('order__user').order_by('id')[:batch_size]
+                )
+                if not batch:
+                    return handled
+                done = []
+                for notification in batch:
+                    message = message_for(notification)
+                    try:
+                        if message is not None:
+                            connection.send_messages([message])
+                    except OSError as e:  # SMTPException included
+                        error = e
+                        break
+                    done.append(notification.id)
+                OrderNotification.objects.filter(id__in=done).update(sent_at=timezone.now())
+            handled += len(done)
+            if error is not None:
+                raise error
+            if len(batch) < batch_size:
+                return handled
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from paintingapp.archive import ARCHIVED_STATUSES, archive_orders, cutoff
+from paintingapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Move delivered and cancelled orders past ORDER_ARCHIVE_AFTER_DAYS to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive orders unchanged for this many days (default: ORDER_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the orders that would move')
+
+    def handle(self, *args, **options):
+        before = cutoff(options['days'])
+        if options['dry_run']:
+            count = Order.objects.filter(status__in=ARCHIVED_STATUSES, updated_at__lt=before).count()
+            self.stdout.write(f'{count} orders last updated before {before:%Y-%m-%d} would be archived')
+            return
+        start = time.perf_counter()
+        moved = archive_orders(before, batch_size=options['batch_size'])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'Archived {moved} orders in {elapsed_ms:.0f} ms')
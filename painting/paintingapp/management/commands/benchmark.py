@@ -0,0 +1,245 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from paintingapp.factories import WORDS
+from paintingapp.perf import percentile
+
+# (label, weight) -- roughly what a day of storefront traffic looks like
+TRAFFIC_MIX = [
+    ('home', 10),
+    ('category_detail', 12),
+    ('product_detail', 25),
+    ('search', 15),
+    ('user_submissions', 5),
+    ('add_to_cart', 10),
+    ('view_cart', 6),
+    ('checkout', 5),
+    ('place_order', 2),
+    ('chatbot', 10),
+]
+
+CHATBOT_QUERIES = ['show me paintings', 'who are your artists', 'what category', 'what is the price']
+
+
+class Shopper:
+    """One simulated browser session with its own cookies"""
+
+    def __init__(self, user, catalog, rng):
+        from django.test import Client
+        from django.urls import reverse
+
+        self.reverse = reverse
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(user)
+        self.catalog = catalog
+        self.rng = rng
+
+    def request(self, label):
+        rng, client, reverse = self.rng, self.client, self.reverse
+        product_id = rng.choice(self.catalog['products'])
+        if label == 'home':
+            return client.get(reverse('home'))
+        if label == 'category_detail':
+            category_id = rng.choice(self.catalog['categories'])
+            return client.get(reverse('category_detail', args=[category_id]), {'page': rng.randint(1, 3)})
+        if label == 'product_detail':
+            return client.get(reverse('product_detail', args=[product_id]))
+        if label == 'search':
+            return client.get(reverse('search'), {'q': rng.choice(WORDS), 'sort': rng.choice(['newest', 'price_low'])})
+        if label == 'user_submissions':
+            return client.get(reverse('user_submissions'))
+        if label == 'add_to_cart':
+            return client.post(reverse('add_to_cart', args=[product_id]))
+        if label == 'view_cart':
+            return client.get(reverse('view_cart'))
+        if label == 'checkout':
+            return client.get(reverse('checkout'))
+        if label == 'place_order':
+            client.post(reverse('add_to_cart', args=[product_id]))
+            return client.post(reverse('place_order'), {
+                'first_name': 'Bench', 'last_name': 'Mark', 'email': 'bench@example.com', 'phone': '0000000000',
+                'address': '1 Load Street', 'city': 'Gallery City', 'pincode': '000000', 'payment_method': 'COD',
+            })
+        if label == 'chatbot':
+            return client.post(reverse('chatbot'), {'query': rng.choice(CHATBOT_QUERIES)})
+        raise ValueError(label)
+
+
+def load_catalog():
+    from paintingapp.models import Category, Product
+
+    catalog = {
+        'products': list(Product.objects.filter(stock__gt=0).values_list('id', flat=True)[:5000]),
+        'categories': list(Category.objects.values_list('id', flat=True)[:500]),
+    }
+    if not catalog['products'] or not catalog['categories']:
+        raise CommandError('The database has no in-stock products; run `manage.py seed_catalog` first')
+    return catalog
+
+
+@contextmanager
+def scratch_database(alias='default'):
+    """Point every new connection at a temporary copy of the SQLite database for the duration.
+
+    Carts and orders placed by the traffic mix land in the copy, which is deleted
+    afterwards, so benchmarking never touches the real data. Yields the copy's path.
+    """
+    from django.db import connections
+
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        raise CommandError('benchmark places real orders, so it only runs against a copy of a SQLite database')
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as tmp:
+        path = os.path.join(tmp, 'db.sqlite3')
+        connection.ensure_connection()
+        with closing(sqlite3.connect(path)) as copy:
+            connection.connection.backup(copy)
+        connection.close()  # forked workers must not share the parent's connection
+        # Connections keep a reference to this dict, so the switch reaches threads and forked workers
+        settings_dict = connections.settings[alias]
+        original = settings_dict['NAME']
+        settings_dict['NAME'] = path
+        try:
+            yield path
+        finally:
+            settings_dict['NAME'] = original
+            connections.close_all()
+
+
+def run_thread(worker_id, thread_id, requests, warmup, seed, catalog):
+    from django.contrib.auth.models import User
+    from django.db import connection
+
+    rng = random.Random(f'{seed}-{worker_id}-{thread_id}')
+    user, _ = User.objects.get_or_create(username=f'benchmark_{worker_id}_{thread_id}')
+    shopper = Shopper(user, catalog, rng)
+    labels = [label for label, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for i in range(warmup + requests):
+        label = rng.choices(labels, weights)[0]
+        start = time.perf_counter()
+        try:
+            failed = shopper.request(label).status_code >= 400
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        latencies[label].append(elapsed)
+        if failed:
+            errors[label] += 1
+
+    connection.close()
+    return latencies, errors
+
+
+def run_worker(worker_id, database, threads, requests, warmup, seed):
+    """Entry point for each benchmark process; runs `threads` shoppers concurrently against the database copy"""
+    from django.apps import apps
+    from django.db import connections
+    if not apps.ready:  # spawned (not forked) processes start with a bare interpreter
+        django.setup()
+    connections.settings['default']['NAME'] = database
+
+    catalog = load_catalog()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    # Every shopper shares one address, so rate limits would only measure the 429 path. Stock moved
+    # by the copy's orders must not re-render the real static pages, so prerendering is off.
+    no_prerender = os.path.join(os.path.dirname(database), 'prerendered')
+    with override_settings(THROTTLE_RATES={}, PRERENDER_ROOT=no_prerender), \
+            ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(run_thread, worker_id, t, requests, warmup, seed, catalog) for t in range(threads)]
+        for future in futures:
+            thread_latencies, thread_errors = future.result()
+            for label, values in thread_latencies.items():
+                latencies[label].extend(values)
+            for label, count in thread_errors.items():
+                errors[label] += count
+    return dict(latencies), dict(errors)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a weighted storefront traffic mix in-process and report latency percentiles as JSON. '
+        'Requests run against a throwaway copy of the SQLite database, so the carts and orders they '
+        'create never reach the real one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent shoppers per process')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per shopper')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per shopper')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        load_catalog()  # fail fast on an empty database
+
+        with scratch_database() as database:
+            args = (database, options['threads'], options['requests'], options['warmup'], options['seed'])
+            start = time.perf_counter()
+            if options['processes'] == 1:
+                results = [run_worker(0, *args)]
+            else:
+                with ProcessPoolExecutor(max_workers=options['processes']) as pool:
+                    futures = [pool.submit(run_worker, w, *args) for w in range(options['processes'])]
+                    results = [future.result() for future in futures]
+            wall_time = time.perf_counter() - start
+
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        for worker_latencies, worker_errors in results:
+            for label, values in worker_latencies.items():
+                latencies[label].extend(values)
+            for label, count in worker_errors.items():
+                errors[label] += count
+
+        total = sum(len(values) for values in latencies.values())
+        report = {
+            'config': {
+                'processes': options['processes'],
+                'threads': options['threads'],
+                'requests_per_thread': options['requests'],
+                'seed': options['seed'],
+                'pid': os.getpid(),
+            },
+            'total': {
+                'requests': total,
+                'errors': sum(errors.values()),
+                'wall_time_s': round(wall_time, 3),
+                'throughput_rps': round(total / wall_time, 1) if wall_time else 0,
+            },
+            'views': {},
+        }
+        for label in sorted(latencies):
+            values = sorted(latencies[label])
+            report['views'][label] = {
+                'requests': len(values),
+                'errors': errors[label],
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
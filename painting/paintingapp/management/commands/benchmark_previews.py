@@ -0,0 +1,42 @@
+import json
+import time
+
+import numpy as np
+from PIL import Image
+
+from django.core.management.base import BaseCommand
+
+from paintingapp import previews
+
+
+class Command(BaseCommand):
+    help = 'Report preview render time per megapixel for every style'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1024, help='Longest side of the test image in pixels')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--frame', default='classic', choices=['none', *previews.FRAMES])
+
+    def handle(self, *args, **options):
+        size = options['size']
+        # Smooth gradients plus noise look more like a photo than pure noise does
+        rng = np.random.default_rng(0)
+        ys, xs = np.mgrid[0:size * 3 // 4, 0:size]
+        base = np.stack([xs / size, ys / size, (xs + ys) / (2 * size)], axis=2) * 200
+        pixels = np.clip(base + rng.normal(0, 20, base.shape), 0, 255).astype(np.uint8)
+        img = Image.fromarray(pixels)
+        megapixels = img.width * img.height / 1e6
+
+        results = {}
+        for style in previews.STYLES:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                previews.render(img, style, options['frame'], size)
+                timings.append(time.perf_counter() - start)
+            results[style] = {
+                'megapixels': round(megapixels, 3),
+                'ms_per_megapixel': round(min(timings) * 1000 / megapixels, 2),
+                'median_ms': round(sorted(timings)[len(timings) // 2] * 1000, 2),
+            }
+        self.stdout.write(json.dumps(results, indent=2))
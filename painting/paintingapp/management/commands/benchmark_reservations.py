@@ -0,0 +1,116 @@
+import json
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from paintingapp import factories, reservations
+from paintingapp.models import Artist, Category, Product, StockReservation
+from paintingapp.perf import percentile
+
+
+class Command(BaseCommand):
+    help = 'Race many concurrent buyers for one-of-a-kind paintings and check nothing is oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10, help='One-of-a-kind products to fight over')
+        parser.add_argument('--buyers', type=int, default=300)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--attempts', type=int, default=3, help='Add-to-cart attempts per buyer')
+        parser.add_argument('--expired', type=int, default=20000, help='Lapsed holds for the sweeper pass (at most buyers x items)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        data = factories.seed(categories=1, artists=1, products=0, customers=0, orders=0, submissions=0)
+        category, artist = data['categories'][0], data['artists'][0]
+        items = Product.objects.bulk_create([
+            Product(name=f'Original {i}', description='One of a kind', price=Decimal(1000), stock=1,
+                    image='products/seed.jpg', category=category, artist=artist)
+            for i in range(options['items'])
+        ])
+        item_ids = [item.id for item in items]
+        buyers = factories.create_users(options['buyers'], f'racer_{random.getrandbits(24):06x}_', 5000)
+        try:
+            report = {
+                'race': self.race(buyers, item_ids, options),
+                'sweep': self.sweep(buyers, item_ids, options['expired']),
+            }
+        finally:
+            Product.objects.filter(id__in=item_ids).delete()
+            User.objects.filter(id__in=[buyer.id for buyer in buyers + [artist.user]]).delete()
+            Artist.objects.filter(id=artist.id).delete()
+            Category.objects.filter(id=category.id).delete()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def race(self, buyers, item_ids, options):
+        rng = random.Random(options['seed'])
+        plans = [(buyer, [rng.choice(item_ids) for _ in range(options['attempts'])]) for buyer in buyers]
+
+        def attempt(plan):
+            buyer, wanted = plan
+            outcomes = []
+            for product_id in wanted:
+                start = time.perf_counter()
+                try:
+                    won = reservations.reserve(buyer, product_id)
+                except OperationalError:  # e.g. SQLite lock timeout under heavy write contention
+                    won = None
+                outcomes.append((product_id, won, time.perf_counter() - start))
+            connection.close()
+            return outcomes
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            outcomes = [outcome for result in pool.map(attempt, plans) for outcome in result]
+        wall_time = time.perf_counter() - start
+
+        wins = Counter(product_id for product_id, won, _ in outcomes if won)
+        reserved = dict(Product.objects.filter(id__in=item_ids).values_list('id', 'reserved'))
+        held = dict(
+            StockReservation.objects.filter(product_id__in=item_ids)
+            .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+        )
+        latencies = sorted(elapsed for _, _, elapsed in outcomes)
+        return {
+            'attempts': len(outcomes),
+            'won': sum(wins.values()),
+            'lost': sum(1 for _, won, _ in outcomes if won is False),
+            'errors': sum(1 for _, won, _ in outcomes if won is None),
+            'oversold_items': sum(1 for count in wins.values() if count > 1),
+            'ledger_mismatches': sum(1 for product_id in item_ids if reserved[product_id] != held.get(product_id, 0)),
+            'wall_time_s': round(wall_time, 3),
+            'attempts_per_s': round(len(outcomes) / wall_time, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    def sweep(self, buyers, item_ids, count):
+        """Time the sweeper returning many lapsed holds spread over the same few products"""
+        StockReservation.objects.filter(product_id__in=item_ids).delete()
+        Product.objects.filter(id__in=item_ids).update(stock=count, reserved=0)
+        lapsed = timezone.now() - timedelta(seconds=1)
+        pairs = [(buyer, product_id) for buyer in buyers for product_id in item_ids][:count]
+        StockReservation.objects.bulk_create([
+            StockReservation(user=buyer, product_id=product_id, quantity=1, expires_at=lapsed)
+            for buyer, product_id in pairs
+        ], batch_size=5000)
+        for product_id, total in Counter(product_id for _, product_id in pairs).items():
+            Product.objects.filter(id=product_id).update(reserved=total)
+
+        start = time.perf_counter()
+        released = reservations.release_expired()
+        elapsed = time.perf_counter() - start
+        return {
+            'released': released,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'reservations_per_s': round(released / elapsed) if elapsed else 0,
+            'leftover_reserved': Product.objects.filter(id__in=item_ids).aggregate(total=Sum('reserved'))['total'],
+        }
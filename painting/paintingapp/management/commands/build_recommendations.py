@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from paintingapp.recommendations import rebuild_neighbors
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "customers also bought" neighbours from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=10, help='Neighbours stored per product')
+
+    def handle(self, *args, **options):
+        count = rebuild_neighbors(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {count} product neighbours'))
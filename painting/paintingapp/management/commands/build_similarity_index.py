@@ -0,0 +1,26 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from paintingapp.models import Product
+from paintingapp.similarity import features_for, similarity_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the image similarity index from every product image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        items = (
+            (product_id, os.path.join(settings.MEDIA_ROOT, image))
+            for product_id, image in Product.objects.order_by('id').values_list('id', 'image').iterator(chunk_size=2000)
+            if image
+        )
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            features = (f for f in pool.map(features_for, items, chunksize=64) if f is not None)
+            count = similarity_index.rebuild(features)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} product images'))
@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paintingapp import feeds
+
+
+class Command(BaseCommand):
+    help = 'Export the full product catalog as CSV, JSONL or a segmented sitemap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('format', choices=['csv', 'jsonl', 'sitemap'])
+        parser.add_argument('output', help='Output file, or output directory for sitemaps')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output and append .gz')
+        parser.add_argument('--base-url', default='', help='Site root used for sitemap URLs, e.g. https://example.com')
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        output = options['output']
+        compress = options['gzip']
+
+        if fmt == 'sitemap':
+            base_url = options['base_url'].rstrip('/')
+            if not base_url:
+                raise CommandError('--base-url is required for sitemaps')
+            os.makedirs(output, exist_ok=True)
+            self.write(os.path.join(output, 'sitemap.xml'), feeds.sitemap_index_lines(base_url), compress)
+            for section in range(1, feeds.sitemap_section_count() + 1):
+                self.write(os.path.join(output, f'sitemap-{section}.xml'),
+                           feeds.sitemap_section_lines(base_url, section), compress)
+            return
+
+        rows = feeds.catalog_rows()
+        lines = feeds.csv_lines(rows) if fmt == 'csv' else feeds.jsonl_lines(rows)
+        self.write(output, lines, compress)
+
+    def write(self, path, lines, compress):
+        if compress:
+            path += '.gz'
+            with open(path, 'wb') as f:
+                for block in feeds.gzip_stream(lines):
+                    f.write(block)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                for line in lines:
+                    f.write(line)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
@@ -0,0 +1,50 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from paintingapp.models import Product
+from paintingapp.palette import extract
+
+
+def palette_for(item):
+    product_id, path = item
+    try:
+        return (product_id, *extract(path))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return product_id, None, None
+
+
+class Command(BaseCommand):
+    help = 'Extract the dominant colours of product images not analysed yet (bulk imports, older products)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-extract every product, not just the missing ones')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        products = Product.objects.exclude(image='')
+        if not options['all']:
+            products = products.filter(colour_bins__isnull=True)
+        items = (
+            (product_id, os.path.join(settings.MEDIA_ROOT, image))
+            for product_id, image in products.order_by('id').values_list('id', 'image').iterator(chunk_size=2000)
+        )
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            results = pool.map(palette_for, items, chunksize=64)
+            while batch := list(islice(results, options['batch_size'])):
+                extracted = [Product(id=product_id, palette=p, colour_bins=bins)
+                             for product_id, p, bins in batch if bins is not None]
+                Product.objects.bulk_update(extracted, ['palette', 'colour_bins'])
+                done += len(extracted)
+                failed += len(batch) - len(extracted)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'Extracted palettes for {done} products ({failed} failed) in {elapsed_ms:.0f} ms')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from paintingapp.dedupe import image_dhash, to_signed
+from paintingapp.models import UserSubmission
+
+
+class Command(BaseCommand):
+    help = 'Compute the duplicate-detection hash for submissions saved before hashing existed'
+
+    def handle(self, *args, **options):
+        hashed = failed = 0
+        for submission in UserSubmission.objects.filter(image_hash__isnull=True).only('id', 'image').iterator():
+            try:
+                with submission.image.open('rb') as f:
+                    image_hash = image_dhash(f)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f'Submission {submission.id}: {e}')
+                failed += 1
+                continue
+            UserSubmission.objects.filter(id=submission.id).update(image_hash=to_signed(image_hash))
+            hashed += 1
+        self.stdout.write(self.style.SUCCESS(f'Hashed {hashed} submissions ({failed} failed)'))
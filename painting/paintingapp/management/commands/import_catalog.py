@@ -0,0 +1,226 @@
+import csv
+import json
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from paintingapp import facets, prerender
+from paintingapp.artist_stats import refresh as refresh_artist_stats
+from paintingapp.models import Artist, Category, Product
+from paintingapp.similarity import features_for, similarity_index
+
+
+def ingest_image(src, dest, max_size):
+    """Copy an image into MEDIA_ROOT, downscaling it if it exceeds max_size"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if not max_size:
+        shutil.copyfile(src, dest)
+        return dest
+
+    from PIL import Image
+
+    with Image.open(src) as img:
+        if max(img.size) <= max_size:
+            shutil.copyfile(src, dest)
+        else:
+            img.thumbnail((max_size, max_size))
+            img.save(dest)
+    return dest
+
+
+def read_rows(path, fmt):
+    """Yield (row_number, row) pairs without loading the whole file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        yield from enumerate(rows, start=1)
+
+
+def text(row, field):
+    """A row's field as stripped text; JSONL values may be numbers, lists or null"""
+    value = row.get(field)
+    return '' if value is None else str(value).strip()
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream products from a CSV or JSONL file into the catalog. bulk_create skips the save signals, so '
+        'afterwards the command refreshes artist stats and the facet counts, indexes the new images for '
+        'similarity, extracts their palettes and re-renders the prerendered pages they appear on. The '
+        'in-memory search suggestions of running web workers only see the new products after a restart; '
+        'their chatbot index picks them up within CHATBOT_INDEX_REFRESH_SECONDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='CSV or JSONL file with one product per row')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--image-dir', default='', help='Directory that relative image paths are resolved against')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--max-image-size', type=int, default=0,
+                            help='Downscale images whose longest side exceeds this many pixels (0 copies as-is)')
+        parser.add_argument('--checkpoint', help='Progress file, defaults to <source>.checkpoint')
+        parser.add_argument('--resume', action='store_true', help='Skip rows already imported by a previous run')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.exists(source):
+            raise CommandError(f'{source} does not exist')
+
+        fmt = options['format'] or ('csv' if source.lower().endswith('.csv') else 'jsonl')
+        checkpoint = options['checkpoint'] or f'{source}.checkpoint'
+        batch_size = options['batch_size']
+
+        # Image names carry the run id, so files never collide with another import's
+        done, run = 0, uuid.uuid4().hex[:8]
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            done, run = state['rows'], state['run']
+            self.stdout.write(f'Resuming run {run} after row {done}')
+        self.run = run
+        self.save_checkpoint(checkpoint, done)
+
+        self.artists = dict(Artist.objects.values_list('name', 'id'))
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.image_dir = options['image_dir']
+        self.max_image_size = options['max_image_size']
+
+        rows = islice(read_rows(source, fmt), done, None)
+        imported = skipped = 0
+        # The checkpoint is written after a batch commits, so a crash in between
+        # leaves the first batch after it in the database already
+        resuming = options['resume']
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                products, images, errors = self.build_batch(batch)
+                if resuming:
+                    products, images = self.drop_imported(products, images)
+                    resuming = False
+                for row_number, error in errors:
+                    self.stderr.write(f'Row {row_number}: {error}')
+
+                # Images are written before the rows that reference them, so a
+                # crash mid-batch only leaves orphaned files that the rerun overwrites.
+                if images:
+                    list(pool.map(ingest_image, *zip(*images), chunksize=16))
+
+                with transaction.atomic():
+                    Product.objects.bulk_create(products)
+
+                done = batch[-1][0]
+                self.save_checkpoint(checkpoint, done)
+
+                imported += len(products)
+                skipped += len(errors)
+                self.stdout.write(f'Imported {imported} products ({skipped} skipped)')
+
+            self.stdout.write(self.style.SUCCESS(f'Done: {imported} imported, {skipped} skipped'))
+            self.catch_up(pool, options['workers'])
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write('Restart the web workers to add the new products to the search suggestions')
+
+    def save_checkpoint(self, path, rows):
+        with open(path, 'w') as f:
+            json.dump({'rows': rows, 'run': self.run}, f)
+
+    def catch_up(self, pool, workers):
+        """Do what the skipped post_save handlers would have done for this run's products (a resumed run's too)"""
+        refresh_artist_stats()
+        facets.bump_generation()
+        products = Product.objects.filter(image__contains=f'_{self.run}_')
+        items = (
+            (product_id, os.path.join(settings.MEDIA_ROOT, image))
+            for product_id, image in products.values_list('id', 'image').iterator(chunk_size=2000)
+        )
+        indexed = 0
+        for features in pool.map(features_for, items, chunksize=64):
+            if features is not None:
+                similarity_index.add(*features)
+                indexed += 1
+        self.stdout.write(f'Indexed {indexed} images for similarity')
+        call_command('extract_palettes', workers=workers, stdout=self.stdout)
+        if os.path.isdir(settings.PRERENDER_ROOT):
+            categories = set(products.values_list('category_id', flat=True).distinct())
+            keys = {'category-products', 'featured-products'} | {f'category-products:{pk}' for pk in categories}
+            paths = [reverse('product_detail', args=[pk]) for pk in products.values_list('id', flat=True).iterator()]
+            self.stdout.write(f'Re-rendered {prerender.regenerate(keys, paths)} prerendered pages')
+
+    def build_batch(self, batch):
+        products = []
+        images = []
+        errors = []
+        now = timezone.now()
+
+        for row_number, row in batch:
+            if not isinstance(row, dict):
+                errors.append((row_number, 'not an object'))
+                continue
+            artist_id = self.artists.get(text(row, 'artist'))
+            category_id = self.categories.get(text(row, 'category'))
+            if artist_id is None:
+                errors.append((row_number, f'unknown artist {row.get("artist")!r}'))
+                continue
+            if category_id is None:
+                errors.append((row_number, f'unknown category {row.get("category")!r}'))
+                continue
+
+            try:
+                price = Decimal(str(row.get('price') or 0))
+                stock = int(row.get('stock') or 0)
+            except (InvalidOperation, TypeError, ValueError):
+                errors.append((row_number, 'invalid price or stock'))
+                continue
+
+            src = os.path.join(self.image_dir, text(row, 'image'))
+            if not os.path.isfile(src):
+                errors.append((row_number, f'image {src} not found'))
+                continue
+
+            # The run id and row number keep names unique and make a retried batch overwrite its own files
+            stem, ext = os.path.splitext(os.path.basename(src))
+            image_name = f'products/{stem}_{self.run}_{row_number}{ext}'
+            images.append((src, os.path.join(settings.MEDIA_ROOT, image_name), self.max_image_size))
+
+            products.append(Product(
+                name=text(row, 'name'),
+                description=text(row, 'description'),
+                price=price,
+                stock=stock,
+                image=image_name,
+                category_id=category_id,
+                artist_id=artist_id,
+                is_featured=str(row.get('is_featured', '')).lower() in ('1', 'true', 'yes'),
+                created_at=now,
+            ))
+
+        return products, images, errors
+
+    def drop_imported(self, products, images):
+        """Skip products this run committed before it was interrupted, recognised by their image names"""
+        existing = set(Product.objects.filter(
+            image__in=[product.image.name for product in products]
+        ).values_list('image', flat=True))
+        if existing:
+            self.stdout.write(f'Skipping {len(existing)} rows imported before the checkpoint was written')
+        kept = [(product, image) for product, image in zip(products, images) if product.image.name not in existing]
+        return [product for product, _ in kept], [image for _, image in kept]
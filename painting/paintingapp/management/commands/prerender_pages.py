@@ -0,0 +1,30 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+from django.core.management.base import BaseCommand
+
+from paintingapp import prerender
+
+
+class Command(BaseCommand):
+    help = 'Prerender every anonymous home, category and product page to PRERENDER_ROOT across a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=50, help='Pages each worker renders per task')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        paths = list(prerender.page_paths())
+        size = options['chunk_size']
+        chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+        connections.close_all()  # workers must open their own connections, not share the parent's
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            pages = {path: keys for chunk in pool.map(prerender.build_many, chunks) for path, keys in chunk}
+        prerender.save_dependencies(pages, replace=True)
+        removed = prerender.prune(path for path, keys in pages.items() if keys is not None)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'Prerendered {len(pages)} pages ({removed} stale removed) in {elapsed_ms:.0f} ms')
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from paintingapp.artist_stats import refresh
+
+
+class Command(BaseCommand):
+    help = 'Recompute ArtistStats from products and orders (after bulk imports, or to repair drift)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('artist_ids', type=int, nargs='*', help='Only these artists (default: all)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = refresh(options['artist_ids'] or None, batch_size=options['batch_size'])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'Refreshed stats for {written} artists in {elapsed_ms:.0f} ms')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from paintingapp.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return expired cart holds to stock, once or continuously as a background sweeper'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep sweeping every this many seconds instead of exiting after one pass')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            released = release_expired(batch_size=options['batch_size'])
+            if released or not options['interval']:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.stdout.write(f'Released {released} expired reservations in {elapsed_ms:.0f} ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from paintingapp import factories
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic catalog, order history and submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--artists', type=int, default=200)
+        parser.add_argument('--customers', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--submissions', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible data')
+
+    def handle(self, *args, **options):
+        created = factories.seed(
+            categories=options['categories'],
+            artists=options['artists'],
+            products=options['products'],
+            customers=options['customers'],
+            orders=options['orders'],
+            submissions=options['submissions'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(created['product_ids'])} products, {created['orders']} orders "
+            f"({created['order_items']} items) and {created['submissions']} submissions"
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from paintingapp.fulfilment import send_notifications
+
+
+class Command(BaseCommand):
+    help = 'Email customers about order status changes, once or continuously as a background sender'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages per transaction and SMTP round')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep sending every this many seconds instead of exiting after one pass')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            sent = send_notifications(batch_size=options['batch_size'])
+            if sent or not options['interval']:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.stdout.write(f'Handled {sent} order notifications in {elapsed_ms:.0f} ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
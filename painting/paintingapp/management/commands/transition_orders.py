@@ -0,0 +1,57 @@
+import argparse
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paintingapp.fulfilment import TRANSITIONS, send_notifications, transition
+from paintingapp.models import Order
+
+
+def iso_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a YYYY-MM-DD date')
+
+
+class Command(BaseCommand):
+    help = 'Move orders to a new status in bulk and queue the customer emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('status', choices=list(TRANSITIONS))
+        parser.add_argument('--ids', type=int, nargs='+', help='Order ids to move')
+        parser.add_argument('--from-status', choices=list(TRANSITIONS), help='Move every order in this status')
+        parser.add_argument('--created-before', type=iso_date, help='Only orders placed before this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Orders per transaction (and UPDATE) when moving a large selection')
+        parser.add_argument('--no-notify', action='store_true', help='Change the status without emailing customers')
+        parser.add_argument('--send', action='store_true', help='Send the queued emails before exiting')
+
+    def handle(self, *args, **options):
+        if not options['ids'] and not options['from_status']:
+            raise CommandError('Pass --ids or --from-status')
+        orders = Order.objects.all()
+        if options['ids']:
+            orders = orders.filter(pk__in=options['ids'])
+        if options['from_status']:
+            orders = orders.filter(status=options['from_status'])
+        if options['created_before']:
+            orders = orders.filter(created_at__date__lt=options['created_before'])
+
+        start = time.perf_counter()
+        changed = 0
+        last_id = 0
+        while True:
+            batch = orders.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+            batch = list(batch)
+            if not batch:
+                break
+            last_id = batch[-1]
+            changed += len(transition(Order.objects.filter(pk__in=batch), options['status'], notify=not options['no_notify']))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f"Moved {changed} orders to {options['status']} in {elapsed_ms:.0f} ms")
+
+        if options['send']:
+            sent = send_notifications()
+            self.stdout.write(f'Sent {sent} notifications')
@@ -0,0 +1,87 @@
+"""Prometheus metrics served at /metrics.
+
+When PROMETHEUS_MULTIPROC_DIR is set in the environment before the workers start,
+prometheus_client writes every sample to a per-process mmap file in that directory
+and the endpoint merges the files, so counters are totals across all gunicorn
+workers rather than whichever worker answered the scrape.
+"""
+import os
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'painting_request_duration_seconds', 'Time to produce a response, by URL name',
+    ['view'], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter('painting_requests_total', 'Responses by URL name and status class', ['view', 'status'])
+DB_QUERIES = Histogram(
+    'painting_db_queries_per_request', 'Database queries run while serving one request, by URL name',
+    ['view'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+CACHE_LOOKUPS = Counter('painting_cache_lookups_total', 'Cache keys looked up, by cache alias and result', ['cache', 'result'])
+ORDERS_PLACED = Counter('painting_orders_placed_total', 'Orders committed')
+ORDER_REVENUE = Counter('painting_order_revenue_total', 'Sum of committed order totals')
+CART_MUTATIONS = Counter('painting_cart_mutations_total', 'Cart changes, by action and outcome', ['action', 'outcome'])
+UPLOAD_BYTES = Counter('painting_upload_bytes_total', 'Bytes of accepted image uploads, by URL name', ['view'])
+CHATBOT_INTENTS = Counter('painting_chatbot_intents_total', 'Chatbot queries, by detected intent', ['intent'])
+
+_MISSING = object()
+
+
+def instrument_cache(cache, alias):
+    """Count hits and misses on one cache connection by wrapping its get and get_many"""
+    original_get, original_get_many = cache.get, cache.get_many
+    hits, misses = CACHE_LOOKUPS.labels(alias, 'hit'), CACHE_LOOKUPS.labels(alias, 'miss')
+
+    def get(key, default=None, version=None):
+        value = original_get(key, _MISSING, version=version)
+        if value is _MISSING:
+            misses.inc()
+            return default
+        hits.inc()
+        return value
+
+    def get_many(keys, version=None):
+        keys = list(keys)
+        found = original_get_many(keys, version=version)
+        hits.inc(len(found))
+        misses.inc(len(keys) - len(found))
+        return found
+
+    cache.get = get
+    if type(cache).get_many is not BaseCache.get_many:  # the default get_many already goes through get
+        cache.get_many = get_many
+    return cache
+
+
+def instrument_caches():
+    """Instrument every cache connection, including the per-thread ones opened later"""
+    if getattr(caches.create_connection, 'instrumented', False):
+        return
+    original = caches.create_connection
+
+    def create_connection(alias):
+        return instrument_cache(original(alias), alias)
+
+    create_connection.instrumented = True
+    caches.create_connection = create_connection
+
+
+def observe_request(view, status, duration, queries):
+    REQUEST_LATENCY.labels(view).observe(duration)
+    REQUESTS.labels(view, f'{status // 100}xx').inc()
+    DB_QUERIES.labels(view).observe(queries)
+
+
+def exposition():
+    """The current metrics as (body, content type), merged across processes when running multiprocess"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,178 @@
+import logging
+import random
+from contextlib import ExitStack
+
+import brotli
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import has_vary_header, patch_cache_control, patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .compression import brotli_sequence, is_compressible, negotiate
+from .metrics import instrument_caches, observe_request
+from .perf import RequestRecorder, active_recorder, instrument_templates, request_stats
+from .throttling import check as throttle_check
+
+logger = logging.getLogger('paintingapp.perf')
+cache_logger = logging.getLogger(__name__)
+
+
+class PerformanceMiddleware:
+    """Time the ORM, templates and view code of every request.
+
+    Adds a Server-Timing header for staff (or everyone in DEBUG), feeds the
+    per-view stats shown on /__perf/ and the /metrics histograms, and logs a
+    sample of requests slower than PERF_SLOW_REQUEST_MS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_templates()
+        instrument_caches()
+
+    def __call__(self, request):
+        recorder = RequestRecorder()
+        token = active_recorder.set(recorder)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            active_recorder.reset(token)
+
+        timings = recorder.timings()
+        if self.shows_timings(request, response):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timings["db"] * 1000:.1f};desc="{recorder.query_count} queries"',
+                f'tpl;dur={timings["template"] * 1000:.1f}',
+                f'app;dur={timings["app"] * 1000:.1f}',
+                f'total;dur={timings["total"] * 1000:.1f}',
+            ])
+
+        match = request.resolver_match
+        view_name = match.view_name if match else '<unresolved>'
+        duplicates = recorder.duplicates()
+        request_stats.record(view_name, timings['total'], recorder.query_count, duplicates)
+        observe_request(view_name, response.status_code, timings['total'], recorder.query_count)
+
+        if (timings['total'] * 1000 >= settings.PERF_SLOW_REQUEST_MS
+                and random.random() < settings.PERF_SLOW_REQUEST_SAMPLE_RATE):
+            logger.warning(
+                'Slow request %s %s (%s): %.0f ms, %d queries (%.0f ms), template %.0f ms, duplicates: %s',
+                request.method, request.path, view_name, timings['total'] * 1000,
+                recorder.query_count, timings['db'] * 1000, timings['template'] * 1000,
+                '; '.join(f'{count}x {sql[:120]}' for sql, count in duplicates) or 'none',
+            )
+        return response
+
+    def shows_timings(self, request, response):
+        """Timings tell an attacker which requests are expensive, so only staff see them outside DEBUG"""
+        if settings.DEBUG:
+            return True
+        if 'public' in response.get('Cache-Control', ''):
+            return False  # a shared cache would hand a staff member's timings to everyone
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+
+class ThrottleMiddleware:
+    """Apply THROTTLE_RATES to every URL name listed there whose view is not already decorated with @throttle"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'throttled', False):
+            return None
+        return throttle_check(request, request.resolver_match.url_name)
+
+
+class SharedCacheMiddleware:
+    """Let shared caches keep the pages of the URL names in SHARED_CACHE_VIEWS.
+
+    Those pages leave everything per-visitor to the session_state endpoint. If
+    one still ends up varying on Cookie or setting a cookie (the session, CSRF
+    and messages middleware below do either once a view touches them), it is
+    marked private instead, so a CDN never hands one visitor's page to another.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        match = request.resolver_match
+        if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+                or match is None or match.url_name not in settings.SHARED_CACHE_VIEWS):
+            return response
+        if response.cookies or has_vary_header(response, 'Cookie'):
+            cache_logger.warning('%s was listed in SHARED_CACHE_VIEWS but depends on cookies', match.view_name)
+            patch_cache_control(response, private=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.SHARED_CACHE_SECONDS)
+        return response
+
+
+def uses_csrf_token(request, response):
+    """Whether the page rendered a CSRF token; CsrfViewMiddleware re-sends the cookie exactly then"""
+    if settings.CSRF_USE_SESSIONS:
+        return 'CSRF_COOKIE' in request.META  # no cookie to go by, so assume the page used it
+    return settings.CSRF_COOKIE_NAME in response.cookies
+
+
+class CompressionMiddleware:
+    """Brotli or gzip-encode dynamic responses, chunk by chunk for streaming ones.
+
+    Pages that carry a CSRF token are BREACH targets: an attacker who can reflect
+    guesses next to the secret learns from the compressed length. Those pages are
+    only gzip-encoded, with a random-length gzip header (Heal the Breach) to blur
+    the length, on top of Django masking the token afresh on every render.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not is_compressible(response.get('Content-Type', '')):
+            return response
+        if response.streaming and response.is_async:
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        carries_secret = uses_csrf_token(request, response)
+        encoding = negotiate(request, ('gzip',) if carries_secret else ('br', 'gzip'))
+        if encoding is None:
+            return response
+        padding = settings.COMPRESSION_BREACH_PADDING if carries_secret else None
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(
+                    response.streaming_content, settings.COMPRESSION_BROTLI_QUALITY
+                )
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content, max_random_bytes=padding)
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=padding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The encoded bytes differ from what a strong ETag promised
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paintingapp', '0006_productneighbor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersubmission',
+            name='image_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
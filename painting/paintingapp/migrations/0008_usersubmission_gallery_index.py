@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paintingapp', '0007_usersubmission_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersubmission',
+            index=models.Index(fields=['is_approved', '-created_at', '-id'], name='submission_gallery_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paintingapp', '0013_artiststats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='colour_bins',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='palette',
+            field=models.CharField(blank=True, editable=False, max_length=27),
+        ),
+    ]
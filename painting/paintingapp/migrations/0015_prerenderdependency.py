@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paintingapp', '0014_product_palette'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrerenderDependency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('path', models.CharField(db_index=True, max_length=255)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'path'), name='unique_prerender_dependency')],
+            },
+        ),
+    ]
@@ -36,19 +36,89 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='products/')
     stock = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0, editable=False)  # units held in carts, see paintingapp.reservations
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='products')
     created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)  # part of the cached product card key
     is_featured = models.BooleanField(default=False)
+    palette = models.CharField(max_length=27, blank=True, editable=False)  # dominant colours as hex, see paintingapp.palette
+    colour_bins = models.BigIntegerField(null=True, blank=True, editable=False)  # signed 64-bit mask of the quantized palette
+
+    class Meta:
+        # Artist portfolios page through an artist's works newest id first
+        indexes = [models.Index(fields=['artist', '-id'], name='product_artist_recent_idx')]
 
     def __str__(self):
         return self.name
 
+    @property
+    def available(self):
+        """Stock not currently held in someone's cart"""
+        return max(self.stock - self.reserved, 0)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save handlers tell whether a save replaced the image
+        if 'image' in field_names:
+            instance._loaded_image = values[field_names.index('image')]
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.created_at:
             self.created_at = timezone.now()
         super().save(*args, **kwargs)
 
+class ArtistStats(models.Model):
+    """Running totals for an artist's portfolio, kept current by paintingapp.artist_stats"""
+    artist = models.OneToOneField(Artist, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    work_count = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_upload_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.artist_id}: {self.work_count} works, {self.units_sold} sold"
+
+class PrerenderDependency(models.Model):
+    """A prerendered page (by path) to regenerate when the thing named by key changes, see paintingapp.prerender"""
+    key = models.CharField(max_length=64)
+    path = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['key', 'path'], name='unique_prerender_dependency')]
+
+    def __str__(self):
+        return f"{self.path} <- {self.key}"
+
+class StockReservation(models.Model):
+    """Units of a product held for one shopper's cart until expires_at"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'product'], name='one_reservation_per_cart_line')]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.user_id} until {self.expires_at:%H:%M}"
+
+class ProductNeighbor(models.Model):
+    """A precomputed "customers also bought" link, rebuilt by the build_recommendations command"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbor_of')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        indexes = [models.Index(fields=['product', 'rank'])]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.neighbor_id} ({self.score:.3f})"
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -86,10 +156,58 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
+class OrderNotification(models.Model):
+    """An email telling the customer their order moved to status, queued until sent_at is set"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='notifications')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Order {self.order_id} {self.status} ({'sent' if self.sent_at else 'queued'})"
+
+class ArchivedOrder(models.Model):
+    """A closed Order moved out of the hot table by `manage.py archive_orders`.
+
+    Columns match Order's one for one (same ids, same order), so the two tables
+    can be read together with a UNION.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    first_name = models.CharField(max_length=100, null=True, blank=True)
+    last_name = models.CharField(max_length=100, null=True, blank=True)
+    email = models.EmailField(null=True, blank=True)
+    phone = models.CharField(max_length=15, null=True, blank=True)
+    address = models.TextField(null=True, blank=True)
+    city = models.CharField(max_length=100, null=True, blank=True)
+    pincode = models.CharField(max_length=10, null=True, blank=True)
+    payment_method = models.CharField(max_length=50)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Archived order {self.id} - {self.user_id}"
+
+class ArchivedOrderItem(models.Model):
+    """An OrderItem of an ArchivedOrder, keeping its original id"""
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_order_items')
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id}"
+
 class UserSubmission(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     image = models.ImageField(upload_to='user_submissions/')
+    image_hash = models.BigIntegerField(null=True, blank=True)  # signed 64-bit dHash, see paintingapp.dedupe
     artist = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_approved = models.BooleanField(default=False)
@@ -99,6 +217,7 @@ class UserSubmission(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['is_approved', '-created_at', '-id'], name='submission_gallery_idx')]
 
 class CustomizedPainting(models.Model):
     STYLE_CHOICES = [
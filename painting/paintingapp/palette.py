@@ -0,0 +1,185 @@
+"""Dominant colours of product images, and the colour filter built on them.
+
+Each image is downsampled and its pixels clustered with a few rounds of
+vectorized k-means; the clusters covering at least MIN_SHARE of the picture
+become the product's palette. Two compact columns keep the result:
+Product.palette (the colours as hex, most dominant first) and
+Product.colour_bins, a 64-bit mask of the palette quantized to 4 levels per RGB
+channel (the same bins as the similarity histogram). A colour filter never
+looks at an image: the bins reaching within the requested distance of the query
+colour form a mask, and SQL keeps the products whose mask shares a bit with it.
+No palette colour within the distance is missed; ones up to a bin's diagonal
+further may also match.
+
+Extraction runs on a background thread once a new product commits, and
+`manage.py extract_palettes` backfills the rest (bulk imports, older products).
+"""
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+from .dedupe import to_signed
+from .models import Product
+from .similarity import open_downsampled
+
+logger = logging.getLogger(__name__)
+
+PALETTE_SIZE = 4
+MIN_SHARE = 0.1  # smaller clusters are accents, not what the painting "looks like"
+SAMPLE_SIZE = 64
+MAX_ITERATIONS = 12
+
+# Lowest corner of each of the 64 quantized bins, indexed by (r >> 6) << 4 | (g >> 6) << 2 | (b >> 6)
+LEVELS = np.arange(4) * 64
+BIN_CORNERS = np.stack(np.meshgrid(LEVELS, LEVELS, LEVELS, indexing='ij'), axis=-1).reshape(-1, 3)
+
+COLOURS = {
+    'red': (200, 30, 40),
+    'orange': (240, 130, 30),
+    'yellow': (240, 210, 50),
+    'green': (50, 150, 60),
+    'teal': (30, 140, 140),
+    'blue': (40, 80, 190),
+    'purple': (120, 60, 160),
+    'pink': (235, 130, 170),
+    'brown': (120, 75, 40),
+    'black': (20, 20, 20),
+    'grey': (128, 128, 128),
+    'white': (240, 240, 235),
+}
+HEX_COLOUR = re.compile(r'#?([0-9a-fA-F]{6})')
+
+
+def kmeans(pixels, k, iterations=MAX_ITERATIONS):
+    """Return (centres, counts) clustering float pixels of shape (n, 3) into at most k colours.
+
+    Starts from pixels at evenly spaced brightness quantiles, so the result is
+    deterministic; empty clusters keep their previous centre.
+    """
+    order = np.argsort(pixels.sum(axis=1), kind='stable')
+    centres = pixels[order[(np.arange(k) * 2 + 1) * len(pixels) // (2 * k)]]
+    squared = (pixels ** 2).sum(axis=1)[:, None]
+    for _ in range(iterations):
+        # |p - c|^2 for every pixel/centre pair as one matrix product
+        distances = squared - 2 * pixels @ centres.T + (centres ** 2).sum(axis=1)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=k) for c in range(3)], axis=1)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centres)
+        done = np.abs(moved - centres).max() < 1
+        centres = moved
+        if done:
+            break
+    return centres, counts
+
+
+def dominant_colours(img, k=PALETTE_SIZE):
+    """[(r, g, b), share] for the clusters covering at least MIN_SHARE of img, largest first"""
+    rgb = img.convert('RGB').resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.BILINEAR)
+    pixels = np.asarray(rgb, dtype=np.float32).reshape(-1, 3)
+    centres, counts = kmeans(pixels, k)
+    shares = counts / counts.sum()
+    return [
+        (tuple(int(v) for v in np.clip(np.rint(centres[i]), 0, 255)), float(shares[i]))
+        for i in np.argsort(-shares, kind='stable') if shares[i] >= MIN_SHARE
+    ]
+
+
+def colour_bin(rgb):
+    r, g, b = (v >> 6 for v in rgb)
+    return r << 4 | g << 2 | b
+
+
+def encode(colours):
+    """(palette, colour_bins) column values for dominant_colours() output"""
+    palette = ' '.join('%02x%02x%02x' % rgb for rgb, _ in colours)
+    mask = 0
+    for rgb, _ in colours:
+        mask |= 1 << colour_bin(rgb)
+    return palette, to_signed(mask)
+
+
+def extract(source):
+    with open_downsampled(source) as img:
+        return encode(dominant_colours(img))
+
+
+def parse_colour(value):
+    """An (r, g, b) tuple for a colour name or 6-digit hex code; raises ValueError otherwise"""
+    value = value.strip().lower()
+    if value in COLOURS:
+        return COLOURS[value]
+    match = HEX_COLOUR.fullmatch(value)
+    if not match:
+        raise ValueError(f'Unknown colour {value!r}')
+    code = int(match.group(1), 16)
+    return code >> 16, (code >> 8) & 0xFF, code & 0xFF
+
+
+def colour_mask(rgb, distance):
+    """Signed mask of the bins holding any colour within distance (RGB units) of rgb"""
+    nearest = np.clip(np.array(rgb), BIN_CORNERS, BIN_CORNERS + 63)  # each bin's closest point to rgb
+    near = np.flatnonzero(np.linalg.norm(nearest - np.array(rgb), axis=1) <= distance)
+    return to_signed(sum(1 << int(i) for i in near))
+
+
+def colour_filter(params):
+    """The bin mask for ?colour=...&colour_distance=..., or None without a colour; raises ValueError if malformed"""
+    if not params.get('colour'):
+        return None
+    distance = float(params.get('colour_distance') or settings.COLOUR_MATCH_DISTANCE)
+    if not 0 <= distance <= 442:  # 442 is the length of the RGB cube's diagonal
+        raise ValueError('colour_distance must be between 0 and 442')
+    return colour_mask(parse_colour(params['colour']), distance)
+
+
+def colour_options(params):
+    """The named colours as search-page links, each toggling ?colour= (back on page 1)"""
+    selected = params.get('colour', '').strip().lower()
+    options = []
+    for name, rgb in COLOURS.items():
+        query = params.copy()
+        query.pop('page', None)
+        if name == selected:
+            query.pop('colour')
+        else:
+            query['colour'] = name
+        options.append({'name': name, 'hex': '#%02x%02x%02x' % rgb, 'selected': name == selected,
+                        'url': '?' + query.urlencode()})
+    return options
+
+
+def apply_colour(queryset, mask):
+    """Products with a palette colour in one of mask's bins; those not yet analysed never match"""
+    return queryset.alias(colour_hits=F('colour_bins').bitand(mask)).filter(
+        colour_bins__isnull=False
+    ).exclude(colour_hits=0)
+
+
+def analyse_product(product_id, image):
+    """Extract and store one product's palette; run on the background executor"""
+    try:
+        with image.open('rb') as f:
+            palette, bins = extract(f)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('Could not extract colours for product %s: %s', product_id, e)
+        return
+    try:
+        Product.objects.filter(pk=product_id).update(palette=palette, colour_bins=bins)
+    finally:
+        connection.close()  # this thread's own connection
+
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='palette')
+
+
+def schedule(product):
+    """Queue palette extraction for a just-committed product, off the request thread"""
+    executor.submit(analyse_product, product.pk, product.image)
@@ -0,0 +1,122 @@
+import contextvars
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from django.template.base import Template
+
+SAMPLES_PER_VIEW = 1000
+DUPLICATES_PER_VIEW = 20  # repeated statements kept per view for /__perf/
+
+active_recorder = contextvars.ContextVar('active_recorder', default=None)
+
+
+class RequestRecorder:
+    """Collects query and template timings for a single request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.template_query_time = 0.0
+        self.template_depth = 0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook; params are separate, so sql is already a signature
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            if self.template_depth:
+                self.template_query_time += elapsed
+            self.signatures[sql] += 1
+
+    def duplicates(self, limit=5):
+        """Statements run more than once in this request, the usual sign of an N+1"""
+        return [(sql, count) for sql, count in self.signatures.most_common(limit) if count > 1]
+
+    def timings(self):
+        total = time.perf_counter() - self.started
+        template = self.template_time - self.template_query_time
+        return {
+            'db': self.query_time,
+            'template': template,
+            'app': max(total - self.query_time - template, 0.0),
+            'total': total,
+        }
+
+
+def instrument_templates():
+    """Wrap Template.render once so the active recorder sees time spent rendering"""
+    if getattr(Template.render, 'instrumented', False):
+        return
+    original = Template.render
+
+    def render(self, context):
+        recorder = active_recorder.get()
+        if recorder is None:
+            return original(self, context)
+        recorder.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            recorder.template_depth -= 1
+            if not recorder.template_depth:  # included templates are already inside the outer timing
+                recorder.template_time += time.perf_counter() - start
+
+    render.instrumented = True
+    Template.render = render
+
+
+class RequestStats:
+    """Recent request samples per URL name, kept in this process"""
+
+    def __init__(self, size=SAMPLES_PER_VIEW):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=size))
+        self.duplicates = defaultdict(Counter)
+
+    def record(self, view_name, duration, queries, duplicates):
+        with self.lock:
+            self.samples[view_name].append((duration, queries))
+            counts = self.duplicates[view_name]
+            for sql, count in duplicates:
+                counts[sql] += count
+            # Views with per-request SQL text would otherwise grow this without bound
+            if len(counts) > 2 * DUPLICATES_PER_VIEW:
+                self.duplicates[view_name] = Counter(dict(counts.most_common(DUPLICATES_PER_VIEW)))
+
+    def summary(self):
+        rows = []
+        with self.lock:
+            items = [(name, list(samples), self.duplicates[name].most_common(3)) for name, samples in self.samples.items()]
+        for name, samples, duplicates in items:
+            durations = sorted(duration for duration, _ in samples)
+            queries = [count for _, count in samples]
+            rows.append({
+                'view': name,
+                'requests': len(samples),
+                'p50_ms': percentile(durations, 50) * 1000,
+                'p95_ms': percentile(durations, 95) * 1000,
+                'max_ms': durations[-1] * 1000,
+                'avg_queries': sum(queries) / len(queries),
+                'max_queries': max(queries),
+                'duplicates': duplicates,
+            })
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+request_stats = RequestStats()
@@ -0,0 +1,266 @@
+"""Static HTML copies of the anonymous catalog pages.
+
+home, category_list, category_detail and product_detail are rendered as an
+anonymous visitor sees them into PRERENDER_ROOT/<path>/index.html (plus .br and
+.gz siblings), which the front proxy serves without reaching Django.
+
+While a page renders, every Product, Artist, Category and UserSubmission it
+loads is recorded as a key ("product:12"), next to the page's own list keys
+("featured-products", "category-products:3"). PrerenderDependency maps each key
+back to the pages that used it. When one of those models is saved or deleted,
+the signals hand changes() of it to schedule(), and a background thread
+re-renders only the pages depending on those keys (plus the object's own page,
+which is how new products and categories appear). Keys and paths scheduled while
+that thread is busy are merged into one pending set, so a burst of saves to the
+same objects costs one pass rather than one each. `manage.py prerender_pages`
+rebuilds everything across a process pool.
+
+Stock and reservation counters are moved with queryset updates, which send no
+signals, so reservations and fulfilment call stock_changed() with the products
+they touched.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.db.models.signals import post_init
+from django.http import Http404, HttpRequest
+from django.urls import Resolver404, resolve, reverse
+
+from .compression import compress_file
+from .models import Artist, Category, PrerenderDependency, Product, UserSubmission
+
+logger = logging.getLogger(__name__)
+
+RECORDED = (Product, Artist, Category, UserSubmission)
+# Pages are rewritten far more often than static assets; quality 11 would cost ~150 ms each
+BROTLI_QUALITY = 9
+
+
+class Page:
+    """A prerendered view: the list keys it depends on (formatted with its URL kwargs) and the models it records"""
+    def __init__(self, keys=(), records=RECORDED):
+        self.keys = keys
+        self.records = records
+
+
+PAGES = {
+    'home': Page(keys=('featured-products', 'featured-artists', 'categories', 'submissions')),
+    # Only the counts of each category's products show, so record the categories and not thousands of products
+    'category_list': Page(keys=('categories', 'category-products'), records=(Category,)),
+    'category_detail': Page(keys=('category-products:{pk}',)),
+    'product_detail': Page(),
+}
+
+_recording = threading.local()
+
+
+def object_key(instance):
+    return f'{instance._meta.model_name}:{instance.pk}'
+
+
+def record(sender, instance, **kwargs):
+    keys = getattr(_recording, 'keys', None)
+    if keys is not None and instance.pk is not None and sender in _recording.models:
+        keys.add(object_key(instance))
+
+
+for model in RECORDED:
+    post_init.connect(record, sender=model, dispatch_uid=f'prerender-{model._meta.model_name}')
+
+
+def page_paths():
+    """The path of every page prerender_pages builds"""
+    yield reverse('home')
+    yield reverse('category_list')
+    for pk in Category.objects.order_by('pk').values_list('pk', flat=True):
+        yield reverse('category_detail', args=[pk])
+    for pk in Product.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=2000):
+        yield reverse('product_detail', args=[pk])
+
+
+def render(path):
+    """Return (html, keys) for an anonymous GET of path, or None if path is not a prerendered page (any more)"""
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    page = PAGES.get(match.url_name)
+    if page is None:
+        return None
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.META['SERVER_NAME'] = 'localhost'
+    request.META['SERVER_PORT'] = '80'
+    request.user = AnonymousUser()
+    request.resolver_match = match
+    _recording.keys = {key.format(**match.kwargs) for key in page.keys}
+    _recording.models = page.records
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    except Http404:
+        return None
+    finally:
+        keys, _recording.keys = _recording.keys, None
+    if response.status_code != 200:
+        return None
+    return response.content, keys
+
+
+def file_for(path):
+    return os.path.join(settings.PRERENDER_ROOT, path.strip('/'), 'index.html')
+
+
+def write_page(path, html):
+    target = file_for(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target + '.tmp', 'wb') as f:
+        f.write(html)
+    os.replace(target + '.tmp', target)  # the proxy never serves a half-written page
+    compress_file(target, settings.COMPRESSION_MIN_BYTES, brotli_quality=BROTLI_QUALITY)
+
+
+def remove_page(path):
+    target = file_for(path)
+    for name in (target, target + '.br', target + '.gz'):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def build(path):
+    """Render path to disk (or remove it if it is gone); returns its dependency keys or None"""
+    rendered = render(path)
+    if rendered is None:
+        remove_page(path)
+        return None
+    html, keys = rendered
+    write_page(path, html)
+    return keys
+
+
+def build_many(paths):
+    """[(path, keys)] for each path built; run by the prerender_pages process pool"""
+    return [(path, build(path)) for path in paths]
+
+
+def save_dependencies(pages, replace=False):
+    """Store {path: keys} (None for removed pages), replacing the old rows of those paths, or of every path"""
+    rows = [PrerenderDependency(key=key, path=path) for path, keys in pages.items() if keys for key in sorted(keys)]
+    with transaction.atomic():
+        old = PrerenderDependency.objects.all()
+        if not replace:
+            old = old.filter(path__in=list(pages))
+        old.delete()
+        PrerenderDependency.objects.bulk_create(rows, batch_size=1000)
+
+
+def prune(paths):
+    """Remove prerendered pages on disk that are not in paths (deleted products and categories)"""
+    keep = {file_for(path) for path in paths}
+    removed = 0
+    for directory, _, files in os.walk(settings.PRERENDER_ROOT):
+        target = os.path.join(directory, 'index.html')
+        if 'index.html' in files and target not in keep:
+            for name in ('index.html', 'index.html.br', 'index.html.gz'):
+                if name in files:
+                    os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
+
+
+def changes(instance):
+    """(keys, paths): what a save or delete of instance makes stale, and its own page if it has one"""
+    keys = {object_key(instance)}
+    paths = set()
+    if isinstance(instance, Product):
+        keys |= {'category-products', f'category-products:{instance.category_id}'}
+        if instance.is_featured:
+            keys.add('featured-products')
+        paths.add(reverse('product_detail', args=[instance.pk]))
+    elif isinstance(instance, Artist):
+        if instance.is_featured:
+            keys.add('featured-artists')
+    elif isinstance(instance, Category):
+        keys.add('categories')
+        paths.add(reverse('category_detail', args=[instance.pk]))
+    elif isinstance(instance, UserSubmission):
+        if instance.is_approved:
+            keys.add('submissions')
+    return keys, paths
+
+
+def regenerate(keys, paths=()):
+    """Rebuild paths and every page depending on one of keys; returns the number of pages rebuilt"""
+    paths = set(paths)
+    paths.update(PrerenderDependency.objects.filter(key__in=keys).values_list('path', flat=True))
+    save_dependencies({path: build(path) for path in sorted(paths)})
+    return len(paths)
+
+
+def regenerate_in_background(keys, paths):
+    try:
+        regenerate(keys, paths)
+    except Exception:
+        # Nobody waits on the future, so this is the only trace of a failed pass
+        logger.exception('Could not re-render pages for keys %s and paths %s', sorted(keys), sorted(paths))
+    finally:
+        connection.close()  # this thread's own connection
+
+
+class Backlog:
+    """Keys and paths waiting for the background thread, merged into one set of each"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys, self.paths = set(), set()
+        self.draining = False
+
+    def add(self, keys, paths):
+        """Merge in keys and paths; returns True if no drain is queued and the caller must submit one"""
+        with self.lock:
+            self.keys.update(keys)
+            self.paths.update(paths)
+            idle, self.draining = not self.draining, True
+        return idle
+
+    def take(self):
+        """Everything pending as (keys, paths), emptying the backlog; None, ending the drain, once it is empty"""
+        with self.lock:
+            if not self.keys and not self.paths:
+                self.draining = False
+                return None
+            batch = self.keys, self.paths
+            self.keys, self.paths = set(), set()
+        return batch
+
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prerender')
+backlog = Backlog()
+
+
+def drain():
+    """Regenerate whatever is pending, again and again until nothing new arrived meanwhile"""
+    while (batch := backlog.take()) is not None:
+        regenerate_in_background(*batch)
+
+
+def schedule(keys, paths):
+    """Queue regeneration off the request thread; a no-op until prerender_pages has built the site"""
+    if os.path.isdir(settings.PRERENDER_ROOT) and backlog.add(keys, paths):
+        executor.submit(drain)
+
+
+def stock_changed(product_ids):
+    """Once the transaction commits, re-render the pages showing the stock or availability of product_ids"""
+    product_ids = sorted(set(product_ids))
+    if product_ids:
+        keys = {f'product:{pk}' for pk in product_ids}
+        paths = {reverse('product_detail', args=[pk]) for pk in product_ids}
+        transaction.on_commit(lambda: schedule(keys, paths))
@@ -0,0 +1,151 @@
+import base64
+import hashlib
+import io
+
+import numpy as np
+from PIL import Image
+
+from django.core.cache import cache
+
+PREVIEW_SIZES = (256, 512, 1024)
+CACHE_TIMEOUT = 60 * 60 * 24
+
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def box_blur(a, radius):
+    """Separable box blur using cumulative sums, so cost does not grow with radius"""
+    if radius < 1:
+        return a
+    window = 2 * radius + 1
+    for axis in (0, 1):
+        pad = [(0, 0)] * a.ndim
+        pad[axis] = (radius + 1, radius)
+        summed = np.cumsum(np.pad(a, pad, mode='edge'), axis=axis, dtype=np.float32)
+        ahead = [slice(None)] * a.ndim
+        behind = [slice(None)] * a.ndim
+        ahead[axis] = slice(window, None)
+        behind[axis] = slice(None, -window)
+        a = (summed[tuple(ahead)] - summed[tuple(behind)]) / window
+    return a
+
+
+def luminance(a):
+    return a @ LUMA
+
+
+def saturate(a, amount):
+    gray = luminance(a)[..., None]
+    return gray + (a - gray) * amount
+
+
+def posterize(a, levels):
+    step = 255 / (levels - 1)
+    return np.round(a / step) * step
+
+
+def edge_strength(gray):
+    gy, gx = np.gradient(gray)
+    return np.hypot(gx, gy)
+
+
+def oil(a):
+    smooth = box_blur(a, max(1, a.shape[1] // 200))
+    return saturate(posterize(smooth, 12), 1.3)
+
+
+def watercolor(a):
+    washed = posterize(box_blur(a, max(2, a.shape[1] // 120)), 8)
+    edges = np.clip(edge_strength(luminance(washed)) / 40, 0, 1)[..., None]
+    paper = washed * 0.85 + 255 * 0.15  # pigments never fully cover the paper
+    return paper * (1 - 0.35 * edges)
+
+
+def sketch(a):
+    gray = luminance(a)
+    blurred = box_blur(255 - gray, max(2, a.shape[1] // 100))
+    dodge = np.clip(gray * 255 / np.maximum(255 - blurred, 1), 0, 255)  # colour dodge blend
+    return np.repeat(dodge[..., None], 3, axis=2)
+
+
+def popart(a):
+    bold = posterize(saturate(a, 2.0), 3)
+    edges = edge_strength(luminance(box_blur(a, 1))) > 30
+    bold[edges] = 0
+    return bold
+
+
+def impressionist(a):
+    h, w = a.shape[:2]
+    reach = max(1, w // 150)
+    # A fixed seed keeps the dab pattern, and therefore the cached preview, deterministic
+    rng = np.random.default_rng(0)
+    ys = np.clip(np.arange(h)[:, None] + rng.integers(-reach, reach + 1, (h, w)), 0, h - 1)
+    xs = np.clip(np.arange(w)[None, :] + rng.integers(-reach, reach + 1, (h, w)), 0, w - 1)
+    return saturate(box_blur(a[ys, xs], 1), 1.4)
+
+
+STYLES = {
+    'oil': oil,
+    'watercolor': watercolor,
+    'sketch': sketch,
+    'popart': popart,
+    'impressionist': impressionist,
+}
+
+# (base colour, border width as a fraction of the shorter side, bevel strength)
+FRAMES = {
+    'classic': ((122, 79, 45), 0.07, 0.35),
+    'modern': ((60, 63, 66), 0.03, 0.15),
+    'vintage': ((191, 155, 48), 0.09, 0.45),
+}
+
+
+def add_frame(a, frame):
+    if frame not in FRAMES:
+        return a
+    colour, thickness, bevel = FRAMES[frame]
+    h, w = a.shape[:2]
+    border = max(2, int(min(h, w) * thickness))
+    height, width = h + 2 * border, w + 2 * border
+
+    # Distance to the nearest outer edge drives a sine-shaped bevel across the moulding
+    ys = np.minimum(np.arange(height), np.arange(height)[::-1])[:, None]
+    xs = np.minimum(np.arange(width), np.arange(width)[::-1])[None, :]
+    depth = np.minimum(ys, xs).astype(np.float32) / border
+    shade = 1 - bevel + bevel * np.sin(np.pi * np.clip(depth, 0, 1))
+
+    canvas = shade[..., None] * np.array(colour, dtype=np.float32)
+    canvas[border:border + h, border:border + w] = a
+    return canvas
+
+
+def render(img, style, frame, size):
+    """Return the styled, framed preview of a PIL image as a uint8 RGB array.
+
+    The image is shrunk in place before anything else touches its pixels; JPEGs
+    are decoded at a reduced scale via draft() and only the thumbnail is converted.
+    """
+    img.draft('RGB', (size, size))
+    if img.mode in ('1', 'P'):
+        img = img.convert('RGB')  # palette images would be resized with nearest-neighbour sampling
+    img.thumbnail((size, size))
+    a = np.asarray(img.convert('RGB'), dtype=np.float32)
+    a = STYLES[style](a)
+    a = add_frame(np.clip(a, 0, 255), frame)
+    return a.astype(np.uint8)
+
+
+def preview_data_uri(image_bytes, style, frame, size):
+    """Render (or fetch from cache) a JPEG preview and return it as a data: URI"""
+    digest = hashlib.sha1(image_bytes).hexdigest()
+    key = f'preview:{digest}:{style}:{frame}:{size}'
+    uri = cache.get(key)
+    if uri is None:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            pixels = render(img, style, frame, size)
+        out = io.BytesIO()
+        Image.fromarray(pixels).save(out, 'JPEG', quality=85)
+        uri = 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+        cache.set(key, uri, CACHE_TIMEOUT)
+    return uri
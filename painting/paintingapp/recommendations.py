@@ -0,0 +1,110 @@
+import numpy as np
+from scipy import sparse
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .archive import order_lines
+from .models import ArchivedOrderItem, OrderItem, Product, ProductNeighbor
+
+RELATED_COUNT = 4
+BEST_SELLERS_TIMEOUT = 60 * 60  # sales ranks drift slowly; don't aggregate a category on every product view
+
+
+def co_purchase_neighbors(order_ids, product_ids, top_k):
+    """Return (product, neighbor, score, rank) tuples from parallel arrays of order and product ids.
+
+    Baskets become rows of a binary order x product matrix X, so X.T @ X counts
+    how often two products were bought together. Counts are cosine-normalised
+    to keep best sellers from becoming everyone's neighbour.
+    """
+    if len(order_ids) == 0:
+        return []
+
+    orders, order_index = np.unique(order_ids, return_inverse=True)
+    products, product_index = np.unique(product_ids, return_inverse=True)
+    basket = sparse.csr_matrix(
+        (np.ones(len(order_index), dtype=np.float32), (order_index, product_index)),
+        shape=(len(orders), len(products)),
+    )
+    basket.data[:] = 1  # duplicate lines for one product in an order count once
+
+    co = (basket.T @ basket).tocsr()
+    norms = np.sqrt(co.diagonal())
+    co.setdiag(0)
+    co.eliminate_zeros()
+
+    # Scale row i by 1/norm_i and column j by 1/norm_j without densifying
+    co = sparse.diags(1 / norms) @ co @ sparse.diags(1 / norms)
+    co = co.tocsr()
+
+    links = []
+    for row in range(co.shape[0]):
+        start, end = co.indptr[row], co.indptr[row + 1]
+        if start == end:
+            continue
+        scores = co.data[start:end]
+        columns = co.indices[start:end]
+        if len(scores) > top_k:
+            keep = np.argpartition(-scores, top_k)[:top_k]
+            scores, columns = scores[keep], columns[keep]
+        order = np.argsort(-scores, kind='stable')
+        for rank, position in enumerate(order):
+            links.append((int(products[row]), int(products[columns[position]]), float(scores[position]), rank))
+    return links
+
+
+def rebuild_neighbors(top_k=10, batch_size=5000):
+    items = order_lines().iterator(chunk_size=10000)  # archived orders are still baskets
+    pairs = np.fromiter(items, dtype=np.dtype((np.int64, 2)))
+    links = co_purchase_neighbors(pairs[:, 0], pairs[:, 1], top_k)
+
+    with transaction.atomic():
+        ProductNeighbor.objects.all().delete()
+        ProductNeighbor.objects.bulk_create(
+            (ProductNeighbor(product_id=p, neighbor_id=n, score=s, rank=r) for p, n, s, r in links),
+            batch_size=batch_size,
+        )
+    return len(links)
+
+
+def units_sold_subquery(model):
+    """Units of the outer product sold in model's order items, 0 if none"""
+    units = (
+        model.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        .annotate(units=Sum('quantity')).values('units')
+    )
+    return Coalesce(Subquery(units, output_field=IntegerField()), Value(0))
+
+
+def best_sellers(category_id, count):
+    """Ids of a category's count best selling products, cached for BEST_SELLERS_TIMEOUT"""
+    key = f'best_sellers:{category_id}:{count}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            Product.objects.filter(category_id=category_id)
+            .annotate(sold=units_sold_subquery(OrderItem) + units_sold_subquery(ArchivedOrderItem))
+            .order_by('-sold', F('created_at').desc(nulls_last=True), 'id')
+            .values_list('id', flat=True)[:count]
+        )
+        cache.set(key, ids, BEST_SELLERS_TIMEOUT)
+    return ids
+
+
+def related_products(product, count=RELATED_COUNT):
+    """Co-purchase neighbours of a product, topped up with the category's best sellers"""
+    related = list(
+        Product.objects.filter(neighbor_of__product=product)
+        .select_related('artist')
+        .order_by('neighbor_of__rank')[:count]
+    )
+    if len(related) < count:
+        seen = {product.pk} | {p.pk for p in related}
+        # Enough ids to fill up after skipping this product and its neighbours
+        ids = [pk for pk in best_sellers(product.category_id, 2 * count + 1) if pk not in seen]
+        products = Product.objects.select_related('artist').in_bulk(ids)
+        related += [products[pk] for pk in ids if pk in products][:count - len(related)]
+    return related
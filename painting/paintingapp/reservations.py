@@ -0,0 +1,139 @@
+"""Stock held for shoppers' carts.
+
+Product.reserved counts the units currently held and StockReservation records
+who holds them. Every change is a conditional UPDATE of the one product row
+(``stock - reserved`` must cover the request), so racing buyers cannot oversell
+and writers for different products never wait on each other.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import prerender
+from .models import Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f'Not enough stock for products {sorted(product_ids)}')
+        self.product_ids = product_ids
+
+
+def expiry():
+    return timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+
+
+def _hold(product_id, quantity):
+    return Product.objects.filter(
+        pk=product_id, stock__gte=F('reserved') + quantity
+    ).update(reserved=F('reserved') + quantity)
+
+
+def reserve(user, product_id, quantity=1):
+    """Hold quantity more units for the user's cart; False if they are not available"""
+    with transaction.atomic():
+        held = _hold(product_id, quantity)
+        if not held and release_expired(StockReservation.objects.filter(product_id=product_id)):
+            held = _hold(product_id, quantity)  # lapsed holds on this product were blocking the sale
+        if not held:
+            return False
+        extended = StockReservation.objects.filter(user=user, product_id=product_id).update(
+            quantity=F('quantity') + quantity, expires_at=expiry()
+        )
+        if not extended:
+            StockReservation.objects.create(user=user, product_id=product_id, quantity=quantity, expires_at=expiry())
+        prerender.stock_changed([product_id])
+    return True
+
+
+def release(user, product_id, quantity=None):
+    """Give back quantity units (all of them by default) the user holds; returns the number released"""
+    with transaction.atomic():
+        reservation = (
+            StockReservation.objects.select_for_update()
+            .filter(user=user, product_id=product_id).first()
+        )
+        if reservation is None:
+            return 0
+        released = reservation.quantity if quantity is None else min(quantity, reservation.quantity)
+        if released == reservation.quantity:
+            reservation.delete()
+        else:
+            StockReservation.objects.filter(pk=reservation.pk).update(quantity=F('quantity') - released)
+        Product.objects.filter(pk=product_id).update(reserved=F('reserved') - released)
+        prerender.stock_changed([product_id])
+    return released
+
+
+def set_quantity(user, product_id, quantity, current):
+    """Move the user's hold from current to quantity units; False if the increase is not available"""
+    if quantity > current:
+        return reserve(user, product_id, quantity - current)
+    if quantity < current:
+        release(user, product_id, current - quantity)
+    return True
+
+
+def purchase(user, cart):
+    """Turn the user's holds for a session cart into sold stock.
+
+    Lines whose hold lapsed are bought from unheld stock instead. Must run inside
+    the order's transaction; raises InsufficientStock (so the order rolls back)
+    when any line cannot be filled.
+    """
+    lines = {int(product_id): quantity for product_id, quantity in cart.items()}
+    holds = dict(
+        StockReservation.objects.select_for_update()  # keeps the sweeper off these rows until we commit
+        .filter(user=user, product_id__in=lines).values_list('product_id', 'quantity')
+    )
+    short = []
+    for product_id, quantity in lines.items():
+        held = min(holds.get(product_id, 0), quantity)
+        # Units held by others must stay covered: stock - quantity >= reserved - held
+        sold = Product.objects.filter(
+            pk=product_id, stock__gte=F('reserved') + (quantity - held)
+        ).update(stock=F('stock') - quantity, reserved=F('reserved') - held)
+        if not sold:
+            short.append(product_id)
+    if short:
+        raise InsufficientStock(short)
+    surplus = {product_id: count - lines[product_id] for product_id, count in holds.items() if count > lines[product_id]}
+    StockReservation.objects.filter(user=user, product_id__in=lines).delete()
+    for product_id, count in surplus.items():
+        Product.objects.filter(pk=product_id).update(reserved=F('reserved') - count)
+    prerender.stock_changed(lines)
+
+
+def release_expired(queryset=None, batch_size=1000, now=None):
+    """Hand expired holds back to stock in batches; returns the number of reservations released.
+
+    Each batch is one transaction with a single UPDATE per distinct product, so a
+    flash sale with thousands of lapsed carts costs a handful of writes per
+    product rather than one per cart.
+    """
+    queryset = StockReservation.objects.all() if queryset is None else queryset
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                queryset.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now).order_by('expires_at')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                return released
+            StockReservation.objects.filter(id__in=[row[0] for row in batch]).delete()
+            totals = Counter()
+            for _, product_id, quantity in batch:
+                totals[product_id] += quantity
+            for product_id, quantity in totals.items():
+                Product.objects.filter(pk=product_id).update(reserved=F('reserved') - quantity)
+            prerender.stock_changed(totals)
+        released += len(batch)
+        if len(batch) < batch_size:
+            return released
@@ -0,0 +1,379 @@
+"""TF-IDF retrieval over the catalog for free-text chatbot questions.
+
+Products (name, description, artist and category names), artists (name,
+profession, bio) and categories (name, description) are rows of one sparse
+document x term matrix of sublinear, L2-normalised TF-IDF weights. The matrix is
+kept column-major, so a query only walks the postings of its own few terms.
+
+Saves are folded in incrementally: a changed document's old row is marked dead
+and its new row goes to a small pending list that is merged into the matrix every
+MERGE_THRESHOLD additions. Once dead rows outnumber live ones (and
+MERGE_THRESHOLD) the arrays and matrix are compacted to the live rows. Each
+process also picks up products saved by other workers (via updated_at), re-reads
+artists and categories and drops documents deleted elsewhere at most once every
+CHATBOT_INDEX_REFRESH_SECONDS.
+"""
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Artist, Category, Product
+
+KINDS = ('product', 'artist', 'category')
+PRODUCT, ARTIST, CATEGORY = range(3)
+MODEL_KINDS = {Product: PRODUCT, Artist: ARTIST, Category: CATEGORY}
+MERGE_THRESHOLD = 256
+
+STOPWORDS = frozenset('''
+    a about an and any are art artwork artworks as at be by can do does for from get give have i in is it
+    like looking me my of on or painting paintings piece pieces please priced rs inr show some something
+    that the their there these this to want what which with you your
+'''.split())
+
+_CURRENCY = r'(?:₹|\b(?:rs\.?|inr))'
+_AMOUNT = rf'{_CURRENCY}?\s*(\d[\d,]*(?:\.\d+)?)\s*(k\b)?'
+_MONEY = rf'{_CURRENCY}\s*(\d[\d,]*(?:\.\d+)?)\s*(k\b)?'  # an amount that is certainly a price
+# Bare ranges and "from" also read as counts and years ("3 to 5 landscapes", "from 2020"), so
+# they only count as prices with a currency marker or after a word like "priced"
+_PRICE_WORD = r'\b(?:price[ds]?|priced at|costing|costs?|budget(?: of)?)'
+PRICE_BETWEEN = re.compile(
+    rf'\bbetween\s+{_AMOUNT}\s+(?:and|to|-)\s+{_AMOUNT}'
+    rf'|{_MONEY}\s*(?:-|to)\s*{_AMOUNT}'
+    rf'|{_PRICE_WORD}\s*{_AMOUNT}\s*(?:-|to)\s*{_AMOUNT}'
+)
+PRICE_MAX = re.compile(rf'(?:\b(?:under|below|less than|cheaper than|up to|upto|within|at most|max(?:imum)?)|<=?)\s*{_AMOUNT}')
+PRICE_MIN = re.compile(rf'(?:\b(?:over|above|more than|greater than|at least|min(?:imum)?)|>=?)\s*{_AMOUNT}|\bfrom\s*{_MONEY}')
+WORD = re.compile(r'[a-z]+')
+
+
+def _amount(number, thousands):
+    value = float(number.replace(',', ''))
+    return value * 1000 if thousands else value
+
+
+def _amounts(match):
+    """The amounts of whichever alternative of a price pattern matched"""
+    groups = match.groups()
+    return [_amount(number, thousands) for number, thousands in zip(groups[::2], groups[1::2]) if number is not None]
+
+
+def parse_price(text):
+    """Split a price constraint off the text; returns (low, high, remaining text), None for open bounds"""
+    low = high = None
+    match = PRICE_BETWEEN.search(text)
+    if match:
+        low, high = sorted(_amounts(match))
+        text = text[:match.start()] + ' ' + text[match.end():]
+    else:
+        match = PRICE_MAX.search(text)
+        if match:
+            high, = _amounts(match)
+            text = text[:match.start()] + ' ' + text[match.end():]
+        match = PRICE_MIN.search(text)
+        if match:
+            low, = _amounts(match)
+            text = text[:match.start()] + ' ' + text[match.end():]
+    return low, high, text
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+class Grow:
+    """A numpy array with amortised O(1) appends"""
+
+    def __init__(self, dtype, fill=0):
+        self.data = np.full(1024, fill, dtype=dtype)
+        self.fill = fill
+        self.size = 0
+
+    def ensure(self, size):
+        if size > len(self.data):
+            extra = np.full(max(size, 2 * len(self.data)) - len(self.data), self.fill, dtype=self.data.dtype)
+            self.data = np.concatenate([self.data, extra])
+        self.size = max(self.size, size)
+
+    def view(self):
+        return self.data[:self.size]
+
+    def keep(self, rows):
+        kept = self.data[rows]
+        self.data = np.full(max(1024, len(kept)), self.fill, dtype=self.data.dtype)
+        self.data[:len(kept)] = kept
+        self.size = len(kept)
+
+
+class ChatIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built = False
+        self.refreshed = 0.0
+        self.synced_at = None
+
+    def _reset(self):
+        self.vocab = {}
+        self.df = Grow(np.float64)
+        self.docs = 0
+        self.keys = {}
+        self.signatures = {}
+        self.row_terms = []
+        self.kinds = Grow(np.int8)
+        self.ids = Grow(np.int64)
+        self.prices = Grow(np.float64, np.nan)
+        self.alive = Grow(bool)
+        self.matrix = sparse.csc_matrix((0, 0), dtype=np.float32)
+        self.pending = []
+
+    # -- building ------------------------------------------------------------
+
+    def _columns(self, terms):
+        for term in terms:
+            if term not in self.vocab:
+                self.vocab[term] = len(self.vocab)
+        self.df.ensure(len(self.vocab))
+        return np.fromiter((self.vocab[term] for term in terms), dtype=np.int64, count=len(terms))
+
+    def idf(self, columns):
+        return np.log((1 + self.docs) / (1 + self.df.data[columns])) + 1
+
+    def _weigh(self, columns, counts):
+        weights = (1 + np.log(counts)) * self.idf(columns)
+        norm = np.linalg.norm(weights)
+        return (weights / norm if norm else weights).astype(np.float32)
+
+    def _append(self, kind, obj_id, price, columns):
+        row = self.alive.size
+        for array in (self.kinds, self.ids, self.prices, self.alive):
+            array.ensure(row + 1)
+        self.kinds.data[row], self.ids.data[row], self.alive.data[row] = kind, obj_id, True
+        self.prices.data[row] = np.nan if price is None else float(price)
+        self.keys[kind, obj_id] = row
+        self.row_terms.append(columns)
+        self.df.data[columns] += 1
+        self.docs += 1
+        return row
+
+    def _remove(self, key):
+        row = self.keys.pop(key, None)
+        if row is not None:
+            self.alive.data[row] = False
+            self.df.data[self.row_terms[row]] -= 1
+            self.docs -= 1
+        self.signatures.pop(key, None)
+
+    def _merge(self):
+        if not self.pending:
+            return
+        rows = np.concatenate([np.full(len(columns), row) for row, columns, _ in self.pending])
+        columns = np.concatenate([columns for _, columns, _ in self.pending])
+        weights = np.concatenate([weights for _, _, weights in self.pending])
+        shape = (self.alive.size, len(self.vocab))
+        matrix = self.matrix.copy()
+        matrix.resize(shape)
+        self.matrix = (matrix + sparse.csc_matrix((weights, (rows, columns)), shape=shape)).tocsc()
+        self.matrix.sort_indices()
+        self.pending = []
+
+    def _compact(self):
+        """Drop dead rows once they outnumber live ones, so replaced and deleted documents don't pile up"""
+        dead = self.alive.size - self.docs
+        if dead <= max(self.docs, MERGE_THRESHOLD):
+            return
+        self._merge()
+        rows = np.flatnonzero(self.alive.view())
+        self.matrix = self.matrix[rows].tocsc()
+        self.matrix.sort_indices()
+        for array in (self.kinds, self.ids, self.prices, self.alive):
+            array.keep(rows)
+        self.row_terms = [self.row_terms[row] for row in rows]
+        self.keys = {(int(kind), int(obj_id)): row
+                     for row, (kind, obj_id) in enumerate(zip(self.kinds.view(), self.ids.view()))}
+
+    def _add(self, kind, obj_id, text, price):
+        key = (kind, obj_id)
+        signature = hash((text, None if price is None else float(price)))
+        if self.signatures.get(key) == signature:
+            return
+        self._remove(key)
+        counts = Counter(tokenize(text))
+        columns = self._columns(list(counts))
+        row = self._append(kind, obj_id, price, columns)
+        self.pending.append((row, columns, self._weigh(columns, np.array(list(counts.values()), dtype=np.float64))))
+        self.signatures[key] = signature
+        if len(self.pending) >= MERGE_THRESHOLD:
+            self._merge()
+
+    def rebuild(self):
+        """Load every document from the database in one pass and weigh them against the final IDF"""
+        with self.lock:
+            self._reset()
+            self.synced_at = timezone.now()
+            documents = []
+            for kind, obj_id, text, price in iter_documents():
+                counts = Counter(tokenize(text))
+                columns = self._columns(list(counts))
+                row = self._append(kind, obj_id, price, columns)
+                documents.append((row, columns, np.array(list(counts.values()), dtype=np.float64)))
+                self.signatures[kind, obj_id] = hash((text, None if price is None else float(price)))
+            self.pending = [(row, columns, self._weigh(columns, counts)) for row, columns, counts in documents]
+            self._merge()
+            self.built = True
+            self.refreshed = time.monotonic()
+
+    # -- incremental updates -------------------------------------------------
+
+    def update(self, instance):
+        """Re-index one saved Product, Artist or Category; a no-op until the index has been built"""
+        if not self.built:
+            return
+        document = document_for(instance)
+        if document is None:  # deleted before this on_commit callback ran
+            return
+        with self.lock:
+            self._add(*document)
+            self._compact()
+
+    def remove(self, model, pk):
+        if not self.built:
+            return
+        with self.lock:
+            self._remove((MODEL_KINDS[model], pk))
+            self._compact()
+
+    def refresh(self):
+        """Pull in changes saved, and drop documents deleted, by other processes.
+
+        Every product id is only fetched when the index holds more products than
+        the table, i.e. when something was deleted elsewhere since the last pass.
+        """
+        with self.lock:
+            since, self.synced_at = self.synced_at, timezone.now()
+            products = product_documents(Product.objects.filter(updated_at__gte=since))
+            documents = [*products, *artist_documents(), *category_documents()]
+            for document in documents:
+                self._add(*document)
+            existing = {
+                ARTIST: {obj_id for kind, obj_id, _, _ in documents if kind == ARTIST},
+                CATEGORY: {obj_id for kind, obj_id, _, _ in documents if kind == CATEGORY},
+            }
+            if sum(kind == PRODUCT for kind, _ in self.keys) > Product.objects.count():
+                existing[PRODUCT] = set(Product.objects.values_list('id', flat=True))
+            for key in [key for key in self.keys if key[0] in existing and key[1] not in existing[key[0]]]:
+                self._remove(key)
+            self._compact()
+            self.refreshed = time.monotonic()
+
+    def ensure_ready(self):
+        if not self.built:
+            self.rebuild()
+        elif time.monotonic() - self.refreshed > settings.CHATBOT_INDEX_REFRESH_SECONDS:
+            self.refresh()
+
+    # -- querying ------------------------------------------------------------
+
+    def search(self, text, limit=5):
+        """Return (kind, id, score) for the best matches to a free-text question.
+
+        A price constraint ("under 2000", "between 500 and 1500") restricts the
+        results to products in that range; with no other words it lists the
+        cheapest matching products.
+        """
+        low, high, text = parse_price(text.lower())
+        terms = [term for term in dict.fromkeys(tokenize(text)) if term in self.vocab]
+        priced = low is not None or high is not None
+        if not terms and not priced:
+            return []
+
+        with self.lock:
+            rows = self.alive.size
+            mask = self.alive.view().copy()
+            if priced:
+                prices = self.prices.view()
+                mask &= self.kinds.view() == PRODUCT
+                mask &= prices >= (low if low is not None else -np.inf)
+                mask &= prices <= (high if high is not None else np.inf)
+
+            if terms:
+                columns = np.array([self.vocab[term] for term in terms])
+                weights = self.idf(columns)
+                scores = self._scores(columns, weights, rows)
+            else:
+                scores = np.where(mask, 1 / (1 + self.prices.view()), 0)  # cheapest first
+            scores = np.where(mask, scores, 0)
+
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [(KINDS[self.kinds.data[row]], int(self.ids.data[row]), float(scores[row])) for row in candidates]
+
+    def _scores(self, columns, weights, rows):
+        matrix = self.matrix
+        postings, values = [], []
+        for column, weight in zip(columns, weights):
+            if column < matrix.shape[1]:
+                start, end = matrix.indptr[column], matrix.indptr[column + 1]
+                postings.append(matrix.indices[start:end])
+                values.append(matrix.data[start:end] * weight)
+        if postings:
+            scores = np.bincount(np.concatenate(postings), np.concatenate(values), minlength=rows)
+        else:
+            scores = np.zeros(rows)
+        if self.pending:
+            query = dict(zip(columns.tolist(), weights.tolist()))
+            for row, row_columns, row_weights in self.pending:
+                scores[row] += sum(query.get(column, 0) * weight for column, weight in zip(row_columns.tolist(), row_weights.tolist()))
+        return scores
+
+
+def product_documents(queryset):
+    rows = queryset.values_list('id', 'name', 'description', 'price', 'artist__name', 'category__name')
+    for obj_id, name, description, price, artist, category in rows.iterator(chunk_size=2000):
+        yield PRODUCT, obj_id, f'{name} {name} {description} {artist} {category}', price
+
+
+def artist_documents():
+    for obj_id, name, profession, bio in Artist.objects.values_list('id', 'name', 'profession', 'bio'):
+        yield ARTIST, obj_id, f'{name} {profession} {bio}', None
+
+
+def category_documents():
+    for obj_id, name, description in Category.objects.values_list('id', 'name', 'description'):
+        yield CATEGORY, obj_id, f'{name} {name} {description}', None
+
+
+def iter_documents():
+    yield from product_documents(Product.objects.all())
+    yield from artist_documents()
+    yield from category_documents()
+
+
+def document_for(instance):
+    """The (kind, id, text, price) document of a saved instance, or None for a product since deleted"""
+    if isinstance(instance, Product):
+        return next(product_documents(Product.objects.filter(pk=instance.pk)), None)
+    if isinstance(instance, Artist):
+        return ARTIST, instance.pk, f'{instance.name} {instance.profession} {instance.bio}', None
+    return CATEGORY, instance.pk, f'{instance.name} {instance.name} {instance.description}', None
+
+
+chat_index = ChatIndex()
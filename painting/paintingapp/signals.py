@@ -0,0 +1,112 @@
+import logging
+
+from PIL import Image
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import artist_stats, facets, metrics, palette, prerender
+from .models import Artist, ArtistStats, Category, Order, Product, UserSubmission
+from .retrieval import chat_index
+from .suggest import suggest_index
+from .similarity import extract_features, similarity_index
+
+logger = logging.getLogger(__name__)
+
+
+def index_product_image(product):
+    try:
+        with product.image.open('rb') as f:
+            image_hash, histogram = extract_features(f)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('Could not index image for product %s: %s', product.pk, e)
+        return
+    similarity_index.add(product.pk, image_hash, histogram)
+
+
+def image_changed(product, created):
+    """Whether this save stored a new image; instances not loaded from the database count as changed"""
+    loaded = getattr(product, '_loaded_image', None)
+    product._loaded_image = product.image.name
+    return created or product.image.name != loaded
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if image_changed(instance, created):
+        if instance.image:
+            transaction.on_commit(lambda: index_product_image(instance))
+            transaction.on_commit(lambda: palette.schedule(instance))
+        else:
+            pk = instance.pk
+            transaction.on_commit(lambda: similarity_index.remove(pk))
+    if created:
+        artist_stats.work_added(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    artist_id, pk = instance.artist_id, instance.pk
+    transaction.on_commit(lambda: artist_stats.refresh([artist_id]))
+    transaction.on_commit(lambda: similarity_index.remove(pk))
+
+
+def count_order(order):
+    metrics.ORDERS_PLACED.inc()
+    metrics.ORDER_REVENUE.inc(float(order.total_amount))
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: count_order(instance))
+        # The items are added after the order row, so wait for the commit to total them
+        transaction.on_commit(lambda: artist_stats.sales_changed([instance.pk]))
+
+
+@receiver(post_save, sender=Artist)
+def artist_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        ArtistStats.objects.get_or_create(artist=instance)
+    else:
+        # Product cards show the artist's name and picture; touching updated_at retires the cached ones
+        Product.objects.filter(artist=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Category)
+def catalog_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: chat_index.update(instance))
+        transaction.on_commit(facets.bump_generation)
+        transaction.on_commit(lambda: suggest_index.update(instance))
+        keys, paths = prerender.changes(instance)
+        transaction.on_commit(lambda: prerender.schedule(keys, paths))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Category)
+def catalog_deleted(sender, instance, **kwargs):
+    pk = instance.pk  # the instance's pk is cleared once the delete finishes
+    transaction.on_commit(lambda: chat_index.remove(sender, pk))
+    transaction.on_commit(facets.bump_generation)
+    transaction.on_commit(lambda: suggest_index.remove(sender, pk))
+    keys, paths = prerender.changes(instance)
+    transaction.on_commit(lambda: prerender.schedule(keys, paths))
+
+
+@receiver(post_save, sender=UserSubmission)
+@receiver(post_delete, sender=UserSubmission)
+def submission_changed(sender, instance, raw=False, **kwargs):
+    # The home page shows the latest approved submissions
+    if not raw:
+        keys, paths = prerender.changes(instance)
+        transaction.on_commit(lambda: prerender.schedule(keys, paths))
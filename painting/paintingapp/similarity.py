@@ -0,0 +1,185 @@
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from django.conf import settings
+
+HASH_BITS = 64
+HISTOGRAM_BINS = 64  # 4 levels per RGB channel
+
+# One fixed-size record per indexed image. Appending a record is a single write,
+# so concurrent workers adding products cannot interleave half-written rows.
+# A product's newest record wins; a negative id is the tombstone of a deleted
+# product. build_similarity_index drops superseded records and tombstones.
+RECORD = np.dtype([
+    ('id', '<i8'),
+    ('hash', '<u8'),
+    ('histogram', '<f4', HISTOGRAM_BINS),
+])
+
+def dhash(img, size=8):
+    """64-bit difference hash: whether each pixel is brighter than its right neighbour"""
+    gray = np.asarray(img.convert('L').resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = gray[:, 1:] > gray[:, :-1]
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def colour_histogram(img):
+    """Square-rooted joint RGB histogram, so a dot product gives the Bhattacharyya coefficient"""
+    rgb = np.asarray(img.convert('RGB').resize((32, 32), Image.BILINEAR), dtype=np.uint8) >> 6
+    codes = (rgb[..., 0].astype(np.intp) << 4) | (rgb[..., 1] << 2) | rgb[..., 2]
+    counts = np.bincount(codes.ravel(), minlength=HISTOGRAM_BINS).astype(np.float32)
+    return np.sqrt(counts / counts.sum())
+
+
+def open_downsampled(source):
+    img = Image.open(source)
+    img.draft('RGB', (64, 64))  # lets the JPEG decoder skip most of the full-resolution work
+    return img
+
+
+def extract_features(source):
+    with open_downsampled(source) as img:
+        return dhash(img), colour_histogram(img)
+
+
+def features_for(item):
+    """(product_id, hash, histogram) for a (product_id, path) pair, or None if the image cannot be read"""
+    product_id, path = item
+    try:
+        return (product_id, *extract_features(path))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def pack_record(product_id, image_hash, histogram):
+    record = np.zeros(1, dtype=RECORD)
+    record['id'] = product_id
+    record['hash'] = image_hash
+    record['histogram'] = histogram
+    return record.tobytes()
+
+
+def hamming_distances(hashes, value):
+    """Bit differences between each 64-bit hash and value, via a branch-free SWAR popcount"""
+    x = np.bitwise_xor(hashes, np.uint64(value))
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def live_records(ids):
+    """Mask of each product's newest record, unless that record is its tombstone"""
+    latest = len(ids) - 1 - np.unique(np.abs(ids[::-1]), return_index=True)[1]
+    live = np.zeros(len(ids), dtype=bool)
+    live[latest[ids[latest] > 0]] = True
+    return live
+
+
+class SimilarityIndex:
+    """Append-only, memory-mapped nearest-neighbour index over product images"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.version = None
+        self.records = np.zeros(0, dtype=RECORD)
+        self.live = np.zeros(0, dtype=bool)
+
+    def _refresh(self):
+        # Other processes append to (or rebuild) the same file, so remap whenever it changes
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_ino, stat.st_size)
+        except OSError:
+            version = (0, 0)
+        if version == self.version:
+            return
+        count = version[1] // RECORD.itemsize
+        with self.lock:
+            if count:
+                self.records = np.memmap(self.path, dtype=RECORD, mode='r', shape=(count,))
+            else:
+                self.records = np.zeros(0, dtype=RECORD)
+            self.live = live_records(self.records['id'])
+            self.version = version
+
+    def _snapshot(self):
+        self._refresh()
+        with self.lock:
+            return self.records, self.live
+
+    def __len__(self):
+        return int(self._snapshot()[1].sum())
+
+    def add(self, product_id, image_hash, histogram):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(pack_record(product_id, image_hash, histogram))
+
+    def remove(self, product_id):
+        if os.path.exists(self.path):
+            self.add(-product_id, 0, np.zeros(HISTOGRAM_BINS, dtype=np.float32))
+
+    def rebuild(self, items):
+        """Replace the index with (product_id, hash, histogram) tuples, swapping the file in atomically"""
+        tmp_path = self.path + '.tmp'
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        count = 0
+        with open(tmp_path, 'wb') as f:
+            for item in items:
+                f.write(pack_record(*item))
+                count += 1
+        os.replace(tmp_path, self.path)
+        return count
+
+    def features(self, product_id):
+        records, live = self._snapshot()
+        rows = np.flatnonzero(live & (records['id'] == product_id))
+        if not len(rows):
+            return None
+        record = records[rows[0]]
+        return int(record['hash']), np.array(record['histogram'])
+
+    def query(self, image_hash, histogram, k=8, exclude=None):
+        """Return [(product_id, distance)] for the k closest images, nearest first.
+
+        Distance averages the normalised dHash Hamming distance (layout) and the
+        Hellinger-style colour distance, both in [0, 1].
+        """
+        records, live = self._snapshot()
+        if not live.any():
+            return []
+
+        colour = 1 - records['histogram'] @ histogram.astype(np.float32)
+        layout = hamming_distances(records['hash'], image_hash) / HASH_BITS
+        distances = np.where(live, (colour + layout) / 2, np.inf)
+
+        # Over-fetch so the excluded product can be dropped
+        fetch = min(int(live.sum()), k + 1)
+        nearest = np.argpartition(distances, fetch - 1)[:fetch]
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+
+        results = []
+        seen = {exclude}
+        for row in nearest:
+            product_id = int(records['id'][row])
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            results.append((product_id, float(distances[row])))
+            if len(results) == k:
+                break
+        return results
+
+    def similar_to(self, product_id, k=8):
+        features = self.features(product_id)
+        if features is None:
+            return []
+        return self.query(*features, k=k, exclude=product_id)
+
+
+similarity_index = SimilarityIndex(settings.SIMILARITY_INDEX_PATH)
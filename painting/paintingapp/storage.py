@@ -0,0 +1,26 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import StaticFilesStorage
+
+from .compression import ENCODINGS, compress_file, is_compressible
+
+
+class CompressedStaticFilesStorage(StaticFilesStorage):
+    """Static storage whose collectstatic also writes .br and .gz siblings of every compressible asset"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name in paths:
+            content_type, encoding = mimetypes.guess_type(name)
+            if encoding or not content_type or not is_compressible(content_type):
+                continue
+            path = self.path(name)
+            # Drop siblings from an earlier run in case the asset no longer compresses well
+            for _, suffix in ENCODINGS:
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            if compress_file(path, settings.COMPRESSION_MIN_BYTES):
+                yield name, name, True
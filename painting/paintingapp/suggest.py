@@ -0,0 +1,146 @@
+"""In-memory autocomplete for the search box.
+
+Product, artist and category names are kept in one sorted list of
+(key, kind, id) tuples, with one key per word of the name ("calm blue river"
+is found by "blu" and "riv" as well as "calm"), so a prefix is a pair of
+bisects. Matches are ranked by popularity: units sold for products, and the
+units sold of everything an artist or category holds. Answers for prefixes with
+many matches are memoised until an entry they cover changes.
+
+Each process loads the index when it starts (see painting/wsgi.py) and patches it
+from save and delete signals; popularity is as of that load.
+"""
+import heapq
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.db import DatabaseError
+from django.urls import reverse
+
+from .archive import units_sold
+from .models import Artist, Category, Product
+
+logger = logging.getLogger(__name__)
+
+LIMIT = 8
+# Prefixes matching more keys than this get their answer memoised
+MEMO_THRESHOLD = 500
+MEMO_SIZE = 10000
+MODEL_KINDS = {Product: 'product', Artist: 'artist', Category: 'category'}
+URL_NAMES = {'product': 'product_detail', 'artist': 'artist_detail', 'category': 'category_detail'}
+_END = '\U0010ffff'
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def name_keys(name):
+    """The name from each of its words onwards, skipping bare numbers"""
+    words = normalize(name).split(' ')
+    return [' '.join(words[i:]) for i, word in enumerate(words) if word and not word.isdigit()]
+
+
+class SuggestIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built = False
+        self.keys = []
+        self.entries = {}  # (kind, id) -> (name, popularity)
+        self.memo = {}
+
+    def rebuild(self):
+        sold = units_sold()
+        entries = {}
+        by_artist, by_category = Counter(), Counter()
+        for product_id, name, artist_id, category_id in Product.objects.values_list(
+                'id', 'name', 'artist_id', 'category_id').iterator(chunk_size=5000):
+            units = sold.get(product_id) or 0
+            entries['product', product_id] = (name, units)
+            by_artist[artist_id] += units
+            by_category[category_id] += units
+        for artist_id, name in Artist.objects.values_list('id', 'name'):
+            entries['artist', artist_id] = (name, by_artist[artist_id])
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            entries['category', category_id] = (name, by_category[category_id])
+        keys = sorted((key, kind, obj_id) for (kind, obj_id), (name, _) in entries.items() for key in name_keys(name))
+        with self.lock:
+            self.entries, self.keys, self.memo = entries, keys, {}
+            self.built = True
+
+    def warm(self):
+        """Build at process start; a database without tables yet just leaves it to the first request"""
+        try:
+            self.rebuild()
+        except DatabaseError as e:
+            logger.warning('Search suggestions not preloaded: %s', e)
+
+    def ensure_built(self):
+        if not self.built:
+            self.rebuild()
+
+    def update(self, instance):
+        """Add or rename the entry for a saved product, artist or category, keeping its popularity"""
+        if not self.built:
+            return
+        kind, obj_id, name = MODEL_KINDS[type(instance)], instance.pk, instance.name
+        with self.lock:
+            old_name, popularity = self.entries.get((kind, obj_id), (None, 0))
+            if old_name == name:
+                return
+            self._discard(kind, obj_id)
+            self.entries[kind, obj_id] = (name, popularity)
+            for key in name_keys(name):
+                insort(self.keys, (key, kind, obj_id))
+            self._forget(name_keys(name))
+
+    def remove(self, model, pk):
+        if not self.built:
+            return
+        with self.lock:
+            self._discard(MODEL_KINDS[model], pk)
+
+    def _discard(self, kind, obj_id):
+        entry = self.entries.pop((kind, obj_id), None)
+        if entry is None:
+            return
+        keys = name_keys(entry[0])
+        for key in keys:
+            i = bisect_left(self.keys, (key, kind, obj_id))
+            if i < len(self.keys) and self.keys[i] == (key, kind, obj_id):
+                del self.keys[i]
+        self._forget(keys)
+
+    def _forget(self, keys):
+        """Drop memoised answers for prefixes of any of keys"""
+        self.memo = {
+            memo_key: found for memo_key, found in self.memo.items()
+            if not any(key.startswith(memo_key[0]) for key in keys)
+        }
+
+    def suggest(self, text, limit=LIMIT):
+        """The most popular entries with a word starting with text, as dicts for the JSON response"""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        memo_key = (prefix, limit)
+        with self.lock:
+            found = self.memo.get(memo_key)
+            if found is None:
+                lo = bisect_left(self.keys, (prefix,))
+                hi = bisect_left(self.keys, (prefix + _END,), lo)
+                matches = {(kind, obj_id) for _, kind, obj_id in self.keys[lo:hi]}
+                entries = self.entries
+                found = heapq.nsmallest(limit, matches, key=lambda ref: (-entries[ref][1], len(entries[ref][0]), entries[ref][0]))
+                found = [(kind, obj_id, entries[kind, obj_id][0]) for kind, obj_id in found]
+                if hi - lo > MEMO_THRESHOLD:
+                    if len(self.memo) >= MEMO_SIZE:
+                        self.memo = {}
+                    self.memo[memo_key] = found
+        return [{'type': kind, 'label': name, 'url': reverse(URL_NAMES[kind], args=[obj_id])} for kind, obj_id, name in found]
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,61 @@
+"""Cached product card fragments.
+
+Each card is cached under the product's id and updated_at (plus whether it is in
+stock, since stock changes through queryset updates that leave updated_at alone),
+so saving a product retires its cards without any explicit invalidation.
+
+A grid primes all of its cards first with {% prefetch_product_cards products %}:
+one cache.get_many for the page, and one set_many for whatever was missing.
+"""
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+CARD_TEMPLATES = {
+    'grid': 'paintingapp/product_card.html',
+    'compact': 'paintingapp/product_card_compact.html',
+}
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def card_key(product, variant, show_description):
+    version = product.updated_at.timestamp() if product.updated_at else 0
+    return f'product_card:{variant}:{int(show_description)}:{product.pk}:{version}:{int(product.stock > 0)}'
+
+
+def render_card(product, variant, show_description):
+    return render_to_string(CARD_TEMPLATES[variant], {'product': product, 'show_description': show_description})
+
+
+def _cards(context):
+    # render_context lives for one top-level render, so cards never leak between requests
+    return context.render_context.setdefault('product_cards', {})
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_product_cards(context, products, variant='grid', show_description=False):
+    """Load every card in products with one cache round trip and render and store the misses"""
+    keys = {card_key(product, variant, show_description): product for product in products}
+    cards = _cards(context)
+    cards.update(cache.get_many(list(keys)))
+    missing = {key: render_card(product, variant, show_description) for key, product in keys.items() if key not in cards}
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+        cards.update(missing)
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def product_card(context, product, variant='grid', show_description=False):
+    """The card markup for one product, from the prefetched batch, the cache, or a fresh render"""
+    key = card_key(product, variant, show_description)
+    html = _cards(context).get(key)
+    if html is None:
+        html = cache.get(key)
+        if html is None:
+            html = render_card(product, variant, show_description)
+            cache.set(key, html, CARD_TIMEOUT)
+    return mark_safe(html)
@@ -1,3 +1,1385 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import smtplib
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import api, archive, artist_stats, factories, fulfilment, palette, prerender, previews, reservations
+from .compression import compress_file
+from .dedupe import SubmissionHashIndex, image_dhash, to_signed
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, ArtistStats, Order, OrderItem, OrderNotification, PrerenderDependency, Product,
+    ProductNeighbor, StockReservation, UserSubmission,
+)
+from .perf import DUPLICATES_PER_VIEW, RequestStats
+from .recommendations import best_sellers, co_purchase_neighbors, rebuild_neighbors, related_products
+from .retrieval import chat_index, parse_price
+from .signals import index_product_image
+from .similarity import HISTOGRAM_BINS, SimilarityIndex, features_for
+from .suggest import suggest_index
+from .views import submission_page
+
+# Raise PAINTING_TEST_PRODUCTS (up to 1M) to check the budgets against a bigger catalog
+CATALOG_SIZE = int(os.environ.get('PAINTING_TEST_PRODUCTS', 10000))
+# Scale wall-time budgets on slow CI machines
+TIME_FACTOR = float(os.environ.get('PAINTING_TEST_TIME_FACTOR', 1))
+
+
+class BudgetTestCase(TestCase):
+    """Seeds a synthetic catalog once per class and checks pages against query and time budgets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = factories.seed(
+            products=CATALOG_SIZE,
+            orders=CATALOG_SIZE // 5,
+            submissions=CATALOG_SIZE // 10,
+            customers=50,
+        )
+        cls.product_ids = cls.data['product_ids']
+        cls.category = cls.data['categories'][0]
+
+        cls.shopper = User.objects.create_user('shopper', password='budget-pass-123')
+        orders = Order.objects.bulk_create([
+            Order(user=cls.shopper, subtotal=0, shipping_cost=100, total_amount=100) for _ in range(20)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=1, price=100)
+            for order in orders for product_id in cls.product_ids[:3]
+        ])
+
+    def login_with_cart(self, size=5):
+        self.client.force_login(self.shopper)
+        session = self.client.session
+        session['cart'] = {str(product_id): 1 for product_id in self.product_ids[:size]}
+        session.save()
+
+    def assertBudget(self, url, max_queries, max_ms, method='get', data=None):
+        request = getattr(self.client, method)
+        request(url, data)  # warm the URL resolver and template caches
+
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request(url, data)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.assertLess(response.status_code, 400, url)
+        queries = '\n'.join(query['sql'] for query in captured.captured_queries)
+        self.assertLessEqual(
+            len(captured), max_queries,
+            f'{url} ran {len(captured)} queries (budget {max_queries}):\n{queries}'
+        )
+        self.assertLessEqual(
+            elapsed_ms, max_ms * TIME_FACTOR,
+            f'{url} took {elapsed_ms:.0f} ms (budget {max_ms * TIME_FACTOR:.0f} ms)'
+        )
+        return response
+
+
+class PageQueryBudgetTests(BudgetTestCase):
+
+    def test_home(self):
+        self.assertBudget(reverse('home'), 3, 300)
+
+    def test_search(self):
+        self.assertBudget(reverse('search'), 3, 500, data={'q': 'blue'})
+
+    def test_search_sorted_by_price(self):
+        self.assertBudget(reverse('search'), 3, 500, data={'q': 'river', 'sort': 'price_low', 'page': 3})
+
+    def test_search_with_facet_filters(self):
+        data = {'q': 'blue', 'category': self.category.pk, 'price': 'under-500', 'in_stock': '1'}
+        self.assertBudget(reverse('search'), 3, 500, data=data)
+
+    def test_category_detail(self):
+        self.assertBudget(reverse('category_detail', args=[self.category.pk]), 3, 300)
+
+    def test_product_detail(self):
+        self.assertBudget(reverse('product_detail', args=[self.product_ids[0]]), 3, 300)
+
+    def test_user_submissions(self):
+        self.assertBudget(reverse('user_submissions'), 1, 300)
+
+    def test_view_cart(self):
+        self.login_with_cart()
+        self.assertBudget(reverse('view_cart'), 3, 300)
+
+    def test_checkout(self):
+        self.login_with_cart()
+        self.assertBudget(reverse('checkout'), 3, 300)
+
+    def test_order_history(self):
+        self.client.force_login(self.shopper)
+        self.assertBudget(reverse('order_history'), 4, 300)
+
+
+class ChatbotQueryBudgetTests(BudgetTestCase):
+
+    def test_paintings(self):
+        self.assertBudget(reverse('chatbot'), 1, 200, method='post', data={'query': 'show me paintings'})
+
+    def test_artists(self):
+        self.assertBudget(reverse('chatbot'), 1, 200, method='post', data={'query': 'who are your artists'})
+
+    def test_categories(self):
+        self.assertBudget(reverse('chatbot'), 1, 200, method='post', data={'query': 'what category'})
+
+    def test_prices(self):
+        self.assertBudget(reverse('chatbot'), 1, 200, method='post', data={'query': 'what is the price'})
+
+    def test_fallback(self):
+        self.assertBudget(reverse('chatbot'), 0, 100, method='post', data={'query': 'hello'})
+
+
+class ReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=1, artists=1, products=1, customers=2, orders=0, submissions=0)
+        cls.product_id = data['product_ids'][0]
+        cls.first, cls.second = data['customers']
+        Product.objects.filter(id=cls.product_id).update(stock=1)
+
+    def product(self):
+        return Product.objects.get(id=self.product_id)
+
+    def test_hold_blocks_other_buyers(self):
+        self.assertTrue(reservations.reserve(self.first, self.product_id))
+        self.assertFalse(reservations.reserve(self.second, self.product_id))
+        self.assertEqual(self.product().available, 0)
+
+    def test_release_returns_stock(self):
+        reservations.reserve(self.first, self.product_id)
+        self.assertEqual(reservations.release(self.first, self.product_id), 1)
+        self.assertTrue(reservations.reserve(self.second, self.product_id))
+
+    def test_sweeper_releases_expired_holds(self):
+        reservations.reserve(self.first, self.product_id)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(reservations.release_expired(), 1)
+        self.assertEqual(self.product().reserved, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_lapsed_hold_does_not_block_a_new_buyer(self):
+        reservations.reserve(self.first, self.product_id)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(reservations.reserve(self.second, self.product_id))
+
+    def test_purchase_consumes_hold(self):
+        reservations.reserve(self.first, self.product_id)
+        reservations.purchase(self.first, {str(self.product_id): 1})
+        product = self.product()
+        self.assertEqual((product.stock, product.reserved), (0, 0))
+        with self.assertRaises(reservations.InsufficientStock):
+            reservations.purchase(self.second, {str(self.product_id): 1})
+
+    def test_checkout_is_refused_when_stock_is_held_elsewhere(self):
+        reservations.reserve(self.first, self.product_id)
+        self.client.force_login(self.second)
+        session = self.client.session
+        session['cart'] = {str(self.product_id): 1}
+        session.save()
+        response = self.client.post(reverse('place_order'), {'first_name': 'Late', 'payment_method': 'COD'})
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.filter(user=self.second).exists())
+
+    def test_checkout_prunes_products_deleted_from_the_catalog(self):
+        self.client.force_login(self.first)
+        session = self.client.session
+        session['cart'] = {str(self.product_id): 1, '999999': 2}
+        session.save()
+        response = self.client.post(reverse('place_order'), {'first_name': 'Late', 'payment_method': 'COD'})
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.client.session['cart'], {str(self.product_id): 1})
+        self.assertIn('no longer available', self.client.get(reverse('session_state')).json()['messages'][0]['text'])
+
+
+@override_settings(THROTTLE_RATES={
+    'chatbot': {'burst': 2, 'per_minute': 2},
+    'customize_preview': {'burst': 1, 'per_minute': 1},
+})
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_decorated_view_returns_429_with_retry_after(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('chatbot'), {'query': 'hello'}).status_code, 200)
+        response = self.client.post(reverse('chatbot'), {'query': 'hello'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+    def test_buckets_are_per_client(self):
+        for _ in range(3):
+            self.client.post(reverse('chatbot'), {'query': 'hello'}, REMOTE_ADDR='10.0.0.1')
+        response = self.client.post(reverse('chatbot'), {'query': 'hello'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_middleware_throttles_listed_url_names(self):
+        self.client.post(reverse('customize_preview'))
+        self.assertEqual(self.client.post(reverse('customize_preview')).status_code, 429)
+
+
+class MetricsTests(TestCase):
+
+    def test_exposes_request_and_business_counters(self):
+        self.client.post(reverse('chatbot'), {'query': 'who are your artists'})
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('painting_chatbot_intents_total{intent="artists"}', body)
+        self.assertIn('painting_request_duration_seconds_bucket{le="0.005",view="chatbot"}', body)
+
+    def test_refuses_other_addresses(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+
+class CompressionTests(TestCase):
+
+    def test_pages_without_csrf_tokens_get_brotli(self):
+        response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_pages_with_csrf_tokens_get_padded_gzip(self):
+        response = self.client.get(reverse('login'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'csrfmiddlewaretoken', gzip.decompress(response.content))
+
+    def test_refused_encodings_are_not_used(self):
+        response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_static_files_use_precompressed_siblings(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'site.css')
+            with open(path, 'w') as f:
+                f.write('body { margin: 0; }\n' * 200)
+            compress_file(path, 1024)
+            for encoding, expected in (('br, gzip', 'br'), ('gzip', 'gzip'), ('', None)):
+                with self.settings(STATIC_ROOT=root):
+                    response = self.client.get('/static/site.css', HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(response.get('Content-Encoding'), expected)
+                self.assertEqual(response['Content-Type'], 'text/css')
+                response.close()
+
+
+class ProductCardCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=1, artists=2, products=12, customers=0, orders=0, submissions=0)
+        cls.category = data['categories'][0]
+        cls.product = Product.objects.get(id=data['product_ids'][0])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_grid_fetches_cards_in_one_round_trip(self):
+        url = reverse('category_detail', args=[self.category.pk])
+        self.client.get(url)
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.client.get(url)
+        get_many.assert_called_once()
+        self.assertEqual(len(get_many.call_args.args[0]), 12)
+
+    def test_saving_a_product_refreshes_its_card(self):
+        url = reverse('category_detail', args=[self.category.pk])
+        self.client.get(url)
+        self.product.name = 'Renamed Masterpiece'
+        self.product.save()
+        self.assertContains(self.client.get(url), 'Renamed Masterpiece')
+
+    def test_renaming_the_artist_refreshes_cards(self):
+        url = reverse('category_detail', args=[self.category.pk])
+        self.client.get(url)
+        artist = self.product.artist
+        artist.name = 'Renamed Artist'
+        artist.save()
+        self.assertContains(self.client.get(url), 'Renamed Artist')
+
+
+class ChatRetrievalTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=2, artists=3, products=30, customers=0, orders=0, submissions=0)
+        cls.lagoon, cls.harbour = Product.objects.filter(id__in=data['product_ids'][:2]).order_by('id')
+        Product.objects.filter(pk=cls.lagoon.pk).update(name='Misty Teal Lagoon', price=1500)
+        Product.objects.filter(pk=cls.harbour.pk).update(name='Misty Teal Harbour', price=2500)
+
+    def setUp(self):
+        chat_index.rebuild()
+
+    def tearDown(self):
+        chat_index.built = False  # other test classes see different rows
+
+    def test_parse_price(self):
+        self.assertEqual(parse_price('calm blue landscapes under 2000')[:2], (None, 2000))
+        self.assertEqual(parse_price('between 1,500 and 500')[:2], (500, 1500))
+        self.assertEqual(parse_price('over 2k')[:2], (2000, None))
+        self.assertEqual(parse_price('calm blue landscapes')[:2], (None, None))
+
+    def test_counts_and_years_are_not_prices(self):
+        self.assertEqual(parse_price('paintings from 2020')[:2], (None, None))
+        self.assertEqual(parse_price('3 to 5 landscapes')[:2], (None, None))
+        self.assertEqual(parse_price('landscapes 1990-2000')[:2], (None, None))
+        self.assertEqual(parse_price('portraits from rs 800')[:2], (800, None))
+        self.assertEqual(parse_price('₹500 - 1k portraits')[:2], (500, 1000))
+        self.assertEqual(parse_price('priced at 1200 to 900')[:2], (900, 1200))
+
+    def test_search_ranks_matches_within_price(self):
+        hits = chat_index.search('misty teal lagoons')
+        self.assertEqual(hits[0][:2], ('product', self.lagoon.pk))
+        self.assertEqual([hit[1] for hit in chat_index.search('misty teal under 2000')], [self.lagoon.pk])
+
+    def test_saves_update_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.harbour.name = 'Velvet Orchard'
+            self.harbour.save()
+        self.assertEqual([hit[1] for hit in chat_index.search('velvet orchard')], [self.harbour.pk])
+        self.assertEqual([hit[1] for hit in chat_index.search('misty harbour')], [self.lagoon.pk])
+
+    def test_deletes_leave_the_index(self):
+        with mock.patch('paintingapp.signals.similarity_index'), self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=self.harbour.pk).delete()
+        self.assertEqual([hit[1] for hit in chat_index.search('misty harbour')], [self.lagoon.pk])
+
+    def test_refresh_drops_rows_deleted_by_other_workers(self):
+        Product.objects.filter(pk=self.harbour.pk).delete()  # no on_commit callbacks run here
+        chat_index.refresh()
+        self.assertEqual([hit[1] for hit in chat_index.search('misty harbour')], [self.lagoon.pk])
+
+    def test_refresh_only_lists_product_ids_after_a_delete(self):
+        chat_index.refresh()
+        with CaptureQueriesContext(connection) as captured:
+            chat_index.refresh()
+        listings = [q for q in captured.captured_queries
+                    if q['sql'].startswith('SELECT "paintingapp_product"."id"') and 'WHERE' not in q['sql']]
+        self.assertEqual(listings, [])
+        Product.objects.filter(pk=self.harbour.pk).delete()
+        with CaptureQueriesContext(connection) as captured:
+            chat_index.refresh()
+        self.assertEqual(len(captured), 5)  # changed products, artists, categories, the count and the ids
+
+    def test_updates_for_products_deleted_meanwhile_are_skipped(self):
+        harbour = Product.objects.get(pk=self.harbour.pk)
+        Product.objects.filter(pk=harbour.pk).delete()
+        chat_index.update(harbour)
+        self.assertEqual([hit[1] for hit in chat_index.search('misty teal')][:2], [self.lagoon.pk, self.harbour.pk])
+
+    def test_dead_rows_are_compacted(self):
+        with mock.patch('paintingapp.retrieval.MERGE_THRESHOLD', 4):
+            for name in ['Velvet Orchard', 'Quiet Orchard', 'Amber Orchard', 'Velvet Dunes'] * 10:
+                Product.objects.filter(pk=self.harbour.pk).update(name=name)
+                chat_index.update(self.harbour)
+        self.assertLessEqual(chat_index.alive.size, 2 * chat_index.docs)
+        self.assertEqual([hit[1] for hit in chat_index.search('velvet dunes')], [self.harbour.pk])
+        self.assertEqual([hit[1] for hit in chat_index.search('misty teal')], [self.lagoon.pk])
+
+    def test_chatbot_answers_with_ranked_products(self):
+        response = self.client.post(reverse('chatbot'), {'query': 'Misty teal paintings under 2000'})
+        data = response.json()['data']
+        self.assertEqual([item['name'] for item in data], ['Misty Teal Lagoon'])
+
+
+class FacetSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=3, artists=4, products=60, customers=0, orders=0, submissions=0)
+        cls.categories = data['categories']
+
+    def setUp(self):
+        cache.clear()
+
+    def facet(self, response, name):
+        return {option['value']: option for option in response.context['facets'][name]}
+
+    def test_counts_ignore_their_own_facet(self):
+        category = self.categories[0]
+        response = self.client.get(reverse('search'), {'q': '', 'category': category.pk, 'price': 'under-500'})
+        products = Product.objects.filter(price__lt=500)
+        self.assertEqual(response.context['results_count'], products.filter(category=category).count())
+        for other in self.categories:
+            self.assertEqual(self.facet(response, 'category')[other.pk]['count'], products.filter(category=other).count())
+        self.assertTrue(self.facet(response, 'category')[category.pk]['selected'])
+        in_stock = self.facet(response, 'in_stock')[True]['count']
+        self.assertEqual(in_stock, products.filter(category=category, stock__gt=0).count())
+
+    def test_groups_are_cached_per_query(self):
+        self.client.get(reverse('search'), {'q': 'blue'})
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('search'), {'q': 'blue', 'category': self.categories[1].pk})
+        self.assertEqual(len(captured), 2)  # just the page of products and its count
+
+    def test_queries_differing_in_whitespace_are_cached_apart(self):
+        self.client.get(reverse('search'), {'q': 'a'})
+        response = self.client.get(reverse('search'), {'q': 'a '})
+        matches = Product.objects.filter(Q(name__icontains='a ') | Q(description__icontains='a ') |
+                                         Q(artist__name__icontains='a ') | Q(category__name__icontains='a '))
+        self.assertEqual(sum(option['count'] for option in self.facet(response, 'category').values()), matches.count())
+
+    def test_result_count_is_not_taken_from_cached_groups(self):
+        self.client.get(reverse('search'), {'q': '', 'in_stock': '1'})
+        Product.objects.filter(category=self.categories[0]).update(stock=0)  # sends no signals
+        response = self.client.get(reverse('search'), {'q': '', 'in_stock': '1'})
+        self.assertEqual(response.context['results_count'], Product.objects.filter(stock__gt=0).count())
+
+    def test_saving_a_product_refreshes_counts(self):
+        self.client.get(reverse('search'), {'q': ''})
+        with mock.patch('paintingapp.signals.similarity_index'), self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(category=self.categories[0]).first().delete()
+        response = self.client.get(reverse('search'), {'q': ''})
+        self.assertEqual(response.context['results_count'], 59)
+
+    def test_filters_stay_in_links(self):
+        category = self.categories[0]
+        response = self.client.get(reverse('search'), {'q': 'blue', 'category': category.pk})
+        url = self.facet(response, 'in_stock')[True]['url']
+        self.assertIn(f'category={category.pk}', url)
+        self.assertIn('in_stock=1', url)
+        self.assertNotIn(f'category={category.pk}', self.facet(response, 'category')[category.pk]['url'])
+
+
+class SearchSuggestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=2, artists=2, products=20, customers=0, orders=0, submissions=0)
+        cls.alpha, cls.beta = Product.objects.filter(id__in=data['product_ids'][:2]).order_by('id')
+        Product.objects.filter(pk=cls.alpha.pk).update(name='Zephyr Alpha')
+        Product.objects.filter(pk=cls.beta.pk).update(name='Quiet Zephyr Beta')
+        buyer = User.objects.create_user('buyer')
+        order = Order.objects.create(user=buyer, subtotal=0, shipping_cost=0, total_amount=0)
+        OrderItem.objects.create(order=order, product=cls.beta, quantity=3, price=100)
+
+    def setUp(self):
+        suggest_index.rebuild()
+
+    def tearDown(self):
+        suggest_index.built = False  # other test classes see different rows
+
+    def labels(self, query):
+        return [suggestion['label'] for suggestion in self.client.get(reverse('search_suggest'), {'q': query}).json()['suggestions']]
+
+    def test_matches_any_word_ranked_by_sales(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('zeph'), ['Quiet Zephyr Beta', 'Zephyr Alpha'])
+        self.assertEqual(self.labels('  QUIET  zep'), ['Quiet Zephyr Beta'])
+        self.assertEqual(self.labels(''), [])
+
+    def test_signals_patch_the_index(self):
+        self.labels('zeph')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alpha.name = 'Nimbus Alpha'
+            self.alpha.save()
+        self.assertEqual(self.labels('zeph'), ['Quiet Zephyr Beta'])
+        self.assertEqual(self.labels('nimb'), ['Nimbus Alpha'])
+        with mock.patch('paintingapp.signals.similarity_index'), self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=self.beta.pk).delete()
+        self.assertEqual(self.labels('zeph'), [])
+
+
+class FulfilmentTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', email='customer@example.com')
+        cls.orders = {
+            status: Order.objects.bulk_create([
+                Order(user=cls.customer, total_amount=100, status=status) for _ in range(3)
+            ])
+            for status in ('pending', 'processing', 'delivered')
+        }
+
+    def test_transition_only_moves_eligible_orders(self):
+        with CaptureQueriesContext(connection) as captured:
+            changed = fulfilment.transition(Order.objects.all(), 'shipped')
+        self.assertEqual(sorted(changed), sorted(order.pk for order in self.orders['processing']))
+        updates = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 3)
+        self.assertEqual(Order.objects.filter(status='delivered').count(), 3)
+        self.assertEqual(set(OrderNotification.objects.values_list('order_id', flat=True)), set(changed))
+
+    def test_cancelling_returns_the_items_to_stock(self):
+        product = factories.seed(categories=1, artists=1, products=1, customers=0, orders=0, submissions=0)['product_ids'][0]
+        Product.objects.filter(pk=product).update(stock=5)
+        orders = self.orders['pending'][:2] + self.orders['delivered'][:1]
+        OrderItem.objects.bulk_create([OrderItem(order=order, product_id=product, quantity=2, price=50) for order in orders])
+        artist_stats.sales_changed([order.pk for order in orders])
+        fulfilment.transition(Order.objects.all(), 'cancelled')
+        self.assertEqual(Product.objects.get(pk=product).stock, 9)  # the delivered order's units stay sold
+
+    def test_command_rejects_malformed_dates(self):
+        with self.assertRaisesMessage(CommandError, "'2024-13-01' is not a YYYY-MM-DD date"):
+            call_command('transition_orders', 'cancelled', '--from-status', 'pending', '--created-before', '2024-13-01')
+
+    def test_notifications_go_out_in_batches_over_one_connection(self):
+        fulfilment.transition(Order.objects.all(), 'cancelled')
+        with mock.patch.object(fulfilment.mail, 'get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(fulfilment.send_notifications(batch_size=4), 6)
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+        self.assertFalse(OrderNotification.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(fulfilment.send_notifications(), 0)
+
+    def test_admin_action(self):
+        staff = User.objects.create_superuser('staff', password='staff-pass-123')
+        self.client.force_login(staff)
+        ids = [order.pk for order in self.orders['pending'] + self.orders['delivered']]
+        response = self.client.post(reverse('admin:paintingapp_order_changelist'), {
+            'action': 'mark_processing', '_selected_action': ids,
+        }, follow=True)
+        self.assertContains(response, '3 of 6 orders marked processing')
+        self.assertEqual(Order.objects.filter(status='processing').count(), 6)
+
+    def test_a_failed_send_keeps_only_the_unsent_notifications_queued(self):
+        fulfilment.transition(Order.objects.all(), 'cancelled')
+        send, calls = locmem.EmailBackend.send_messages, []
+
+        def flaky(backend, messages):
+            calls.append(messages)
+            if len(calls) == 3:
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            return send(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', flaky), \
+                self.assertRaises(smtplib.SMTPServerDisconnected):
+            fulfilment.send_notifications()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OrderNotification.objects.filter(sent_at__isnull=True).count(), 4)
+        self.assertEqual(fulfilment.send_notifications(), 4)
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_status_is_read_only_in_the_change_form(self):
+        self.client.force_login(User.objects.create_superuser('staff', password='staff-pass-123'))
+        order = self.orders['pending'][0]
+        response = self.client.get(reverse('admin:paintingapp_order_change', args=[order.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'name="status"')
+
+
+class OrderArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=1, artists=1, products=5, customers=0, orders=0, submissions=0)
+        cls.customer = User.objects.create_user('customer', password='customer-pass-123')
+        orders = Order.objects.bulk_create([
+            Order(user=cls.customer, total_amount=100, status=status)
+            for status in ('delivered', 'cancelled', 'delivered', 'pending', 'shipped')
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=1, price=100)
+            for order in orders for product_id in data['product_ids'][:2]
+        ])
+        cls.old = timezone.now() - timedelta(days=400)
+        Order.objects.filter(pk__in=[order.pk for order in orders[1:]]).update(updated_at=cls.old)
+
+    def history(self):
+        response = self.client.get(reverse('order_history'))
+        return [(order.pk, [item.product_id for item in order.items]) for order in response.context['orders']]
+
+    def test_moves_old_closed_orders_in_batches(self):
+        moved = archive.archive_orders(archive.cutoff(), batch_size=1)
+        self.assertEqual(moved, 2)  # the recent delivery and the open orders stay
+        self.assertEqual(set(ArchivedOrder.objects.values_list('status', flat=True)), {'cancelled', 'delivered'})
+        self.assertEqual(ArchivedOrderItem.objects.count(), 4)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(OrderItem.objects.count(), 6)
+        archived = ArchivedOrder.objects.first()
+        self.assertEqual(archived.updated_at, self.old)
+
+    def test_history_reads_both_tables(self):
+        self.client.force_login(self.customer)
+        before = self.history()
+        archive.archive_orders(archive.cutoff())
+        with self.assertNumQueries(4):
+            self.assertEqual(self.history(), before)
+
+    def test_sales_counts_include_the_archive(self):
+        def counts():
+            rebuild_neighbors()
+            return archive.units_sold(), list(ProductNeighbor.objects.values_list('product_id', 'neighbor_id', 'rank'))
+        before = counts()
+        self.assertEqual(sum(before[0].values()), 10)
+        archive.archive_orders(archive.cutoff())
+        self.assertEqual(counts(), before)
+
+    def test_admin_is_read_only(self):
+        archive.archive_orders(archive.cutoff())
+        order = ArchivedOrder.objects.first()
+        self.client.force_login(User.objects.create_superuser('staff', password='staff-pass-123'))
+        response = self.client.get(reverse('admin:paintingapp_archivedorder_change', args=[order.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'name="status"')
+        self.assertNotContains(response, 'name="items-0-quantity"')
+        self.assertEqual(self.client.post(reverse('admin:paintingapp_archivedorder_delete', args=[order.pk]), {'post': 'yes'}).status_code, 403)
+        self.assertTrue(ArchivedOrder.objects.filter(pk=order.pk).exists())
+
+
+class ArtistPortfolioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=1, artists=3, products=0, customers=0, orders=0, submissions=0)
+        cls.artist = data['artists'][0]
+        cls.category = data['categories'][0]
+        Product.objects.bulk_create([
+            Product(name=f'Work {i}', description='d', price=100, stock=5, image='products/seed.jpg',
+                    category=cls.category, artist=cls.artist)
+            for i in range(30)
+        ])
+        artist_stats.refresh()
+        cls.buyer = User.objects.create_user('buyer')
+
+    def test_portfolio_pages_by_cursor(self):
+        url = reverse('artist_detail', args=[self.artist.pk])
+        first = self.client.get(url)
+        self.assertEqual(len(first.context['products']), 24)
+        second = self.client.get(url, {'cursor': first.context['next_cursor']})
+        self.assertEqual(len(second.context['products']), 6)
+        self.assertIsNone(second.context['next_cursor'])
+        ids = [p.pk for p in first.context['products']] + [p.pk for p in second.context['products']]
+        self.assertEqual(ids, sorted(set(ids), reverse=True))
+        self.assertEqual(self.client.get(url, {'cursor': '!!'}).status_code, 404)
+
+    def test_stats_follow_uploads_orders_and_cancellations(self):
+        product = Product.objects.create(name='New Work', description='d', price=250, stock=5,
+                                         image='products/seed.jpg', category=self.category, artist=self.artist)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.buyer, total_amount=500)
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=250)
+        stats = ArtistStats.objects.get(artist=self.artist)
+        self.assertEqual((stats.work_count, stats.units_sold, stats.revenue), (31, 2, 500))
+        self.assertEqual(stats.last_upload_at, product.created_at)
+
+        fulfilment.transition(Order.objects.filter(pk=order.pk), 'cancelled')
+        stats.refresh_from_db()
+        self.assertEqual((stats.units_sold, stats.revenue), (0, 0))
+        artist_stats.refresh([self.artist.pk])
+        self.assertEqual(ArtistStats.objects.get(artist=self.artist).units_sold, 0)
+
+    def test_list_reads_stats_without_per_row_queries(self):
+        self.client.get(reverse('artist_list'))
+        with self.assertNumQueries(2):  # the page count and one page of artists joined to their stats
+            response = self.client.get(reverse('artist_list'))
+        self.assertContains(response, '30 Works')
+
+
+class ColourFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        factories.seed(categories=2, artists=2, products=6, customers=0, orders=0, submissions=0)
+        cls.red, cls.blue, cls.pending = Product.objects.order_by('id')[:3]
+        for product, rgb in ((cls.red, (210, 25, 35)), (cls.blue, (31, 60, 199))):
+            product.palette, product.colour_bins = palette.encode([(rgb, 0.6), ((244, 239, 242), 0.4)])
+            product.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def painting(self, *bands):
+        """A synthetic image made of vertical bands of (rgb, width)"""
+        pixels = np.concatenate([np.full((60, width, 3), rgb, dtype=np.uint8) for rgb, width in bands], axis=1)
+        return Image.fromarray(pixels)
+
+    def test_kmeans_finds_the_dominant_colours(self):
+        img = self.painting(((210, 25, 35), 150), ((31, 60, 199), 90), ((250, 250, 250), 60))
+        colours = palette.dominant_colours(img)
+        self.assertEqual(len(colours), 3)
+        for (rgb, share), (expected, expected_share) in zip(colours, (((210, 25, 35), 0.5), ((31, 60, 199), 0.3), ((250, 250, 250), 0.2))):
+            self.assertLess(np.linalg.norm(np.subtract(rgb, expected)), 12)
+            self.assertAlmostEqual(share, expected_share, delta=0.03)
+
+    def test_search_filters_by_colour_and_counts_follow(self):
+        response = self.client.get(reverse('search'), {'q': '', 'colour': 'red'})
+        self.assertEqual([p.pk for p in response.context['results']], [self.red.pk])
+        self.assertEqual(response.context['results_count'], 1)
+        self.assertEqual(sum(option['count'] for option in response.context['facets']['category']), 1)
+        self.assertTrue(response.context['filtered'])
+        response = self.client.get(reverse('search'), {'q': '', 'colour': '1f3cc7', 'colour_distance': '20'})
+        self.assertEqual([p.pk for p in response.context['results']], [self.blue.pk])
+
+    def test_api_filters_by_colour(self):
+        response = self.client.get('/api/products/', {'colour': 'white', 'fields': 'palette'})
+        results = response.json()['results']
+        self.assertEqual([item['id'] for item in results], [self.red.pk, self.blue.pk])
+        self.assertEqual(results[0]['palette'], 'd21923 f4eff2')
+        self.assertEqual(self.client.get('/api/products/', {'colour': 'plaid'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/products/', {'colour': 'red', 'colour_distance': '-1'}).status_code, 400)
+
+    def test_backfill_command_extracts_missing_palettes(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, 'products'))
+            self.painting(((31, 60, 199), 100)).save(os.path.join(root, 'products', 'blue.png'))
+            Product.objects.filter(pk=self.pending.pk).update(image='products/blue.png')
+            with self.settings(MEDIA_ROOT=root):
+                call_command('extract_palettes', workers=1, stdout=io.StringIO())
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.palette, '1f3cc7')
+        matches = palette.apply_colour(Product.objects.all(), palette.colour_mask(palette.COLOURS['blue'], 80))
+        self.assertEqual(set(matches.values_list('pk', flat=True)), {self.blue.pk, self.pending.pk})
+
+    def test_replacing_the_image_reschedules_extraction(self):
+        product = Product.objects.get(pk=self.pending.pk)
+        with mock.patch.object(palette, 'schedule') as schedule, \
+                mock.patch('paintingapp.signals.index_product_image'), self.captureOnCommitCallbacks(execute=True):
+            product.image = 'products/replaced.png'
+            product.save()
+        schedule.assert_called_once_with(product)
+
+    def test_decompression_bombs_are_skipped(self):
+        with mock.patch.object(palette, 'extract', side_effect=Image.DecompressionBombError('too many pixels')), \
+                mock.patch.object(palette.Product.objects, 'filter') as update, \
+                self.assertLogs('paintingapp.palette', 'WARNING'):
+            palette.analyse_product(self.pending.pk, mock.MagicMock())
+        update.assert_not_called()
+
+
+class PrerenderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        factories.seed(categories=2, artists=3, products=30, customers=0, orders=0, submissions=0)
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        override = self.settings(PRERENDER_ROOT=root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        prerender.save_dependencies(dict(prerender.build_many(list(prerender.page_paths()))), replace=True)
+
+    def page(self, path):
+        with open(prerender.file_for(path), encoding='utf-8') as f:
+            return f.read()
+
+    def committed(self):
+        """Run the on_commit callbacks on exit, regenerating inline, without touching product images"""
+        stack = ExitStack()
+        stack.enter_context(mock.patch.object(prerender, 'schedule', prerender.regenerate))
+        stack.enter_context(mock.patch.object(palette, 'schedule'))
+        stack.enter_context(mock.patch('paintingapp.signals.index_product_image'))
+        stack.enter_context(mock.patch('paintingapp.signals.similarity_index'))
+        stack.enter_context(self.captureOnCommitCallbacks(execute=True))
+        return stack
+
+    def test_scheduled_changes_are_merged_for_one_pass(self):
+        with mock.patch.object(prerender, 'backlog', prerender.Backlog()), \
+                mock.patch.object(prerender.executor, 'submit') as submit, \
+                mock.patch.object(prerender, 'regenerate') as regenerate:
+            prerender.schedule({'product:1'}, {'/product/1/'})
+            prerender.schedule({'product:1', 'product:2'}, set())
+            prerender.schedule({'categories'}, {'/'})
+            submit.assert_called_once_with(prerender.drain)
+            prerender.drain()
+            regenerate.assert_called_once_with({'product:1', 'product:2', 'categories'}, {'/product/1/', '/'})
+            prerender.schedule({'product:3'}, set())  # the drain finished, so this needs a new one
+        self.assertEqual(submit.call_count, 2)
+
+    def test_background_failures_are_logged(self):
+        error = IntegrityError('UNIQUE constraint failed: unique_prerender_dependency')
+        with mock.patch.object(prerender, 'regenerate', side_effect=error), \
+                self.assertLogs('paintingapp.prerender', 'ERROR') as logs:
+            prerender.regenerate_in_background({'product:1'}, set())
+        self.assertIn('unique_prerender_dependency', logs.output[0])
+
+    def test_pages_are_anonymous_and_record_what_they_show(self):
+        product = Product.objects.select_related('artist', 'category').first()
+        path = reverse('product_detail', args=[product.pk])
+        html = self.page(path)
+        self.assertIn(product.name, html)
+        self.assertIn('Please <a href="/login/">login</a>', html)
+        self.assertNotIn('name="csrfmiddlewaretoken" value=', html)
+        self.assertTrue(os.path.exists(prerender.file_for(path) + '.br'))
+        keys = set(PrerenderDependency.objects.filter(path=path).values_list('key', flat=True))
+        self.assertLessEqual({f'product:{product.pk}', f'artist:{product.artist_id}', f'category:{product.category_id}'}, keys)
+        self.assertIn('category-products', PrerenderDependency.objects.filter(path=reverse('category_list')).values_list('key', flat=True))
+
+    def test_saving_a_product_rebuilds_only_the_pages_showing_it(self):
+        product = Product.objects.order_by('id').first()
+        dependent = set(PrerenderDependency.objects.filter(key=f'product:{product.pk}').values_list('path', flat=True))
+        self.assertIn(reverse('category_detail', args=[product.category_id]), dependent)
+        product.name = 'Renamed Sunset'
+        with mock.patch.object(prerender, 'build', wraps=prerender.build) as build, self.committed():
+            product.save()
+        built = {call.args[0] for call in build.call_args_list}
+        self.assertEqual(built, dependent | {reverse('category_list')})
+        self.assertLess(len(built), Product.objects.count())
+        for path in dependent:
+            self.assertIn('Renamed Sunset', self.page(path))
+
+    def test_new_and_deleted_products_add_and_remove_their_page(self):
+        existing = Product.objects.order_by('id').first()
+        with self.committed():
+            product = Product.objects.create(name='Fresh Canvas', description='d', price=100, stock=1, image='products/seed.jpg',
+                                             category=existing.category, artist=existing.artist)
+        path = reverse('product_detail', args=[product.pk])
+        self.assertIn('Fresh Canvas', self.page(path))
+        with self.committed():
+            product.delete()
+        self.assertFalse(os.path.exists(prerender.file_for(path)))
+        self.assertFalse(PrerenderDependency.objects.filter(path=path).exists())
+
+    def test_stock_moved_by_reservations_rebuilds_the_product_page(self):
+        product = Product.objects.order_by('id').first()
+        Product.objects.filter(pk=product.pk).update(stock=5, reserved=0)
+        buyer = User.objects.create_user('buyer')
+        path = reverse('product_detail', args=[product.pk])
+        with self.committed():
+            reservations.reserve(buyer, product.pk, 2)
+        self.assertIn('3 pieces available', self.page(path))
+        with self.committed():
+            reservations.set_quantity(buyer, product.pk, 5, 2)
+        self.assertIn('Every remaining piece', self.page(path))
+        with self.committed(), transaction.atomic():
+            reservations.purchase(buyer, {str(product.pk): 5})
+        self.assertIn('Currently out of stock', self.page(path))
+
+
+class SharedCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        factories.seed(categories=2, artists=2, products=6, customers=0, orders=0, submissions=0)
+        cls.user = User.objects.create_user('viewer', password='pw')
+        cls.product = Product.objects.order_by('id').first()
+
+    def test_catalog_pages_are_the_same_for_everyone_and_public(self):
+        urls = [reverse('home'), reverse('category_list'), reverse('category_detail', args=[self.product.category_id]),
+                reverse('product_detail', args=[self.product.pk])]
+        anonymous = [self.client.get(url) for url in urls]
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['cart'] = {str(self.product.pk): 2}
+        session.save()
+        for url, before in zip(urls, anonymous):
+            response = self.client.get(url)
+            self.assertEqual(response.content, before.content)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('max-age=60', response['Cache-Control'])
+            self.assertNotIn('Cookie', response.get('Vary', ''))
+            self.assertFalse(response.cookies)
+
+    def test_session_state_carries_the_per_visitor_parts(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('add_to_cart', args=[self.product.pk]))
+        state = self.client.get(reverse('session_state'))
+        self.assertIn('private', state['Cache-Control'])
+        body = state.json()
+        self.assertTrue(body['authenticated'])
+        self.assertEqual(body['username'], 'viewer')
+        self.assertEqual(body['cart_count'], 1)
+        self.assertEqual(body['messages'], [{'tags': 'success', 'text': f'{self.product.name} added to cart!'}])
+        self.assertTrue(body['csrf_token'])
+        self.assertEqual(self.client.get(reverse('session_state')).json()['messages'], [])  # shown once
+
+    @override_settings(SHARED_CACHE_VIEWS=['view_cart'])
+    def test_pages_that_read_the_session_stay_private(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('paintingapp.middleware', 'WARNING') as logs:
+            response = self.client.get(reverse('view_cart'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        self.assertEqual(logs.records[0].getMessage(), 'view_cart was listed in SHARED_CACHE_VIEWS but depends on cookies')
+
+
+class ImportCatalogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=1, artists=1, products=0, customers=0, orders=0, submissions=0)
+        cls.category = data['categories'][0]
+        cls.artist = data['artists'][0]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        Image.new('RGB', (8, 8), 'blue').save(os.path.join(self.tmp.name, 'blue.png'))
+        self.source = os.path.join(self.tmp.name, 'catalog.jsonl')
+        rows = [
+            {'name': 'First', 'artist': self.artist.name, 'category': self.category.name, 'price': 100, 'image': 'blue.png'},
+            {'name': 'Numbered', 'artist': 42, 'category': self.category.name, 'price': 100, 'image': 'blue.png'},
+            {'name': 'Listed', 'artist': self.artist.name, 'category': ['x'], 'stock': [1], 'image': 'blue.png'},
+            ['not', 'a', 'product'],
+            {'name': 'Second', 'artist': self.artist.name, 'category': self.category.name, 'price': 200, 'image': 'blue.png'},
+        ]
+        with open(self.source, 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+
+    def run_import(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        index = SimilarityIndex(os.path.join(self.tmp.name, 'similarity.bin'))
+        with override_settings(MEDIA_ROOT=self.tmp.name, PRERENDER_ROOT=os.path.join(self.tmp.name, 'none')), \
+                mock.patch('paintingapp.management.commands.import_catalog.similarity_index', index):
+            call_command('import_catalog', self.source, '--image-dir', self.tmp.name, '--workers', '1',
+                         '--batch-size', '2', *args, stdout=stdout, stderr=stderr)
+        self.output, self.index = stdout.getvalue(), index
+        return stderr.getvalue()
+
+    def test_malformed_json_values_are_rejected_rows(self):
+        errors = self.run_import()
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['First', 'Second'])
+        self.assertIn('Row 2: unknown artist 42', errors)
+        self.assertIn('Row 3: unknown category', errors)
+        self.assertIn('Row 4: not an object', errors)
+
+    def test_resume_skips_rows_committed_before_the_checkpoint(self):
+        self.run_import()
+        run = Product.objects.get(name='First').image.name.split('_')[1]
+        with open(self.source + '.checkpoint', 'w') as f:
+            json.dump({'rows': 4, 'run': run}, f)  # as if the run died between the last commit and its checkpoint
+        self.run_import('--resume')
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['First', 'Second'])
+
+    def test_runs_never_share_image_names(self):
+        self.run_import()
+        self.run_import()
+        names = list(Product.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 4)
+        self.assertEqual(len(set(names)), 4)
+
+    def test_imported_products_are_indexed_and_analysed(self):
+        self.run_import()
+        self.assertEqual(len(self.index), 2)
+        self.assertFalse(Product.objects.filter(colour_bins__isnull=True).exists())
+        self.assertTrue(self.output.rstrip().endswith('Restart the web workers to add the new products to the search suggestions'))
+
+
+class CatalogFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        factories.seed(categories=2, artists=2, products=5, customers=0, orders=0, submissions=0)
+        cls.products = list(Product.objects.order_by('id'))
+
+    def body(self, response):
+        content = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        return content.decode()
+
+    def test_csv_export(self):
+        response = self.client.get(reverse('export_catalog', args=['csv']))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="products.csv"')
+        lines = self.body(response).splitlines()
+        self.assertEqual(lines[0], 'id,name,description,price,stock,category,artist,image,created_at')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(p.pk) for p in self.products])
+
+    def test_jsonl_export(self):
+        response = self.client.get(reverse('export_catalog', args=['jsonl']), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        rows = [json.loads(line) for line in self.body(response).splitlines()]
+        self.assertEqual([(row['id'], row['name']) for row in rows], [(p.pk, p.name) for p in self.products])
+        self.assertEqual(self.client.get('/export/products.xml').status_code, 404)
+
+    def test_sitemap_index(self):
+        response = self.client.get(reverse('sitemap_index'), HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('<loc>http://testserver/sitemap-1.xml</loc>', self.body(response))
+
+    def test_sitemap_section(self):
+        response = self.client.get(reverse('sitemap_section', args=[1]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = self.body(response)
+        for product in self.products:
+            self.assertIn(f'<loc>http://testserver{reverse("product_detail", args=[product.pk])}</loc>', body)
+        self.assertEqual(self.client.get(reverse('sitemap_section', args=[2])).status_code, 404)
+
+
+class RelatedProductsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=1, artists=2, products=8, customers=3, orders=10, submissions=0)
+        cls.product = Product.objects.get(pk=data['product_ids'][0])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_category_best_sellers_are_cached(self):
+        related = related_products(self.product)
+        self.assertEqual(len(related), 4)
+        self.assertNotIn(self.product, related)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(related_products(self.product), related)
+        self.assertFalse([query for query in captured.captured_queries if 'SUM(' in query['sql']])
+
+
+class CoPurchaseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        data = factories.seed(categories=1, artists=1, products=4, customers=0, orders=0, submissions=0)
+        cls.a, cls.b, cls.c, cls.d = data['product_ids'][:4]
+        cls.buyer = User.objects.create_user('basket')
+
+    def setUp(self):
+        cache.clear()
+
+    def order(self, *product_ids, archived=False):
+        if archived:
+            now = timezone.now()
+            order = ArchivedOrder.objects.create(
+                id=10_000 + ArchivedOrder.objects.count(), user=self.buyer, payment_method='COD', total_amount=0,
+                status='delivered', created_at=now, updated_at=now,
+            )
+            for offset, pk in enumerate(product_ids):
+                ArchivedOrderItem.objects.create(id=order.id * 10 + offset, order=order, product_id=pk, quantity=1, price=1)
+        else:
+            order = Order.objects.create(user=self.buyer, total_amount=0)
+            for pk in product_ids:
+                OrderItem.objects.create(order=order, product_id=pk, quantity=1, price=1)
+
+    def test_scores_are_cosine_normalised_and_ranked(self):
+        # a is in three baskets, twice with b and once with c
+        links = co_purchase_neighbors(np.array([1, 1, 2, 2, 3, 3, 3]), np.array([5, 6, 5, 6, 5, 7, 7]), top_k=2)
+        scores = {(p, n): (round(s, 4), r) for p, n, s, r in links}
+        self.assertEqual(scores, {
+            (5, 6): (round(2 / np.sqrt(6), 4), 0),
+            (5, 7): (round(1 / np.sqrt(3), 4), 1),
+            (6, 5): (round(2 / np.sqrt(6), 4), 0),
+            (7, 5): (round(1 / np.sqrt(3), 4), 0),
+        })
+        self.assertEqual([(p, n) for p, n, s, r in co_purchase_neighbors([1, 1, 1], [5, 6, 7], top_k=1) if p == 5], [(5, 6)])
+        self.assertEqual(co_purchase_neighbors([], [], top_k=3), [])
+
+    def test_rebuild_reads_hot_and_archived_baskets(self):
+        self.order(self.a, self.b)
+        self.order(self.a, self.b, archived=True)
+        self.order(self.a, self.c)
+        self.assertEqual(rebuild_neighbors(top_k=5), 4)
+        ranked = list(ProductNeighbor.objects.filter(product_id=self.a).order_by('rank').values_list('neighbor_id', 'rank'))
+        self.assertEqual(ranked, [(self.b, 0), (self.c, 1)])
+        self.assertAlmostEqual(ProductNeighbor.objects.get(product_id=self.c).score, 1 / np.sqrt(3), places=5)
+
+    def test_best_sellers_rank_hot_and_archived_units_in_one_query(self):
+        category = Product.objects.get(pk=self.a).category_id
+        self.order(self.c)
+        self.order(self.b, archived=True)
+        self.order(self.b, self.c, archived=True)
+        self.order(self.c, archived=True)
+        with self.assertNumQueries(1):
+            ranked = best_sellers(category, 2)
+        self.assertEqual(ranked, [self.c, self.b])
+
+
+class SimilarityIndexTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index = SimilarityIndex(os.path.join(tmp.name, 'similarity.bin'))
+
+    def histogram(self, bin):
+        histogram = np.zeros(HISTOGRAM_BINS, dtype=np.float32)
+        histogram[bin] = 1
+        return histogram
+
+    def test_newest_record_wins_and_tombstones_hide_products(self):
+        for product_id in (1, 2, 3):
+            self.index.add(product_id, 0, self.histogram(product_id))
+        self.index.add(2, 0, self.histogram(9))  # re-indexed with a new image
+        self.assertEqual([match[0] for match in self.index.query(0, self.histogram(2), k=1)], [1])
+        self.assertEqual(self.index.query(0, self.histogram(9), k=1), [(2, 0.0)])
+        self.index.remove(3)
+        self.assertEqual(len(self.index), 2)
+        self.assertIsNone(self.index.features(3))
+        self.assertNotIn(3, [match[0] for match in self.index.similar_to(1)])
+
+    def test_saves_reindex_only_when_the_image_changes(self):
+        factories.seed(categories=1, artists=1, products=1, customers=0, orders=0, submissions=0)
+        product = Product.objects.get()
+        with mock.patch('paintingapp.signals.index_product_image') as index, \
+                mock.patch('paintingapp.signals.similarity_index') as similarity, \
+                mock.patch.object(palette, 'schedule'):
+            with self.captureOnCommitCallbacks(execute=True):
+                product.name = 'Renamed'
+                product.save()
+            self.assertFalse(index.called)
+            with self.captureOnCommitCallbacks(execute=True):
+                product.image = 'products/replaced.jpg'
+                product.save()
+            index.assert_called_once_with(product)
+            pk = product.pk
+            with self.captureOnCommitCallbacks(execute=True):
+                product.delete()
+        similarity.remove.assert_called_once_with(pk)
+
+    def test_decompression_bombs_are_not_indexed(self):
+        factories.seed(categories=1, artists=1, products=1, customers=0, orders=0, submissions=0)
+        product = Product.objects.get()
+        bomb = Image.DecompressionBombError('too many pixels')
+        with mock.patch('paintingapp.similarity.extract_features', side_effect=bomb):
+            self.assertIsNone(features_for((product.pk, 'products/huge.png')))
+        with mock.patch('paintingapp.signals.extract_features', side_effect=bomb), \
+                mock.patch('paintingapp.signals.similarity_index') as similarity, \
+                mock.patch.object(product.image, 'open'), \
+                self.assertLogs('paintingapp.signals', 'WARNING'):
+            index_product_image(product)
+        self.assertFalse(similarity.add.called)
+
+
+class ImageUploadTests(TestCase):
+
+    def upload(self):
+        return SimpleUploadedFile('huge.png', b'not really huge', content_type='image/png')
+
+    @mock.patch('paintingapp.views.image_dhash', side_effect=Image.DecompressionBombError('too many pixels'))
+    def test_decompression_bombs_are_rejected_drawings(self, dhash):
+        response = self.client.post(reverse('submit_drawing'), {'name': 'n', 'description': 'd', 'image': self.upload()})
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('paintingapp.previews.preview_data_uri', side_effect=Image.DecompressionBombError('too many pixels'))
+    def test_decompression_bombs_are_rejected_previews(self, preview):
+        response = self.client.post(reverse('customize_preview'), {'style': 'oil', 'image': self.upload()})
+        self.assertEqual(response.status_code, 400)
+
+
+
+@override_settings(SUBMISSION_DUPLICATE_DISTANCE=6)
+class DuplicateSubmissionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=tmp.name))
+        self.hashes = self.enterContext(mock.patch('paintingapp.views.submission_hashes', SubmissionHashIndex()))
+
+    def drawing(self, name, touch_up=False):
+        img = Image.new('L', (90, 80))
+        img.putdata([(x * 3 + y * 2) % 256 for y in range(80) for x in range(90)])
+        if touch_up:
+            img.putpixel((0, 0), 255)
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def submit(self, image):
+        return self.client.post(reverse('submit_drawing'), {'name': 'n', 'description': 'd', 'image': image}).json()
+
+    def test_near_duplicates_are_saved_unapproved(self):
+        first = self.submit(self.drawing('first.png'))
+        self.assertIsNone(first['duplicate_of'])
+        second = self.submit(self.drawing('second.png', touch_up=True))
+        self.assertEqual(second['duplicate_of'], first['submission']['id'])
+        approved = dict(UserSubmission.objects.values_list('id', 'is_approved'))
+        self.assertEqual(approved, {first['submission']['id']: True, second['submission']['id']: False})
+
+    def test_backfilled_hashes_reach_a_warm_index(self):
+        image_hash = image_dhash(self.drawing('old.png'))
+        old = UserSubmission.objects.create(name='old', description='d', image='user_submissions/old.png')
+        newer = UserSubmission.objects.create(name='new', description='d', image='user_submissions/new.png', image_hash=1)
+        self.assertIsNone(self.hashes.find_duplicate(image_hash))
+        UserSubmission.objects.filter(pk=old.pk).update(image_hash=to_signed(image_hash))  # hash_submissions
+        self.assertEqual(self.hashes.find_duplicate(image_hash), old.pk)
+        self.assertLess(old.pk, newer.pk)
+
+
+
+
+class SubmissionPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        UserSubmission.objects.bulk_create(
+            UserSubmission(name=f'drawing {i}', description='d', image=f'user_submissions/{i}.png', is_approved=i != 3)
+            for i in range(14)
+        )
+        tied = timezone.now() - timedelta(days=1)
+        ids = list(UserSubmission.objects.order_by('id').values_list('id', flat=True))
+        UserSubmission.objects.filter(id__in=ids[2:9]).update(created_at=tied)  # seven drawings share a timestamp
+        cls.expected = list(
+            UserSubmission.objects.filter(is_approved=True).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def test_cursor_pages_through_created_at_ties(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = submission_page(cursor, limit=2)
+            seen += [submission.id for submission in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(seen), 13)
+
+    def test_page_endpoint_follows_next(self):
+        first = self.client.get(reverse('user_submissions')).context
+        self.assertEqual([s.id for s in first['submissions']], self.expected[:12])
+        response = self.client.get(reverse('user_submissions_page'), {'cursor': first['next_cursor']}).json()
+        self.assertIsNone(response['next'])
+        self.assertIn(UserSubmission.objects.get(pk=self.expected[-1]).name, response['html'])
+        self.assertEqual(response['html'].count('submission-card'), 1)
+
+    def test_bad_cursors_are_400(self):
+        for cursor in ('%%%', 'bm90LWEtY3Vyc29y', api.encode_cursor('yesterday', 5), api.encode_cursor('2024-01-01', 'x')):
+            response = self.client.get(reverse('user_submissions_page'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class PreviewTests(TestCase):
+
+    def painting(self, width, height, mode='RGB'):
+        a = np.zeros((height, width, 3), dtype=np.uint8)
+        a[..., 0] = np.arange(width) * 255 // width
+        a[..., 2] = np.arange(height)[:, None] * 255 // height
+        return Image.fromarray(a).convert(mode)
+
+    def jpeg(self, img):
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def test_every_style_and_frame_renders_rgb(self):
+        border = {frame: max(2, int(64 * thickness)) for frame, (_, thickness, _) in previews.FRAMES.items()}
+        for style in previews.STYLES:
+            for frame in (*previews.FRAMES, 'none'):
+                pixels = previews.render(self.painting(300, 150), style, frame, 128)
+                pad = 2 * border.get(frame, 0)
+                self.assertEqual(pixels.shape, (64 + pad, 128 + pad, 3), (style, frame))
+                self.assertEqual(pixels.dtype, np.uint8)
+        sketch = previews.render(self.painting(300, 150), 'sketch', 'none', 128)
+        self.assertTrue((sketch[..., 0] == sketch[..., 2]).all())
+
+    def test_large_jpegs_are_drafted_and_other_modes_converted_after_shrinking(self):
+        with Image.open(io.BytesIO(self.jpeg(self.painting(2048, 1024)))) as img:
+            pixels = previews.render(img, 'oil', 'none', 256)
+            self.assertLess(img.size[0], 2048)  # decoded at a reduced scale
+        self.assertEqual(pixels.shape, (128, 256, 3))
+        for mode in ('L', 'P', 'RGBA'):
+            self.assertEqual(previews.render(self.painting(400, 400, mode), 'popart', 'none', 256).shape, (256, 256, 3))
+        self.assertEqual(previews.render(self.painting(100, 50), 'oil', 'none', 256).shape, (50, 100, 3))
+
+    def test_data_uri_is_cached_per_style(self):
+        cache.clear()
+        image = self.jpeg(self.painting(120, 80))
+        uri = previews.preview_data_uri(image, 'watercolor', 'modern', 256)
+        self.assertTrue(uri.startswith('data:image/jpeg;base64,'))
+        with mock.patch.object(previews, 'render', wraps=previews.render) as render:
+            self.assertEqual(previews.preview_data_uri(image, 'watercolor', 'modern', 256), uri)
+            render.assert_not_called()
+            previews.preview_data_uri(image, 'oil', 'modern', 256)
+        render.assert_called_once()
+
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    # The database copy is taken with SQLite's backup API, which waits out open write transactions
+
+    def setUp(self):
+        # Saves commit for real here, so keep their on_commit work away from the real index
+        for target in ('paintingapp.signals.index_product_image', 'paintingapp.signals.similarity_index'):
+            self.enterContext(mock.patch(target))
+        self.enterContext(mock.patch.object(palette, 'schedule'))
+        factories.seed(categories=1, artists=1, products=3, customers=0, orders=0, submissions=0)
+
+    @mock.patch('paintingapp.management.commands.benchmark.TRAFFIC_MIX', [('product_detail', 1), ('place_order', 1)])
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_reports_json_and_leaves_the_database_alone(self):
+        stock = dict(Product.objects.values_list('id', 'stock'))
+        out = io.StringIO()
+        call_command('benchmark', threads=2, requests=4, warmup=1, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['total']['requests'], 8)
+        self.assertEqual(report['total']['errors'], 0)
+        self.assertLessEqual(set(report['views']), {'product_detail', 'place_order'})
+        for view in report['views'].values():
+            self.assertEqual(set(view), {'requests', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'})
+            self.assertLessEqual(view['p50_ms'], view['p99_ms'])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='benchmark_').exists())
+        self.assertEqual(dict(Product.objects.values_list('id', 'stock')), stock)
+
+
+class ServerTimingTests(TestCase):
+
+    def test_only_staff_see_server_timing(self):
+        url = reverse('view_cart')
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        self.assertIn('db;dur=', self.client.get(url)['Server-Timing'])
+        self.assertNotIn('Server-Timing', self.client.get(reverse('category_list')))  # shared-cacheable
+
+    @override_settings(DEBUG=True)
+    def test_debug_shows_server_timing(self):
+        self.assertIn('total;dur=', self.client.get(reverse('view_cart'))['Server-Timing'])
+
+    def test_duplicate_statements_are_capped(self):
+        stats = RequestStats()
+        for n in range(5 * DUPLICATES_PER_VIEW):
+            stats.record('view', 0.01, 2, [(f'SELECT {n}', 2)])
+        self.assertLessEqual(len(stats.duplicates['view']), 2 * DUPLICATES_PER_VIEW)
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        factories.seed(categories=2, artists=2, products=7, customers=0, orders=0, submissions=0)
+        cls.ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+    def test_fields_pick_the_columns(self):
+        results = self.client.get('/api/products/', {'fields': 'name,price'}).json()['results']
+        self.assertEqual(set(results[0]), {'id', 'name', 'price'})
+        self.assertEqual(self.client.get('/api/products/', {'fields': 'name,secret'}).status_code, 400)
+
+    def test_cursor_pages_through_every_row_once(self):
+        seen, url, params = [], '/api/products/', {'limit': 3, 'fields': 'id'}
+        while url:
+            body = self.client.get(url, params).json()
+            seen += [item['id'] for item in body['results']]
+            url, params = body['next'], None
+        self.assertEqual(seen, self.ids)
+
+    def test_filters(self):
+        category = Product.objects.get(pk=self.ids[0]).category_id
+        results = self.client.get('/api/products/', {'category': category, 'fields': 'category'}).json()['results']
+        self.assertEqual(len(results), Product.objects.filter(category_id=category).count())
+        self.assertEqual({item['category'] for item in results}, {category})
+
+    def test_etag_answers_304(self):
+        response = self.client.get('/api/categories/')
+        again = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], response['ETag'])
+
+    def test_malformed_parameters_are_400(self):
+        for params in ({'limit': 'ten'}, {'cursor': '%%%'}, {'cursor': 'bm90LWFuLWlk'}, {'category': 'x'}):
+            response = self.client.get('/api/products/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json(), {'error': 'Invalid limit, cursor or filter'})
@@ -0,0 +1,81 @@
+"""Per-client rate limits kept in the cache.
+
+Each client gets a bucket of `burst` tokens per endpoint that is refilled all
+at once every burst / rate seconds. The bucket is a counter whose key names the
+current refill period, so checking a request is a single atomic cache.incr and
+the key expires by itself; only the first request of a period pays for an add().
+Rejected requests also spend tokens, so a client that keeps hammering stays
+blocked until the period rolls over.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+def client_ip(request):
+    """The caller's address, trusting X-Forwarded-For only as far as THROTTLE_PROXY_COUNT proxies"""
+    proxies = settings.THROTTLE_PROXY_COUNT
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',')]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def take_token(scope, client, burst, per_minute, now=None):
+    """Spend one token from the client's bucket; returns 0 if allowed, else seconds until the refill"""
+    now = time.time() if now is None else now
+    period = burst * 60 / per_minute
+    slot = int(now // period)
+    key = f'throttle:{scope}:{client}:{slot}'
+    cache = caches[settings.THROTTLE_CACHE]
+    try:
+        spent = cache.incr(key)
+    except ValueError:  # first request this period
+        if cache.add(key, 1, math.ceil(period) + 1):
+            spent = 1
+        else:  # another worker created it first
+            spent = cache.incr(key)
+    if spent <= burst:
+        return 0
+    return max(1, math.ceil((slot + 1) * period - now))
+
+
+def check(request, scope):
+    """None if the request may proceed, otherwise the 429 response for it"""
+    limit = settings.THROTTLE_RATES.get(scope)
+    if not limit:
+        return None
+    retry_after = take_token(scope, client_key(request), limit['burst'], limit['per_minute'])
+    if not retry_after:
+        return None
+    response = JsonResponse({
+        'error': f'Too many requests, please try again in {retry_after} seconds',
+        'retry_after': retry_after,
+    }, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def throttle(scope):
+    """Limit a view with the THROTTLE_RATES entry for scope"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return check(request, scope) or view(request, *args, **kwargs)
+        wrapped.throttled = True
+        return wrapped
+    return decorator
+
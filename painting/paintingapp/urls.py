@@ -8,9 +8,12 @@ urlpatterns = [
     path('contact/', views.contact, name='contact'),
     path('charity/', views.charity, name='charity'),
     path('customize/', views.customize, name='customize'),
+    path('customize/preview/', views.customize_preview, name='customize_preview'),
     path('save-customized-painting/', views.save_customized_painting, name='save_customized_painting'),
     path('customized-painting/<int:pk>/', views.customized_painting_detail, name='customized_painting_detail'),
     path('search/', views.search, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+    path('session/', views.session_state, name='session_state'),
     
     # Authentication URLs
     path('signup/', views.signup, name='signup'),
@@ -24,6 +27,7 @@ urlpatterns = [
     
     # Product URLs
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product_detail'),
+    path('products/<int:pk>/similar/', views.similar_products_json, name='similar_products'),
     
     # Cart URLs
     path('cart/', views.view_cart, name='view_cart'),
@@ -48,4 +52,19 @@ urlpatterns = [
     path('chatbot/', views.chatbot, name='chatbot'),
     path('submit-drawing/', views.submit_drawing, name='submit_drawing'),
     path('submissions/', views.user_submissions, name='user_submissions'),
+    path('submissions/page/', views.user_submissions_page, name='user_submissions_page'),
+
+    # Catalog feeds
+    path('export/products.<str:fmt>', views.export_catalog, name='export_catalog'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemap-<int:section>.xml', views.sitemap_section, name='sitemap_section'),
+
+    # JSON API
+    path('api/products/', views.api_products, name='api_products'),
+    path('api/artists/', views.api_artists, name='api_artists'),
+    path('api/categories/', views.api_categories, name='api_categories'),
+
+    # Staff tools
+    path('__perf/', views.perf_dashboard, name='perf_dashboard'),
+    path('metrics', views.metrics_endpoint, name='metrics'),
 ] 
\ No newline at end of file
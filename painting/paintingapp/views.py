@@ -1,32 +1,49 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from .models import Category, Product, Artist, Order, OrderItem, UserSubmission, CustomizedPainting
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
+from django.core.exceptions import PermissionDenied
 from django.views.generic import ListView, DetailView
 from django.views.generic.edit import CreateView, UpdateView
 from django.urls import reverse_lazy, reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.mail import send_mail
 from django.conf import settings
 from .forms import ProductForm, ArtistUpdateForm
 from django.db.models import Q
-from django.db import models
+from django.db import models, transaction
+from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
+from django.middleware.csrf import get_token
 from django.views.decorators.http import require_POST
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+from django.utils.cache import patch_vary_headers
+from . import api, archive, compression, facets, feeds, palette
+from .recommendations import related_products
+from .similarity import similarity_index
+from .dedupe import image_dhash, submission_hashes, to_signed
+from .retrieval import chat_index, parse_price
+from .suggest import suggest_index
+from . import metrics, previews, reservations
+from .perf import request_stats
+from .throttling import client_ip, throttle
 import json
 import base64
+from datetime import datetime
+from PIL import Image
 
 def home(request):
     categories = Category.objects.all()[:3]  # Get first 3 categories
-    featured_products = Product.objects.filter(is_featured=True)[:4]  # Get 4 featured products
+    featured_products = Product.objects.filter(is_featured=True).select_related('artist')[:4]  # Get 4 featured products
     featured_artists = Artist.objects.filter(is_featured=True)[:3]  # Get 3 featured artists
-    recent_submissions = UserSubmission.objects.filter(is_approved=True).order_by('-created_at')[:6]
+    recent_submissions = UserSubmission.objects.filter(is_approved=True).select_related('artist').order_by('-created_at')[:6]
     
     context = {
         'categories': categories,
@@ -36,6 +53,18 @@ def home(request):
     }
     return render(request, 'paintingapp/home.html', context)
 
+@never_cache
+def session_state(request):
+    """The per-visitor parts of every page, fetched by base.html so the page HTML can be shared-cached"""
+    cart = request.session.get('cart', {})
+    return JsonResponse({
+        'authenticated': request.user.is_authenticated,
+        'username': request.user.get_username() if request.user.is_authenticated else '',
+        'cart_count': sum(cart.values()),
+        'messages': [{'tags': message.tags, 'text': str(message)} for message in messages.get_messages(request)],
+        'csrf_token': get_token(request),
+    })
+
 def about(request):
     return render(request, 'paintingapp/about.html')
 
@@ -83,7 +112,7 @@ class CategoryDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products_list = Product.objects.filter(category=self.object)
+        products_list = Product.objects.filter(category=self.object).select_related('artist').order_by('id')
         paginator = Paginator(products_list, self.paginate_by)
         page = self.request.GET.get('page')
         products = paginator.get_page(page)
@@ -96,6 +125,41 @@ class ProductDetailView(DetailView):
     template_name = 'paintingapp/product_detail.html'
     context_object_name = 'product'
 
+    def get_queryset(self):
+        return Product.objects.select_related('artist', 'category')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['related_products'] = related_products(self.object)
+        context['similar_products'] = similar_products(self.object.pk, 4)
+        return context
+
+def similar_products(product_id, count):
+    """Products whose images look closest to product_id's, nearest first"""
+    matches = similarity_index.similar_to(product_id, k=count)
+    products = Product.objects.select_related('artist').in_bulk([match_id for match_id, _ in matches])
+    return [products[match_id] for match_id, _ in matches if match_id in products]
+
+def similar_products_json(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    try:
+        count = min(max(int(request.GET.get('count', 8)), 1), 50)
+    except ValueError:
+        count = 8
+    matches = similarity_index.similar_to(product.pk, k=count)
+    products = Product.objects.in_bulk([product_id for product_id, _ in matches])
+    return JsonResponse({
+        'product': product.pk,
+        'similar': [{
+            'id': product_id,
+            'name': products[product_id].name,
+            'price': products[product_id].price,
+            'image': products[product_id].image.url if products[product_id].image else None,
+            'url': reverse('product_detail', args=[product_id]),
+            'distance': round(distance, 4),
+        } for product_id, distance in matches if product_id in products]
+    })
+
 @login_required
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
@@ -106,28 +170,30 @@ def add_to_cart(request, product_id):
     
     cart = request.session.get('cart', {})
     
-    if str(product_id) in cart:
-        if cart[str(product_id)] < product.stock:
-            cart[str(product_id)] += 1
+    if not reservations.reserve(request.user, product_id):
+        metrics.CART_MUTATIONS.labels('add', 'refused').inc()
+        if str(product_id) in cart:
+            messages.warning(request, f'Sorry, only {cart[str(product_id)]} pieces available.')
         else:
-            messages.warning(request, f'Sorry, only {product.stock} pieces available.')
-            return redirect('product_detail', pk=product_id)
-    else:
-        cart[str(product_id)] = 1
+            messages.error(request, 'Sorry, every remaining piece is currently in other carts.')
+        return redirect('product_detail', pk=product_id)
+    cart[str(product_id)] = cart.get(str(product_id), 0) + 1
     
     request.session['cart'] = cart
+    metrics.CART_MUTATIONS.labels('add', 'ok').inc()
     messages.success(request, f'{product.name} added to cart!')
     return redirect('product_detail', pk=product_id)
 
-@login_required
-def view_cart(request):
-    cart = request.session.get('cart', {})
+def get_cart_items(cart):
+    """Resolve a session cart into item dicts and a subtotal with a single query"""
+    products = Product.objects.select_related('artist', 'category').in_bulk([int(pk) for pk in cart])
     cart_items = []
     subtotal = 0
-    shipping = 50  # Fixed shipping cost
-    
+
     for product_id, quantity in cart.items():
-        product = get_object_or_404(Product, id=product_id)
+        product = products.get(int(product_id))
+        if product is None:  # removed from the catalog since it was added
+            continue
         item_total = product.price * quantity
         cart_items.append({
             'product': product,
@@ -135,7 +201,24 @@ def view_cart(request):
             'subtotal': item_total
         })
         subtotal += item_total
-    
+
+    return cart_items, subtotal
+
+def prune_cart(request, cart, cart_items):
+    """Drop products deleted from the catalog out of the session cart; True (with a message) if there were any"""
+    if len(cart_items) == len(cart):
+        return False
+    found = {item['product'].pk for item in cart_items}
+    request.session['cart'] = {pk: quantity for pk, quantity in cart.items() if int(pk) in found}
+    messages.warning(request, 'Some items in your cart are no longer available and have been removed.')
+    return True
+
+@login_required
+def view_cart(request):
+    cart = request.session.get('cart', {})
+    shipping = 50  # Fixed shipping cost
+    cart_items, subtotal = get_cart_items(cart)
+    prune_cart(request, cart, cart_items)
     total = subtotal + shipping
     
     return render(request, 'paintingapp/cart.html', {
@@ -151,19 +234,8 @@ def checkout(request):
     if not cart:
         return redirect('view_cart')
     
-    cart_items = []
-    subtotal = 0
-    
     # Process cart items
-    for product_id, quantity in cart.items():
-        product = get_object_or_404(Product, id=product_id)
-        item_total = product.price * quantity
-        cart_items.append({
-            'product': product,
-            'quantity': quantity,
-            'subtotal': item_total
-        })
-        subtotal += item_total
+    cart_items, subtotal = get_cart_items(cart)
     
     shipping = 100  # Fixed shipping cost
     total = subtotal + shipping
@@ -187,54 +259,53 @@ def place_order(request):
                 return redirect('view_cart')
 
             # Calculate totals
-            subtotal = 0
             shipping_cost = 100  # Fixed shipping cost
-            cart_items = []
-
-            for product_id, quantity in cart.items():
-                product = get_object_or_404(Product, id=product_id)
-                item_total = product.price * quantity
-                subtotal += item_total
-                cart_items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'subtotal': item_total
-                })
+            cart_items, subtotal = get_cart_items(cart)
+            if prune_cart(request, cart, cart_items):
+                return redirect('view_cart')  # let them check the new total before ordering
 
             total_amount = subtotal + shipping_cost
 
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
-                first_name=request.POST.get('first_name'),
-                last_name=request.POST.get('last_name'),
-                email=request.POST.get('email'),
-                phone=request.POST.get('phone'),
-                address=request.POST.get('address'),
-                city=request.POST.get('city'),
-                pincode=request.POST.get('pincode'),
-                payment_method=request.POST.get('payment_method', 'COD'),
-                subtotal=subtotal,
-                shipping_cost=shipping_cost,
-                total_amount=total_amount,
-                status='pending'
-            )
+            with transaction.atomic():
+                reservations.purchase(request.user, cart)
 
-            # Create order items
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item['product'],
-                    quantity=item['quantity'],
-                    price=item['product'].price
+                # Create order
+                order = Order.objects.create(
+                    user=request.user,
+                    first_name=request.POST.get('first_name'),
+                    last_name=request.POST.get('last_name'),
+                    email=request.POST.get('email'),
+                    phone=request.POST.get('phone'),
+                    address=request.POST.get('address'),
+                    city=request.POST.get('city'),
+                    pincode=request.POST.get('pincode'),
+                    payment_method=request.POST.get('payment_method', 'COD'),
+                    subtotal=subtotal,
+                    shipping_cost=shipping_cost,
+                    total_amount=total_amount,
+                    status='pending'
                 )
 
+                # Create order items
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=item['product'],
+                        quantity=item['quantity'],
+                        price=item['product'].price
+                    )
+                    for item in cart_items
+                ])
+
             # Clear cart
             request.session['cart'] = {}
 
             # Redirect to order confirmation
             return redirect('order_confirmation', order_id=order.id)
 
+        except reservations.InsufficientStock:
+            messages.error(request, 'Sorry, some items in your cart are no longer available.')
+            return redirect('view_cart')
         except Exception as e:
             messages.error(request, f'Error placing order: {str(e)}')
             return redirect('checkout')
@@ -255,9 +326,36 @@ def order_confirmation(request, order_id):
 
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    # Older closed orders live in the archive tables; the history shows both
+    orders = archive.order_history(request.user)
     return render(request, 'paintingapp/order_history.html', {'orders': orders})
 
+PORTFOLIO_PAGE_SIZE = 24
+
+def portfolio_page(artist, cursor=None, limit=PORTFOLIO_PAGE_SIZE):
+    """One page of an artist's works, newest first, keyed on id"""
+    products = Product.objects.filter(artist=artist).select_related('artist').order_by('-id')
+    if cursor:
+        products = products.filter(id__lt=int(api.decode_cursor(cursor)[0]))
+    page = list(products[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = api.encode_cursor(page[-1].id)
+    return page, next_cursor
+
+class PortfolioMixin:
+    """Adds a cursor-paginated page of the artist's works as products and next_cursor"""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            context['products'], context['next_cursor'] = portfolio_page(self.object, self.request.GET.get('cursor'))
+        except (ValueError, UnicodeDecodeError):
+            raise Http404('Invalid cursor')
+        context['first_page'] = not self.request.GET.get('cursor')
+        return context
+
 class ArtistCreateView(LoginRequiredMixin, CreateView):
     model = Artist
     template_name = 'paintingapp/artist_form.html'
@@ -280,16 +378,11 @@ class ArtistCreateView(LoginRequiredMixin, CreateView):
         form.instance.user = self.request.user
         return super().form_valid(form)
 
-class ArtistUpdateView(LoginRequiredMixin, UpdateView):
+class ArtistUpdateView(LoginRequiredMixin, PortfolioMixin, UpdateView):
     model = Artist
     form_class = ProductForm
     template_name = 'paintingapp/artist_form.html'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['products'] = Product.objects.filter(artist=self.object)
-        return context
-
     def form_valid(self, form):
         product = form.save(commit=False)
         product.artist = self.object
@@ -315,21 +408,16 @@ def signup(request):
     return render(request, 'paintingapp/signup.html', {'form': form})
 
 class ArtistListView(ListView):
-    model = Artist
+    queryset = Artist.objects.select_related('stats').order_by('name', 'id')
     template_name = 'paintingapp/artist_list.html'
     context_object_name = 'artists'
     paginate_by = 12
 
-class ArtistDetailView(DetailView):
-    model = Artist
+class ArtistDetailView(PortfolioMixin, DetailView):
+    queryset = Artist.objects.select_related('stats')
     template_name = 'paintingapp/artist_detail.html'
     context_object_name = 'artist'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['products'] = Product.objects.filter(artist=self.object)
-        return context
-
 @login_required
 def add_painting(request, artist_id):
     artist = get_object_or_404(Artist, id=artist_id)
@@ -378,12 +466,26 @@ def search(request):
     page = request.GET.get('page', 1)
     
     # Base queryset
-    results = Product.objects.filter(
+    matches = Product.objects.select_related('artist').filter(
         Q(name__icontains=query) |
         Q(description__icontains=query) |
         Q(artist__name__icontains=query) |
         Q(category__name__icontains=query)
     )
+
+    # The colour filter narrows the matches themselves, so the facet counts respect it
+    try:
+        colour = palette.colour_filter(request.GET)
+    except ValueError:
+        colour = None
+    if colour is not None:
+        matches = palette.apply_colour(matches, colour)
+
+    # Facet counts for the text matches come from one cached GROUP BY; the filters live in the URL
+    filters = facets.parse_filters(request.GET)
+    groups = facets.facet_groups(matches, query, scope='' if colour is None else f'colour:{colour}')
+    facet_list = facets.build_facets(groups, filters, request.GET)
+    results = facets.apply_filters(matches, filters)
     
     # Apply sorting
     if sort_by == 'newest':
@@ -396,7 +498,7 @@ def search(request):
         results = results.order_by('price')
     
     # Pagination
-    paginator = Paginator(results, 12)  # Show 12 items per page
+    paginator = Paginator(results, 12)  # Show 12 items per page; counted fresh, the facet groups may be cached
     try:
         results = paginator.page(page)
     except PageNotAnInteger:
@@ -408,10 +510,22 @@ def search(request):
         'query': query,
         'results': results,
         'results_count': paginator.count,
+        'sort': sort_by,
+        'facets': facet_list,
+        'filtered': any(filters.values()) or colour is not None,
+        'colours': palette.colour_options(request.GET),
     }
     
     return render(request, 'paintingapp/search_results.html', context)
 
+def search_suggest(request):
+    """Autocomplete for the search box, answered from the in-memory prefix index"""
+    query = request.GET.get('q', '')
+    suggest_index.ensure_built()
+    response = JsonResponse({'query': query, 'suggestions': suggest_index.suggest(query)})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
 @login_required
 def update_cart(request, product_id):
     if request.method == 'POST':
@@ -421,17 +535,20 @@ def update_cart(request, product_id):
             
             cart = request.session.get('cart', {})
             
-            if quantity > 0 and quantity <= product.stock:
+            current = cart.get(str(product_id), 0)
+            if quantity > 0 and reservations.set_quantity(request.user, product_id, quantity, current):
                 cart[str(product_id)] = quantity
                 request.session['cart'] = cart
+                metrics.CART_MUTATIONS.labels('update', 'ok').inc()
                 return JsonResponse({
                     'success': True,
                     'message': f'Quantity updated for {product.name}'
                 })
             else:
+                metrics.CART_MUTATIONS.labels('update', 'refused').inc()
                 return JsonResponse({
                     'success': False,
-                    'message': f'Invalid quantity. Maximum available: {product.stock}'
+                    'message': f'Invalid quantity. Maximum available: {product.available + current}'
                 }, status=400)
         except Exception as e:
             return JsonResponse({
@@ -454,6 +571,8 @@ def remove_from_cart(request, product_id):
             if str(product_id) in cart:
                 del cart[str(product_id)]
                 request.session['cart'] = cart
+                reservations.release(request.user, product_id)
+                metrics.CART_MUTATIONS.labels('remove', 'ok').inc()
                 return JsonResponse({
                     'success': True,
                     'message': f'{product.name} removed from cart'
@@ -474,7 +593,55 @@ def remove_from_cart(request, product_id):
         'message': 'Invalid request method'
     }, status=400)
 
+def chatbot_search(query):
+    """Rank the catalog against a free-text question; one query per kind of result found"""
+    chat_index.ensure_ready()
+    hits = chat_index.search(query)
+    wanted = {}
+    for kind, obj_id, _ in hits:
+        wanted.setdefault(kind, []).append(obj_id)
+    found = {}
+    if 'product' in wanted:
+        for p in Product.objects.select_related('artist', 'category').filter(pk__in=wanted['product']):
+            found['product', p.pk] = {
+                'type': 'painting',
+                'name': p.name,
+                'artist': p.artist.name,
+                'price': p.price,
+                'image': p.image.url if p.image else None,
+                'url': reverse('product_detail', args=[p.id]),
+                'category': p.category.name,
+                'stock': p.stock
+            }
+    if 'artist' in wanted:
+        for a in Artist.objects.annotate(paintings_count=models.Count('products')).filter(pk__in=wanted['artist']):
+            found['artist', a.pk] = {
+                'type': 'artist',
+                'name': a.name,
+                'profession': a.profession,
+                'image': a.profile_picture.url if a.profile_picture else None,
+                'url': reverse('artist_detail', args=[a.id]),
+                'paintings_count': a.paintings_count
+            }
+    if 'category' in wanted:
+        categories = Category.objects.annotate(
+            products_count=models.Count('products'),
+            artists_count=models.Count('products__artist', distinct=True)
+        ).filter(pk__in=wanted['category'])
+        for c in categories:
+            found['category', c.pk] = {
+                'type': 'category',
+                'name': c.name,
+                'count': c.products_count,
+                'url': reverse('category_detail', args=[c.id]),
+                'artists_count': c.artists_count
+            }
+    # Rows deleted by another worker since the index last refreshed simply drop out
+    data = [found[kind, obj_id] for kind, obj_id, _ in hits if (kind, obj_id) in found]
+    return 'Here is what I found:', data
+
 @csrf_exempt
+@throttle('chatbot')
 def chatbot(request):
     if request.method == 'POST':
         query = request.POST.get('query', '').lower()
@@ -485,9 +652,16 @@ def chatbot(request):
         }
         
         try:
+            low, high, _ = parse_price(query)
+            # A price limit ("landscapes under 2000") needs ranked, filtered results rather than a canned list
+            if low is not None or high is not None:
+                intent = 'search'
+                response['message'], response['data'] = chatbot_search(query)
+
             # Check for common painting-related keywords
-            if any(word in query for word in ['paintings', 'artworks', 'art pieces']):
-                paintings = Product.objects.all()[:5]  # Get 5 recent paintings
+            elif any(word in query for word in ['paintings', 'artworks', 'art pieces']):
+                intent = 'paintings'
+                paintings = Product.objects.select_related('artist', 'category')[:5]  # Get 5 recent paintings
                 response['message'] = 'Here are some of our recent paintings:'
                 response['data'] = [{
                     'type': 'painting',
@@ -501,7 +675,8 @@ def chatbot(request):
                 } for p in paintings]
                 
             elif 'artist' in query:
-                artists = Artist.objects.all()[:5]  # Get 5 artists
+                intent = 'artists'
+                artists = Artist.objects.annotate(paintings_count=models.Count('products'))[:5]  # Get 5 artists
                 response['message'] = 'Here are some of our talented artists:'
                 response['data'] = [{
                     'type': 'artist',
@@ -509,25 +684,33 @@ def chatbot(request):
                     'profession': a.profession,
                     'image': a.profile_picture.url if a.profile_picture else None,
                     'url': reverse('artist_detail', args=[a.id]),
-                    'paintings_count': a.products.count()
+                    'paintings_count': a.paintings_count
                 } for a in artists]
                 
             elif 'category' in query or 'type' in query:
-                categories = Category.objects.all()
+                intent = 'categories'
+                categories = Category.objects.annotate(
+                    products_count=models.Count('products'),
+                    artists_count=models.Count('products__artist', distinct=True)
+                )
                 response['message'] = 'We have paintings in these categories:'
                 response['data'] = [{
                     'type': 'category',
                     'name': c.name,
-                    'count': c.products.count(),
+                    'count': c.products_count,
                     'url': reverse('category_detail', args=[c.id]),
-                    'artists_count': len(set(c.products.values_list('artist', flat=True)))
+                    'artists_count': c.artists_count
                 } for c in categories]
                 
             elif 'price' in query or 'cost' in query:
+                intent = 'prices'
                 # Get price range information
-                min_price = Product.objects.aggregate(min_price=models.Min('price'))['min_price']
-                max_price = Product.objects.aggregate(max_price=models.Max('price'))['max_price']
-                avg_price = Product.objects.aggregate(avg_price=models.Avg('price'))['avg_price']
+                prices = Product.objects.aggregate(
+                    min_price=models.Min('price'),
+                    max_price=models.Max('price'),
+                    avg_price=models.Avg('price')
+                )
+                min_price, max_price, avg_price = prices['min_price'], prices['max_price'], prices['avg_price']
                 
                 response['message'] = f'Our paintings range from ₹{min_price} to ₹{max_price}.'
                 response['data'] = [{
@@ -538,8 +721,14 @@ def chatbot(request):
                 }]
                 
             else:
+                intent = 'search'
+                response['message'], response['data'] = chatbot_search(query)
+
+            if not response['data'] and intent == 'search':
+                intent = 'unknown'
                 response['message'] = 'I can help you with information about paintings, artists, categories, and prices. What would you like to know?'
             
+            metrics.CHATBOT_INTENTS.labels(intent).inc()
             return JsonResponse(response)
             
         except Exception as e:
@@ -551,6 +740,7 @@ def chatbot(request):
     return render(request, 'paintingapp/chatbot.html')
 
 @csrf_exempt
+@throttle('submit_drawing')
 @require_POST
 def submit_drawing(request):
     try:
@@ -560,17 +750,28 @@ def submit_drawing(request):
         
         if not all([name, description, image]):
             return JsonResponse({'error': 'All fields are required'}, status=400)
-            
+
+        try:
+            image_hash = image_dhash(image)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return JsonResponse({'error': 'Please upload a valid image file'}, status=400)
+        image.seek(0)
+
+        # Near-duplicates are saved but held back from the gallery for a moderator
+        duplicate_id = submission_hashes.find_duplicate(image_hash)
+
         # Create a new UserSubmission instance
         submission = UserSubmission(
             name=name,
             description=description,
             artist=request.user if request.user.is_authenticated else None,
             image=image,
-            is_approved=True  # Set to True for testing
+            image_hash=to_signed(image_hash),
+            is_approved=duplicate_id is None  # Set to True for testing
         )
         
         submission.save()
+        metrics.UPLOAD_BYTES.labels('submit_drawing').inc(image.size)
         
         return JsonResponse({
             'success': True,
@@ -581,24 +782,85 @@ def submit_drawing(request):
                 'image_url': submission.image.url if submission.image else None,
                 'artist': submission.artist.username if submission.artist else 'Anonymous',
                 'created_at': submission.created_at.strftime('%B %d, %Y')
-            }
+            },
+            'duplicate_of': duplicate_id
         })
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+SUBMISSIONS_PER_PAGE = 12
+
+def submission_page(cursor=None, limit=SUBMISSIONS_PER_PAGE):
+    """One page of approved submissions, newest first, keyed on (created_at, id)"""
+    submissions = (
+        UserSubmission.objects.filter(is_approved=True)
+        .select_related('artist')
+        .only('id', 'name', 'description', 'image', 'created_at', 'artist__username')
+        .order_by('-created_at', '-id')
+    )
+    if cursor:
+        created_at, last_id = api.decode_cursor(cursor)
+        created_at = datetime.fromisoformat(created_at)
+        submissions = submissions.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=int(last_id))
+        )
+
+    page = list(submissions[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = api.encode_cursor(page[-1].created_at.isoformat(), page[-1].id)
+    return page, next_cursor
+
 def user_submissions(request):
-    submissions = UserSubmission.objects.filter(is_approved=True).order_by('-created_at')
+    submissions, next_cursor = submission_page()
     return render(request, 'paintingapp/user_submissions.html', {
-        'submissions': submissions
+        'submissions': submissions,
+        'next_cursor': next_cursor
     })
 
+def user_submissions_page(request):
+    try:
+        submissions, next_cursor = submission_page(request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    html = render_to_string('paintingapp/submission_cards.html', {'submissions': submissions}, request=request)
+    return JsonResponse({'html': html, 'next': next_cursor})
+
 def charity(request):
     return render(request, 'paintingapp/charity.html')
 
 def customize(request):
     return render(request, 'paintingapp/customize.html')
 
+@require_POST
+def customize_preview(request):
+    image = request.FILES.get('image')
+    style = request.POST.get('style', '')
+    frame = request.POST.get('frame') or 'none'
+
+    if not image:
+        return JsonResponse({'success': False, 'error': 'Please upload an image'}, status=400)
+    if style not in previews.STYLES:
+        return JsonResponse({'success': False, 'error': 'Please select an art style'}, status=400)
+    if frame not in dict(CustomizedPainting.FRAME_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Please select a frame style'}, status=400)
+
+    try:
+        width = int(request.POST.get('width', 512))
+    except ValueError:
+        width = 512
+    # Snap to a few sizes so the cache is not fragmented by arbitrary widths
+    width = min(previews.PREVIEW_SIZES, key=lambda size: abs(size - width))
+
+    try:
+        preview = previews.preview_data_uri(image.read(), style, frame, width)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return JsonResponse({'success': False, 'error': 'Please upload a valid image file'}, status=400)
+
+    return JsonResponse({'success': True, 'preview': preview})
+
 @login_required
 def save_customized_painting(request):
     if request.method == 'POST':
@@ -645,6 +907,7 @@ def save_customized_painting(request):
                     image=image
                 )
                 customized_painting.save()
+                metrics.UPLOAD_BYTES.labels('save_customized_painting').inc(image.size)
 
                 # Return success response
                 return JsonResponse({
@@ -673,4 +936,52 @@ def customized_painting_detail(request, pk):
     painting = get_object_or_404(CustomizedPainting, id=pk, user=request.user)
     return render(request, 'paintingapp/customized_painting_detail.html', {
         'painting': painting
-    })
\ No newline at end of file
+    })
+
+def _streaming_feed(request, lines, content_type, filename=None):
+    if compression.negotiate(request, offered=('gzip',)):
+        response = StreamingHttpResponse(feeds.gzip_stream(lines), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(lines, content_type=content_type)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def export_catalog(request, fmt):
+    rows = feeds.catalog_rows()
+    if fmt == 'csv':
+        return _streaming_feed(request, feeds.csv_lines(rows), 'text/csv', 'products.csv')
+    if fmt == 'jsonl':
+        return _streaming_feed(request, feeds.jsonl_lines(rows), 'application/x-ndjson', 'products.jsonl')
+    raise Http404('Unknown export format')
+
+def sitemap_index(request):
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    return _streaming_feed(request, feeds.sitemap_index_lines(base_url), 'application/xml')
+
+def sitemap_section(request, section):
+    if not 1 <= section <= feeds.sitemap_section_count():
+        raise Http404('No such sitemap section')
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    return _streaming_feed(request, feeds.sitemap_section_lines(base_url, section), 'application/xml')
+
+def api_products(request):
+    return api.list_response(request, api.PRODUCTS)
+
+def api_artists(request):
+    return api.list_response(request, api.ARTISTS)
+
+def api_categories(request):
+    return api.list_response(request, api.CATEGORIES)
+
+@staff_member_required
+def perf_dashboard(request):
+    return render(request, 'paintingapp/perf.html', {'stats': request_stats.summary()})
+
+def metrics_endpoint(request):
+    if client_ip(request) not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    body, content_type = metrics.exposition()
+    return HttpResponse(body, content_type=content_type)